@@ -0,0 +1,309 @@
+import os
+import json
+import math
+import time
+import heapq
+import asyncio
+import hashlib
+import threading
+import contextvars
+
+import metrics
+
+# Admission control settings (overridable via env)
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true').lower() == 'true'
+ADMISSION_RATE = float(os.environ.get('ADMISSION_RATE', '1'))  # Requests per second per client (weight 1)
+ADMISSION_BURST = float(os.environ.get('ADMISSION_BURST', '10'))  # Bucket size per client (weight 1)
+ADMISSION_MAX_CONCURRENCY = int(os.environ.get('ADMISSION_MAX_CONCURRENCY', '4'))  # Match the Gemini quota
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', '64'))
+ADMISSION_MAX_QUEUE_PER_CLIENT = int(os.environ.get('ADMISSION_MAX_QUEUE_PER_CLIENT', '8'))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', '60'))
+ADMISSION_FAIR_QUEUING = os.environ.get('ADMISSION_FAIR_QUEUING', 'true').lower() == 'true'
+ADMISSION_PROXY_HOPS = int(os.environ.get('ADMISSION_PROXY_HOPS', '1'))  # Proxies appending X-Forwarded-For
+ADMISSION_MAX_CLIENTS = int(os.environ.get('ADMISSION_MAX_CLIENTS', '10000'))  # Tracked clients before pruning
+# JSON map of API key (sent as X-API-Key) -> weight; unknown keys are limited by IP
+ADMISSION_API_KEYS = json.loads(os.environ.get('ADMISSION_API_KEYS') or '{}')
+
+ADMISSION_REJECTED = metrics.Counter(
+    'admission_rejected_total', 'Generation requests turned away with 429 by reason', labelnames=('reason',)
+)
+ADMISSION_WAIT = metrics.Histogram(
+    'admission_queue_wait_seconds', 'Time generation requests waited for a concurrency slot'
+)
+
+_current_client = contextvars.ContextVar('admission_client', default=None)
+
+
+class RateLimitedError(Exception):
+    """Raised when a request is not admitted; retry_after is a hint in seconds."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Too many requests ({reason}), retry in {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def identify_client(headers, remote_addr, api_keys=None, proxy_hops=ADMISSION_PROXY_HOPS):
+    """
+    Returns (client_id, weight) for a request. A configured API key in
+    X-API-Key identifies the client and sets its weight; anyone else is
+    identified by IP: the address proxy_hops entries from the right of
+    X-Forwarded-For (the one our own proxy appended, which clients cannot
+    forge), or the socket address when there is no proxy.
+    """
+    api_keys = ADMISSION_API_KEYS if api_keys is None else api_keys
+    key = headers.get('X-API-Key')
+    if key and key in api_keys:
+        return 'key:' + hashlib.sha256(key.encode('utf-8')).hexdigest()[:12], float(api_keys[key])
+
+    address = remote_addr
+    if proxy_hops > 0:
+        forwarded = [part.strip() for part in headers.get('X-Forwarded-For', '').split(',') if part.strip()]
+        if len(forwarded) >= proxy_hops:
+            address = forwarded[-proxy_hops]
+    return f"ip:{address or 'unknown'}", 1.0
+
+
+def set_current_client(client):
+    """Remembers the (client_id, weight) of the request being handled."""
+    _current_client.set(client)
+
+
+def current_client():
+    """Returns the (client_id, weight) set for the current request, or None."""
+    return _current_client.get()
+
+
+class _Waiter:
+    __slots__ = ('client', 'start_tag', 'notify', 'granted', 'cancelled')
+
+    def __init__(self, client, start_tag, notify):
+        self.client = client
+        self.start_tag = start_tag
+        self.notify = notify  # Called (under the controller lock) when the slot is granted
+        self.granted = False
+        self.cancelled = False
+
+
+class AdmissionController:
+    """
+    Admission control for the generation routes.
+
+    Each client (API key or IP) has a token bucket refilled at rate x weight
+    per second; a request without a token is turned away at once. Admitted
+    requests then need one of max_concurrency slots, matched to the upstream
+    Gemini quota. When all slots are busy they wait in a weighted fair queue
+    (start-time fair queuing): a request's tag is max(virtual time, the
+    client's previous finish tag), and each request advances its client's
+    finish tag by 1 / weight, so the next free slot goes to the client that
+    has been served least, not to whoever queued first. A client flooding
+    the queue only competes with its own backlog. Queues are bounded in
+    total and per client, and waits are bounded by queue_timeout; all
+    rejections raise RateLimitedError with a Retry-After hint.
+    """
+
+    def __init__(self, rate=ADMISSION_RATE, burst=ADMISSION_BURST, max_concurrency=ADMISSION_MAX_CONCURRENCY,
+                 max_queue=ADMISSION_MAX_QUEUE, max_queue_per_client=ADMISSION_MAX_QUEUE_PER_CLIENT,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT, fair=ADMISSION_FAIR_QUEUING,
+                 max_clients=ADMISSION_MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue_per_client
+        self.queue_timeout = queue_timeout
+        self.fair = fair
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._buckets = {}  # client id -> [tokens, last refill time]
+        self._finish_tags = {}  # client id -> finish tag of its latest request
+        self._queued = {}  # client id -> waiting requests
+        self._heap = []  # (start tag, sequence, waiter)
+        self._sequence = 0
+        self._virtual_time = 0.0
+        self._active = 0
+        self._waiting = 0
+        self._hold_time = 10.0  # Seconds a slot is held, refined as slots are released
+        self._stats = {
+            'admitted': 0,
+            'queued': 0,
+            'rate_limited': 0,
+            'queue_full': 0,
+            'queue_timeouts': 0,
+        }
+
+    # Token buckets
+
+    def check_rate(self, client_id, weight=1.0, cost=1.0):
+        """Takes cost tokens from the client's bucket, or raises RateLimitedError."""
+        rate = self.rate * weight
+        capacity = max(self.burst * weight, cost)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client_id)
+            if bucket is None:
+                if len(self._buckets) >= self.max_clients:
+                    self._prune_buckets_locked(now)
+                bucket = self._buckets[client_id] = [capacity, now]
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return
+            self._stats['rate_limited'] += 1
+            retry_after = max(1, math.ceil((cost - bucket[0]) / rate)) if rate > 0 else 60
+        ADMISSION_REJECTED.inc(1, 'rate_limited')
+        raise RateLimitedError('rate_limited', retry_after)
+
+    def _prune_buckets_locked(self, now):
+        # Buckets that have refilled completely carry no state worth keeping
+        full_after = self.burst / self.rate if self.rate > 0 else float('inf')
+        for client_id in [client_id for client_id, (_, updated) in self._buckets.items()
+                          if now - updated >= full_after]:
+            del self._buckets[client_id]
+
+    # Concurrency slots
+
+    def _retry_after_locked(self):
+        waves = self._waiting / max(self.max_concurrency, 1) + 1
+        return max(1, math.ceil(waves * self._hold_time))
+
+    def _charge_locked(self, client_id, start_tag, weight):
+        # Only admitted or queued requests move the client's virtual finish time;
+        # a rejected one must not push its later requests back
+        if self.fair:
+            self._finish_tags[client_id] = start_tag + 1.0 / max(weight, 1e-6)
+
+    def _enqueue(self, client_id, weight, notify):
+        """Takes a free slot (returns None) or queues a waiter (returns it); raises if the queue is full."""
+        with self._lock:
+            if self.fair:
+                start_tag = max(self._virtual_time, self._finish_tags.get(client_id, 0.0))
+            else:
+                start_tag = float(self._sequence)  # First come, first served
+            if self._active < self.max_concurrency and not self._waiting:
+                self._charge_locked(client_id, start_tag, weight)
+                self._active += 1
+                self._virtual_time = max(self._virtual_time, start_tag)
+                self._stats['admitted'] += 1
+                return None
+
+            queued = self._queued.get(client_id, 0)
+            if self._waiting >= self.max_queue or queued >= self.max_queue_per_client:
+                self._stats['queue_full'] += 1
+                retry_after = self._retry_after_locked()
+            else:
+                self._charge_locked(client_id, start_tag, weight)
+                waiter = _Waiter(client_id, start_tag, notify)
+                self._sequence += 1
+                heapq.heappush(self._heap, (start_tag, self._sequence, waiter))
+                self._queued[client_id] = queued + 1
+                self._waiting += 1
+                self._stats['queued'] += 1
+                return waiter
+        ADMISSION_REJECTED.inc(1, 'queue_full')
+        raise RateLimitedError('queue_full', retry_after)
+
+    def _abandon(self, waiter):
+        """Gives up on a waiter after its timeout; returns True if it was granted in the meantime."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True  # Left in the heap, skipped when popped
+            self._dequeued_locked(waiter)
+            self._stats['queue_timeouts'] += 1
+            retry_after = self._retry_after_locked()
+        ADMISSION_REJECTED.inc(1, 'queue_timeout')
+        raise RateLimitedError('queue_timeout', retry_after)
+
+    def acquire(self, client_id, weight=1.0, timeout=None):
+        """
+        Waits for a concurrency slot in weighted fair order and returns the
+        time it was granted (pass it to release()).
+
+        Raises:
+            RateLimitedError: If the queue is full or the wait times out.
+        """
+        requested = time.monotonic()
+        event = threading.Event()
+        waiter = self._enqueue(client_id, weight, event.set)
+        if waiter is not None and not event.wait(self.queue_timeout if timeout is None else timeout):
+            self._abandon(waiter)
+        granted = time.monotonic()
+        ADMISSION_WAIT.observe(granted - requested)
+        return granted
+
+    async def acquire_async(self, client_id, weight=1.0, timeout=None):
+        """acquire() for the event loop: waits on a future instead of blocking a thread."""
+        loop = asyncio.get_running_loop()
+        requested = time.monotonic()
+        future = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._enqueue(client_id, weight, notify)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(future), self.queue_timeout if timeout is None else timeout)
+            except asyncio.TimeoutError:
+                self._abandon(waiter)
+            except asyncio.CancelledError:
+                # Client went away: give the slot back if it was granted meanwhile
+                try:
+                    if self._abandon(waiter):
+                        self.release()
+                except RateLimitedError:
+                    pass
+                raise
+        granted = time.monotonic()
+        ADMISSION_WAIT.observe(granted - requested)
+        return granted
+
+    def _dequeued_locked(self, waiter):
+        self._waiting -= 1
+        remaining = self._queued[waiter.client] - 1
+        if remaining:
+            self._queued[waiter.client] = remaining
+        else:
+            del self._queued[waiter.client]
+
+    def release(self, granted_at=None):
+        """Frees a slot taken by acquire() and hands it to the next fair-queued request."""
+        with self._lock:
+            if granted_at is not None:
+                self._hold_time = 0.9 * self._hold_time + 0.1 * (time.monotonic() - granted_at)
+            self._active -= 1
+            while self._heap and self._active < self.max_concurrency:
+                start_tag, _, waiter = heapq.heappop(self._heap)
+                if waiter.cancelled:
+                    continue
+                self._dequeued_locked(waiter)
+                self._virtual_time = max(self._virtual_time, start_tag)
+                waiter.granted = True
+                self._active += 1
+                self._stats['admitted'] += 1
+                waiter.notify()
+            if not self._waiting and len(self._finish_tags) > self.max_clients:
+                # Tags at or below the virtual time no longer give any client a head start
+                self._finish_tags = {client_id: tag for client_id, tag in self._finish_tags.items()
+                                     if tag > self._virtual_time}
+
+    def admit(self, client_id, weight=1.0):
+        """Rate check plus a fair-queued slot; returns the value to pass to release()."""
+        self.check_rate(client_id, weight)
+        return self.acquire(client_id, weight)
+
+    def get_stats(self):
+        """Returns admission counters and the current slot and queue usage."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'active': self._active,
+                'waiting': self._waiting,
+                'max_concurrency': self.max_concurrency,
+                'clients_waiting': len(self._queued),
+                'tracked_clients': len(self._buckets),
+                'avg_hold_seconds': round(self._hold_time, 3),
+            })
+        return stats
@@ -1,12 +1,16 @@
 import os
-import io
 from datetime import datetime
 import re
 import json
-from flask import Flask, render_template, jsonify, request, send_from_directory
+import time
+import hashlib
+import contextvars
+from urllib.parse import quote
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, Response, g, render_template, jsonify, request, send_from_directory, stream_with_context, url_for
 from dotenv import load_dotenv
 
-from google import genai
 from google.ai import generativelanguage_v1beta as gen_language
 from google.genai import types
 import base64
@@ -16,6 +20,23 @@ from firebase_admin import credentials, initialize_app, storage, firestore
 import firebase_admin
 from google.cloud import secretmanager
 
+import gemini_client
+from image_cache import ImageCache, make_key, content_hash
+from singleflight import SingleFlight
+from resilience import AttemptTimeoutError
+from negative_cache import NegativeCache, SAFETY_BLOCKED, EMPTY_RESPONSE, TRANSIENT_ERROR
+from jobs import JobQueue, QueueFullError, TERMINAL_STATES
+from image_variants import submit_variants
+from storage_uploader import StorageUploader
+from user_images_cache import shared_cache as user_images_cache
+from prompts_cache import PromptsCache, PROMPTS_CACHE_ENABLED, FIRESTORE_QUERY_LATENCY, FIRESTORE_DOCUMENTS_READ
+from admission import (AdmissionController, RateLimitedError, ADMISSION_ENABLED, identify_client,
+                       set_current_client, current_client)
+from history_index import (HistoryIndex, HISTORY_INDEX_ENABLED, HISTORY_SEARCH_LIMIT, HISTORY_SEARCH_MAX_LIMIT,
+                           SEARCH_MODES, GENERATED)
+import metrics
+import startup
+
 # Load environment variables
 load_dotenv()
 api_key = os.environ.get('GEMINI_API_KEY')
@@ -24,6 +45,65 @@ api_key = os.environ.get('GEMINI_API_KEY')
 app = Flask(__name__)
 firebase_bucket = None  # Global variable for Firebase bucket
 db = None  # Global variable for Firestore database
+image_cache = ImageCache()  # Prompt -> image cache shared by the generation routes
+negative_cache = NegativeCache()  # Recent failures (safety blocks, empty responses) per prompt
+generation_flight = SingleFlight('generation')  # Coalesces identical in-flight prompts
+upload_flight = SingleFlight('upload')  # Coalesces uploads of identical image bytes
+storage_uploader = StorageUploader()  # Single-request, retrying uploads to Firebase Storage
+history_index = HistoryIndex()  # Local SQLite index of past generations for /search_history
+admission = AdmissionController()  # Per-client rate limits and fair-queued generation slots
+
+# Generation endpoints checked against the per-client rate limit; the first
+# two also hold a fair-queued concurrency slot for the whole request, batch
+# items and jobs take one per generation where they run
+ADMISSION_SLOT_ENDPOINTS = ('generate_and_upload', 'generate_image_route')
+ADMISSION_RATE_LIMITED_ENDPOINTS = ADMISSION_SLOT_ENDPOINTS + ('generate_batch', 'submit_job')
+
+# Shared secret for POST /history/backfill (unchecked if unset)
+HISTORY_BACKFILL_TOKEN = os.environ.get('HISTORY_BACKFILL_TOKEN')
+
+# Return the (deterministic) public URL without waiting for the upload to finish
+STORAGE_ASYNC_UPLOADS = os.environ.get('STORAGE_ASYNC_UPLOADS', 'false').lower() == 'true'
+
+# Gemini configuration
+GEMINI_MODEL = "gemini-2.0-flash-exp-image-generation"
+
+# Candidate finish reasons that mean the output was blocked
+SAFETY_FINISH_REASONS = ('SAFETY', 'PROHIBITED_CONTENT', 'BLOCKLIST', 'SPII', 'IMAGE_SAFETY', 'IMAGE_PROHIBITED_CONTENT')
+
+# Response modes for the generation routes: base64 JSON (default), URL-only JSON or raw PNG
+RESPONSE_MODES = ('base64', 'url', 'binary')
+
+# Cache-Control for content-addressed responses: fingerprinted static files and /images/<sha256>.png
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+CONTENT_HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Image bytes base64-encoded per chunk of a streamed JSON response (64 KiB of base64; a multiple of 3 so chunks join up)
+IMAGE_STREAM_CHUNK_BYTES = max(3, int(os.environ.get('IMAGE_STREAM_CHUNK_BYTES', str(3 * 16 * 1024))) // 3 * 3)
+
+# Seconds to wait for variant encoding before returning without variants
+IMAGE_VARIANT_TIMEOUT = float(os.environ.get('IMAGE_VARIANT_TIMEOUT', '30'))
+variant_upload_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='variant-upload')
+
+# Multi-image requests ({"candidates": K}): K concurrent Gemini calls and uploads per request
+GENERATION_MAX_CANDIDATES = int(os.environ.get('GENERATION_MAX_CANDIDATES', '4'))
+INVALID_CANDIDATES_MESSAGE = f'candidates must be an integer from 1 to {GENERATION_MAX_CANDIDATES}.'
+candidate_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('GENERATION_CANDIDATE_WORKERS', '16')), thread_name_prefix='candidate'
+)
+
+# Metrics exposed on /metrics (stages also appear in the Server-Timing header)
+REQUEST_LATENCY = metrics.Histogram(
+    'http_request_duration_seconds', 'Request latency until the response headers, by route',
+    labelnames=('route', 'method', 'status'),
+)
+GEMINI_LATENCY = metrics.Histogram('gemini_call_duration_seconds', 'Gemini generate_content latency, including retries')
+IMAGE_BYTES = metrics.Histogram('image_bytes', 'Size of generated images in bytes', buckets=metrics.BYTES_BUCKETS)
+BASE64_LATENCY = metrics.Histogram('base64_encode_duration_seconds', 'Time to base64-encode an image for a JSON response')
+
+# Batch generation limits
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '100'))
+BATCH_MAX_CONCURRENCY = int(os.environ.get('BATCH_MAX_CONCURRENCY', '8'))
 
 # Firebase configuration
 PROJECT_ID = "image-gen-34b6b"
@@ -33,150 +113,828 @@ SECRET_VERSION_ID = "latest"
 def access_secret_version(project_id, secret_id, version_id):
     """Access the secret version and return its payload."""
     try:
-        client = secretmanager.SecretManagerServiceClient()
         name = f"projects/{project_id}/secrets/{secret_id}/versions/{version_id}"
-        response = client.access_secret_version(request={"name": name})
+        # Closed right away: this may run in the gunicorn master, and no gRPC channel may outlive the fork
+        with secretmanager.SecretManagerServiceClient() as client:
+            response = client.access_secret_version(request={"name": name})
         return response.payload.data.decode('UTF-8')
     except Exception as e:
         print(f"Error accessing Secret Manager secret '{secret_id}': {e}")
         return None
 
-def initialize_firebase():
+def _firebase_options():
+    return {'storageBucket': os.environ.get('FIREBASE_STORAGE_BUCKET') or 'image-gen-34b6b.appspot.com'}
+
+
+def resolve_firebase_credentials():
     """
-    Initializes the Firebase Admin SDK and gets the storage bucket and Firestore database.
+    Resolves the Firebase Admin credentials, trying in order: base64 credentials
+    from the environment, Google Secret Manager, a local service_account_key.json
+    and finally application default credentials.
+    Returns (source, cred); cred is None for application default credentials.
     """
-    global firebase_bucket, db
-    
-    if not firebase_admin._apps:
-        print("Attempting to initialize Firebase Admin SDK...")
-        credentials_json_string = None
-        cred = None
-
-        # Step 1: Try to use base64 credentials from Render env
-        if "FIREBASE_CREDS_B64" in os.environ:
-            print("🔐 Using base64 credentials from FIREBASE_CREDS_B64...")
+    # Step 1: Try to use base64 credentials from Render env
+    if "FIREBASE_CREDS_B64" in os.environ:
+        print("🔐 Using base64 credentials from FIREBASE_CREDS_B64...")
+        with startup.phase('credentials_b64'):
             try:
                 decoded = base64.b64decode(os.environ["FIREBASE_CREDS_B64"])
-                credentials_dict = json.loads(decoded)
-                cred = credentials.Certificate(credentials_dict)
-                firebase_app = initialize_app(
-                    cred,
-                    {'storageBucket': os.environ.get('FIREBASE_STORAGE_BUCKET') or 'image-gen-34b6b.appspot.com'},
-                )
-                print("✅ Firebase initialized using FIREBASE_CREDS_B64")
+                return 'FIREBASE_CREDS_B64', credentials.Certificate(json.loads(decoded))
             except Exception as e:
                 print(f"❌ Failed to decode FIREBASE_CREDS_B64: {e}")
-                cred = None
 
-        # Step 2: Try Secret Manager (if base64 not used or failed)
-        elif PROJECT_ID and SECRET_ID and SECRET_VERSION_ID:
-            print("🔐 Attempting Firebase init using Google Secret Manager...")
+    # Step 2: Try Secret Manager (if base64 not used)
+    elif PROJECT_ID and SECRET_ID and SECRET_VERSION_ID:
+        print("🔐 Attempting Firebase init using Google Secret Manager...")
+        with startup.phase('credentials_secret_manager'):
             credentials_json_string = access_secret_version(PROJECT_ID, SECRET_ID, SECRET_VERSION_ID)
             if credentials_json_string:
                 try:
-                    cred = credentials.Certificate(json.loads(credentials_json_string))
-                    firebase_app = initialize_app(
-                        cred,
-                        {'storageBucket': os.environ.get('FIREBASE_STORAGE_BUCKET') or 'image-gen-34b6b.appspot.com'},
-                    )
-                    print("✅ Firebase initialized using Secret Manager credentials.")
+                    return 'Secret Manager', credentials.Certificate(json.loads(credentials_json_string))
                 except Exception as e:
-                    print(f"❌ Failed to init Firebase with Secret Manager: {str(e)}")
-        
-        # Step 3: Fallback to local file
-        if cred is None:
-            print("⚠️ Falling back to local service_account_key.json...")
-            try:
-                cred = credentials.Certificate("service_account_key.json")
-                firebase_app = initialize_app(
-                    cred,
-                    {'storageBucket': os.environ.get('FIREBASE_STORAGE_BUCKET') or 'image-gen-34b6b.appspot.com'},
-                )
-                print("✅ Firebase initialized using local service_account_key.json")
-            except Exception as e_file:
-                print(f"❌ Failed to use service_account_key.json: {str(e_file)}")
-                print("Attempting to initialize Firebase with application default credentials...")
-                try:
-                    firebase_app = initialize_app({
-                        'storageBucket': os.environ.get('FIREBASE_STORAGE_BUCKET') or 'image-gen-34b6b.appspot.com'
-                    })
-                    print("✅ Firebase initialized using application default credentials.")
-                except Exception as e_default:
-                    print(f"❌ Firebase initialization failed completely: {str(e_default)}")
-                    return
-
-        # Initialize storage bucket
-        try:
-            firebase_bucket = storage.bucket(app=firebase_admin.get_app())
-            print("✅ Connected to Firebase Storage")
-        except Exception as e:
-            print(f"❌ Error getting Firebase bucket: {e}")
+                    print(f"❌ Failed to load Secret Manager credentials: {str(e)}")
 
-        # Initialize Firestore database
+    # Step 3: Fallback to local file
+    print("⚠️ Falling back to local service_account_key.json...")
+    with startup.phase('credentials_key_file'):
         try:
-            db = firestore.client(database_id="prompts-saved")
-            print("✅ Connected to Firestore database")
-        except Exception as e:
-            print(f"❌ Error connecting to Firestore: {str(e)}")
-            print("Firestore client could not be created.")
+            return 'service_account_key.json', credentials.Certificate("service_account_key.json")
+        except Exception as e_file:
+            print(f"❌ Failed to use service_account_key.json: {str(e_file)}")
+            print("Attempting to initialize Firebase with application default credentials...")
+            return 'application default credentials', None
+
+
+def load_firebase_credentials():
+    """Resolves the credentials once; with gunicorn's preload_app they are inherited by every worker."""
+    global firebase_credentials
+    if os.environ.get('FIREBASE_DISABLED', '').lower() == 'true' or firebase_admin._apps:
+        return
+    firebase_credentials = resolve_firebase_credentials()
+
+
+def initialize_firebase():
+    """
+    Initializes the Firebase Admin SDK and gets the storage bucket and Firestore database.
+    The Storage and Firestore clients are built in parallel. Runs in the
+    background at startup (see firebase_init); routes that need either
+    client call wait_for_firebase() first.
+    """
+    global firebase_bucket, db
+
+    if os.environ.get('FIREBASE_DISABLED', '').lower() == 'true':
+        print("ℹ️ Firebase disabled via FIREBASE_DISABLED; storage and prompts are unavailable.")
+        return
+
+    if not firebase_admin._apps:
+        print("Attempting to initialize Firebase Admin SDK...")
+        # No time limit: this already runs off the request path, and giving up
+        # would mark firebase_init done and leave this worker without clients
+        firebase_credentials_init.wait(timeout=None)
+        if firebase_credentials is None:
+            print("❌ Firebase credentials could not be resolved.")
+            return
+        source, cred = firebase_credentials
+        with startup.phase('firebase_app'):
+            try:
+                initialize_app(cred, _firebase_options())
+                print(f"✅ Firebase initialized using {source}")
+            except Exception as e:
+                print(f"❌ Firebase initialization failed completely: {str(e)}")
+                return
     else:
         print("ℹ️ Firebase already initialized.")
-        try:
-            firebase_bucket = storage.bucket(app=firebase_admin.get_app())
-            db = firestore.client(database_id="prompts-saved")
-            print("✅ Connected to existing Firebase services")
-        except Exception as e:
-            print(f"❌ Error accessing existing Firebase services: {e}")
 
+    def connect_storage():
+        with startup.phase('storage_client'):
+            return storage.bucket(app=firebase_admin.get_app())
+
+    def connect_firestore():
+        with startup.phase('firestore_client'):
+            return firestore.client(database_id="prompts-saved")
+
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix='firebase-init') as pool:
+        bucket_future = pool.submit(connect_storage)
+        db_future = pool.submit(connect_firestore)
+
+    # Initialize storage bucket (unless one was already provided, e.g. by a benchmark)
+    try:
+        bucket = bucket_future.result()
+        if firebase_bucket is None:
+            firebase_bucket = bucket
+        print("✅ Connected to Firebase Storage")
+    except Exception as e:
+        print(f"❌ Error getting Firebase bucket: {e}")
+
+    # Initialize Firestore database
+    try:
+        client = db_future.result()
+        if db is None:
+            db = client
+        print("✅ Connected to Firestore database")
+    except Exception as e:
+        print(f"❌ Error connecting to Firestore: {str(e)}")
+        print("Firestore client could not be created.")
 
-def gen_image(prompt: str):
+
+firebase_credentials = None  # (source, cred) resolved by firebase_credentials_init
+firebase_credentials_init = startup.BackgroundInit('firebase_credentials', load_firebase_credentials)
+firebase_init = startup.BackgroundInit('firebase', initialize_firebase, per_process=True)  # gRPC: never across fork
+
+
+def wait_for_firebase(timeout=startup.STARTUP_INIT_WAIT):
+    """Blocks until the background Firebase initialization has finished, or the timeout passes."""
+    if not firebase_init.wait(timeout):
+        print(f"Firebase still initializing after {timeout}s; continuing without it.")
+
+
+def generation_failure_kind(response):
+    """Classifies a response that carried no image as SAFETY_BLOCKED or EMPTY_RESPONSE."""
+    feedback = getattr(response, 'prompt_feedback', None)
+    if feedback is not None and feedback.block_reason:
+        return SAFETY_BLOCKED
+    if response.candidates:
+        candidate = response.candidates[0]
+        finish_reason = getattr(candidate.finish_reason, 'name', candidate.finish_reason)
+        if finish_reason in SAFETY_FINISH_REASONS:
+            return SAFETY_BLOCKED
+        if any(r.blocked for r in candidate.safety_ratings or []):
+            return SAFETY_BLOCKED
+    return EMPTY_RESPONSE
+
+
+def extract_generation_parts(response):
+    """
+    Collects the parts of a generate_content response.
+    Returns (images, text_response): every inline image of every candidate,
+    in order, and the concatenated text parts of the first candidate.
+    """
+    images = []
+    text_response = ""
+
+    for index, candidate in enumerate(response.candidates or []):
+        if not candidate.content or not candidate.content.parts:
+            continue
+        for part in candidate.content.parts:
+            if part.text is not None:
+                if index == 0:
+                    text_response += part.text
+            elif part.inline_data is not None:
+                images.append(part.inline_data.data)
+    return images, text_response
+
+
+def parse_generation_response(response):
+    """
+    Extracts the image from a generate_content response.
+    Returns (image_data, text_response), or (None, error_message) when no
+    image came back.
+    """
+    images, text_response = extract_generation_parts(response)
+    image_data = images[-1] if images else None
+
+    if image_data is None:
+        error_message = "Image generation failed or returned no image."
+        if generation_failure_kind(response) == SAFETY_BLOCKED:
+            error_message += " (Reason: May have been blocked by safety filters)"
+        if text_response:
+            error_message += f" Text response: {text_response}"
+        return None, error_message
+
+    print("Image generated successfully (bytes received).")
+    if text_response:
+        print(f"Gemini Text Response: {text_response}")
+
+    return image_data, text_response
+
+
+def record_generation_result(cache_key, response):
+    """
+    Parses a generate_content response and caches the outcome: the image in
+    image_cache, or the failure class in negative_cache.
+    Returns (image_data, text_response) like parse_generation_response().
+    """
+    image_data, text_response = parse_generation_response(response)
+    if image_data is not None:
+        IMAGE_BYTES.observe(len(image_data))
+        image_cache.put(cache_key, image_data, text_response)
+        negative_cache.forget(cache_key)
+    else:
+        negative_cache.put(cache_key, generation_failure_kind(response), text_response)
+    return image_data, text_response
+
+
+def _call_gemini(prompt, config, cache_key):
+    """
+    Calls Gemini for a prompt through the resilience layer (deadlines,
+    retries, hedging, circuit breaker) and returns the raw response.
+    Transient failures are remembered in the negative cache.
+    """
+    client = gemini_client.get_client(api_key)
+
+    try:
+        with metrics.stage('gemini', GEMINI_LATENCY):
+            response = gemini_client.resilience.call(
+                client.models.generate_content,
+                model=GEMINI_MODEL,
+                contents=prompt,
+                config=config,
+                previous_failures=negative_cache.transient_failures(cache_key),
+            )
+    except Exception as e:
+        if isinstance(e, AttemptTimeoutError) or gemini_client.is_retryable_error(e):
+            negative_cache.put(cache_key, TRANSIENT_ERROR, str(e))
+        raise
+    return response
+
+
+def _generate_candidate(prompt, config, cache_key):
+    """
+    Calls Gemini for a prompt and caches the result (see _call_gemini()).
+    Returns every image of the response: (images, text_response). Used by
+    gen_image() and gen_candidate() under the same single-flight key, so a
+    single-image request and the first candidate of a multi-image request
+    for the same prompt share one call.
+    """
+    response = _call_gemini(prompt, config, cache_key)
+    image_data, text_response = record_generation_result(cache_key, response)
+    if image_data is None:
+        return [], text_response
+    return extract_generation_parts(response)[0], text_response
+
+
+def gen_image(prompt: str, use_cache: bool = True):
     """
     Generates an image using the Gemini API based on a text prompt.
     Returns image data (bytes) and text response.
+    Results are cached by normalized prompt, model and config; pass
+    use_cache=False to force a fresh generation (the result is still cached).
+    Recent safety blocks and empty responses for the same prompt are
+    answered from the negative cache without calling the model.
+    Concurrent calls for the same prompt share one Gemini request.
     """
     if not api_key:
         return None, "Error: GEMINI_API_KEY not set."
     if not prompt or not prompt.strip():
         return None, "Error: Image prompt is empty."
     try:
-        client = genai.Client(api_key=api_key)
+        config = types.GenerateContentConfig(response_modalities=['TEXT', 'IMAGE'])
+        cache_key = make_key(prompt, GEMINI_MODEL, config)
+        if use_cache:
+            with metrics.stage('cache'):
+                cached = image_cache.get(cache_key)
+            if cached is not None:
+                print("Image served from cache.")
+                return cached.image_data, cached.text_response
+            failed = negative_cache.get(cache_key)
+            if failed is not None:
+                print(f"Prompt failed recently ({failed.kind}); answering from the negative cache.")
+                return None, failed.message
 
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp-image-generation",
-            contents=prompt,
-            config=types.GenerateContentConfig(response_modalities=['TEXT', 'IMAGE']),
+        (images, text_response), shared = generation_flight.do(
+            cache_key, _generate_candidate, prompt, config, cache_key
         )
-        image_data = None
-        text_response = ""
+        if shared:
+            print("Joined an in-flight generation for the same prompt.")
+        return (images[-1] if images else None), text_response
 
-        if response.candidates and response.candidates[0].content and response.candidates[0].content.parts:
-            for part in response.candidates[0].content.parts:
-                if part.text is not None:
-                    text_response += part.text
-                elif part.inline_data is not None:
-                    image_data = part.inline_data.data
+    except Exception as e:
+        print(f"Error during image generation: {e}")
+        return None, f"Error during image generation: {e}"
+
+
+def run_concurrently(fn, args_list):
+    """
+    Calls fn(*args) for each tuple in args_list: the first on this thread, the
+    rest on candidate_executor (in a copy of this context, so their stages
+    still reach the request's Server-Timing header). Returns the results in order.
+    """
+    futures = [candidate_executor.submit(contextvars.copy_context().run, fn, *args) for args in args_list[1:]]
+    return [fn(*args_list[0])] + [future.result() for future in futures]
 
-        if image_data is None:
-            error_message = "Image generation failed or returned no image."
-            # Check for safety ratings.  This check was improved.
-            if response.candidates and hasattr(response.candidates[0], 'safety_ratings'):
-                safety_ratings = response.candidates[0].safety_ratings
-                blocked = any(r.blocked for r in safety_ratings)  # Simpler check
-                if blocked:
-                    error_message += " (Reason: May have been blocked by safety filters)"
-            if text_response:
-                error_message += f" Text response: {text_response}"
-            return None, error_message
-
-        print("Image generated successfully (bytes received).")
-        if text_response:
-            print(f"Gemini Text Response: {text_response}")
 
-        return image_data, text_response
+def candidate_cache_key(cache_key, index):
+    """Cache key of the index-th candidate; the first shares gen_image()'s key."""
+    return cache_key if index == 0 else f"{cache_key}-{index}"
 
+
+def gen_candidate(prompt, config, cache_key, use_cache=True):
+    """
+    One candidate of gen_images(), from the cache (one image) or one Gemini call.
+    Returns (images, text_response); images is empty on failure and
+    text_response then carries the error.
+    """
+    try:
+        if use_cache:
+            cached = image_cache.get(cache_key)
+            if cached is not None:
+                return [cached.image_data], cached.text_response
+            failed = negative_cache.get(cache_key)
+            if failed is not None:
+                return [], failed.message
+
+        # One admission slot per candidate, so ADMISSION_MAX_CONCURRENCY caps Gemini calls
+        with admission_slot(current_client()):
+            (images, text_response), _ = generation_flight.do(
+                cache_key, _generate_candidate, prompt, config, cache_key
+            )
+        return images, text_response
     except Exception as e:
         print(f"Error during image generation: {e}")
-        return None, f"Error during image generation: {e}"
+        return [], f"Error during image generation: {e}"
+
+
+def gen_images(prompt: str, count: int, use_cache: bool = True):
+    """
+    Generates `count` candidate images for a prompt with `count` concurrent
+    Gemini calls, so K images take about as long as one. Each candidate is
+    cached under its own key (candidate_cache_key()), so repeating a request
+    returns the same set.
+    Returns (images, text_response): every image of every candidate that
+    produced one, in candidate order, and the first of their text responses
+    (or the first error when no candidate produced an image).
+    """
+    if not api_key:
+        return [], "Error: GEMINI_API_KEY not set."
+    if not prompt or not prompt.strip():
+        return [], "Error: Image prompt is empty."
+    config = types.GenerateContentConfig(response_modalities=['TEXT', 'IMAGE'])
+    cache_key = make_key(prompt, GEMINI_MODEL, config)
+
+    outcomes = run_concurrently(gen_candidate, [
+        (prompt, config, candidate_cache_key(cache_key, index), use_cache) for index in range(count)
+    ])
+    images = [image for candidate_images, _ in outcomes for image in candidate_images]
+    texts = [text for candidate_images, text in outcomes if candidate_images]
+    return images, texts[0] if texts else outcomes[0][1]
+
+
+def find_uploaded_image(digest):
+    """
+    Looks up a blob previously uploaded for this content hash.
+    Returns its public URL if the blob is still in the bucket, otherwise None.
+    """
+    record = image_cache.get_upload(digest)
+    if not record or not firebase_bucket:
+        return None
+    try:
+        blob = firebase_bucket.get_blob(record['blob_name'])
+    except Exception as e:
+        print(f"Error checking existing blob '{record['blob_name']}': {e}")
+        return None
+    if blob is None or (blob.metadata or {}).get('content_sha256') != digest:
+        image_cache.forget_upload(digest)
+        return None
+    image_cache.count_upload_reuse()
+    return record['url']
+
+
+def _finish_async_upload(future, digest, filename, image_url):
+    """Records a background upload once it has landed in the bucket."""
+    error = future.exception()
+    if error is not None:
+        print(f"Error uploading '{filename}' in background: {error}")
+        return
+    image_cache.remember_upload(digest, filename, image_url)
+    user_images_cache().invalidate_path(filename)
+
+
+def _upload_new_image(image_data, filename, digest, content_type='image/png'):
+    """Uploads image bytes (public, with cache headers) to Firebase Storage and returns the public URL."""
+    metadata = {'content_sha256': digest}
+    if STORAGE_ASYNC_UPLOADS:
+        image_url, future = storage_uploader.upload_async(
+            firebase_bucket, image_data, filename, content_type, metadata
+        )
+        future.add_done_callback(lambda f: _finish_async_upload(f, digest, filename, image_url))
+        return image_url
+
+    image_url = storage_uploader.upload(firebase_bucket, image_data, filename, content_type, metadata)
+    image_cache.remember_upload(digest, filename, image_url)
+    # A filename under user_images/<uid>/ lands in that user's listing
+    user_images_cache().invalidate_path(filename)
+    return image_url
+
+
+def upload_image(image_data, filename, use_cache=True, content_type='image/png', digest=None):
+    """
+    Uploads image bytes to Firebase Storage, reusing an existing blob with the
+    same content hash when possible. Concurrent uploads of identical bytes
+    share one upload and all receive its URL.
+    Returns the public URL.
+    """
+    digest = digest or content_hash(image_data)
+    if use_cache:
+        image_url = find_uploaded_image(digest)
+        if image_url is not None:
+            print(f"Reusing existing upload for content hash {digest}")
+            return image_url
+
+    image_url, shared = upload_flight.do(digest, _upload_new_image, image_data, filename, digest, content_type)
+    if shared:
+        print(f"Joined an in-flight upload for content hash {digest}")
+    return image_url
+
+
+def upload_variants(variants_future, filename, original_size, original_url, use_cache=True):
+    """
+    Waits for the encoded variants of an uploaded image and uploads them in parallel.
+    Returns a map of variant name -> {url, bytes, content_type, ...}, always
+    including the original; variants that fail to encode or upload are left out.
+    """
+    variant_map = {
+        'original': {'url': original_url, 'bytes': original_size, 'content_type': 'image/png'}
+    }
+    try:
+        with metrics.stage('variants'):
+            variants = variants_future.result(timeout=IMAGE_VARIANT_TIMEOUT)
+    except Exception as e:
+        print(f"Error encoding image variants: {e}")
+        return variant_map
+
+    stem = filename.rsplit('.', 1)[0]
+    uploads = {
+        variant['name']: variant_upload_executor.submit(
+            upload_image, variant['data'], f"{stem}_{variant['name']}.{variant['extension']}",
+            use_cache, variant['content_type']
+        )
+        for variant in variants
+    }
+    for variant in variants:
+        try:
+            url = uploads[variant['name']].result()
+        except Exception as e:
+            print(f"Error uploading image variant '{variant['name']}': {e}")
+            continue
+        size = len(variant['data'])
+        variant_map[variant['name']] = {
+            'url': url,
+            'bytes': size,
+            'content_type': variant['content_type'],
+            'width': variant['width'],
+            'height': variant['height'],
+            'saved_bytes': original_size - size,
+        }
+        print(f"Variant '{variant['name']}': {size} bytes ({original_size - size} bytes saved)")
+    return variant_map
+
+
+def make_filename(prompt, base_filename=''):
+    """Builds a unique .png blob name from the requested base name or the prompt."""
+    base_filename = (base_filename or '').strip()
+    if not base_filename:
+        # Generate a filename based on prompt (first 20 chars) if none provided
+        base_filename = re.sub(r'[^\w\s-]', '', prompt[:20]).strip().replace(' ', '_').lower()
+
+    # Add timestamp for uniqueness
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    return f"{base_filename}_{timestamp}.png"
+
+
+def generate_and_upload_image(prompt, base_filename='', use_cache=True):
+    """
+    Generates an image for the prompt and uploads it to Firebase storage.
+    Returns (result, image_data): result is the response payload without any
+    image bytes, its 'status' is 'success', 'partial_success' (generated but
+    not uploaded) or 'error'; image_data is the raw PNG or None on error.
+    """
+    filename = make_filename(prompt, base_filename)
+
+    # Generate the image
+    image_data, text_response = gen_image(prompt, use_cache=use_cache)
+    if not image_data:
+        return {'status': 'error', 'message': text_response}, None
+
+    result, image_data = store_generated_image(image_data, text_response, filename, use_cache=use_cache)
+    record_history(prompt, filename, image_data, result)
+    return result, image_data
+
+
+def generate_and_upload_images(prompt, base_filename='', count=1, use_cache=True):
+    """
+    Generates `count` candidate images for the prompt (gen_images()) and
+    uploads all of them in parallel, as <name>_1.png, <name>_2.png, ...
+    Returns (result, images): result carries an 'images' list with one entry
+    per image (imageUrl, content_hash, variants and its own status), images
+    the raw PNGs in the same order (empty on error).
+    """
+    images, text_response = gen_images(prompt, count, use_cache=use_cache)
+    if not images:
+        return {'status': 'error', 'message': text_response}, []
+    return store_generated_images(prompt, images, text_response, base_filename, count, use_cache=use_cache)
+
+
+def store_generated_images(prompt, images, text_response, base_filename='', requested=None, use_cache=True):
+    """Uploads and indexes several generated images in parallel; returns (result, images)."""
+    stem = make_filename(prompt, base_filename).rsplit('.', 1)[0]
+
+    def store(index, image_data):
+        filename = f"{stem}_{index + 1}.png"
+        entry, image_data = store_generated_image(image_data, text_response, filename, use_cache=use_cache)
+        record_history(prompt, filename, image_data, entry)
+        entry.pop('text_response', None)  # Shared by all images, returned once at the top level
+        return entry
+
+    entries = run_concurrently(store, list(enumerate(images)))
+    requested = requested or len(images)
+    return {
+        'status': 'success' if all(entry['status'] == 'success' for entry in entries) else 'partial_success',
+        'message': ('Images generated successfully!' if len(images) >= requested
+                    else f'Generated {len(images)} of {requested} requested images.'),
+        'count': len(entries),
+        'images': entries,
+        'text_response': text_response
+    }, images
+
+
+def record_history(prompt, filename, image_data, result):
+    """Adds a generated image to the history index; indexing errors never fail the request."""
+    if not HISTORY_INDEX_ENABLED or image_data is None:
+        return
+    digest = result.get('content_hash') or content_hash(image_data)
+    # A cache hit reuses an earlier upload, so filename was never written: index the stored blob
+    upload = image_cache.get_upload(digest) if result.get('imageUrl') else None
+    if upload:
+        filename = upload['blob_name']
+    try:
+        history_index.add(
+            ref=filename,
+            source=GENERATED,
+            prompt=prompt,
+            filename=filename,
+            content_hash=digest,
+            bytes=len(image_data),
+            image_url=result.get('imageUrl'),
+            variants={name: variant['url'] for name, variant in result.get('variants', {}).items()},
+        )
+    except Exception as e:
+        print(f"Error indexing '{filename}' in history: {e}")
+
+
+def store_generated_image(image_data, text_response, filename, use_cache=True):
+    """
+    Uploads a generated image (and its variants) to Firebase storage.
+    Returns (result, image_data) like generate_and_upload_image().
+    """
+    # The content hash lets clients cache the image under /images/<hash>.png
+    digest = content_hash(image_data)
+
+    # If Firebase is initialized, upload the image
+    wait_for_firebase()
+    if firebase_bucket:
+        # Encode the compressed variants in the process pool while the original uploads
+        variants_future = submit_variants(image_data)
+        try:
+            image_url = upload_image(image_data, filename, use_cache=use_cache, digest=digest)
+
+            result = {
+                'status': 'success',
+                'message': 'Image generated successfully!',
+                'imageUrl': image_url,
+                'content_hash': digest,
+                'text_response': text_response
+            }
+            if variants_future is not None:
+                result['variants'] = upload_variants(
+                    variants_future, filename, len(image_data), image_url, use_cache=use_cache
+                )
+            return result, image_data
+        except Exception as e:
+            print(f"Error uploading to Firebase: {e}")
+            # If upload fails, the caller falls back to returning the image itself
+            return {
+                'status': 'partial_success',
+                'message': f'Image generated : {e}',
+                'content_hash': digest,
+                'text_response': text_response
+            }, image_data
+    else:
+        # Firebase not initialized, only the image itself can be returned
+        return {
+            'status': 'success',
+            'message': 'Image generated successfully!',
+            'content_hash': digest,
+            'text_response': text_response
+        }, image_data
+
+
+def encode_image_base64(image_data):
+    """Base64-encodes image bytes for a JSON response, timing it as the 'b64' stage."""
+    with metrics.stage('b64', BASE64_LATENCY):
+        return base64.b64encode(image_data).decode('utf-8')
+
+
+def iter_image_json(result, image_data, chunk_bytes=IMAGE_STREAM_CHUNK_BYTES):
+    """
+    Yields the JSON encoding of result with image_data added as base64, in
+    chunks. The image is sliced through a memoryview and encoded a chunk at a
+    time, so neither the full base64 text nor the serialized body is ever
+    built: the only whole copy of the image alive is the caller's bytes.
+    """
+    head = json.dumps(result, separators=(',', ':'))  # ASCII-only, so len() is the byte length
+    yield (head[:-1] + (',' if result else '') + '"image_data":"').encode('ascii')
+    view = memoryview(image_data)
+    encoding = 0.0
+    for start in range(0, len(view), chunk_bytes):
+        started = time.perf_counter()
+        chunk = base64.b64encode(view[start:start + chunk_bytes])
+        encoding += time.perf_counter() - started
+        yield chunk
+    view.release()
+    BASE64_LATENCY.observe(encoding)  # Streamed after the request's Server-Timing header, so histogram only
+    yield b'"}'
+
+
+def image_json_length(result, image_data):
+    """Content-Length of the body iter_image_json() produces."""
+    head = json.dumps(result, separators=(',', ':'))
+    return len(head) + (1 if result else 0) + len('"image_data":"') + 4 * ((len(image_data) + 2) // 3) + 1
+
+
+def image_json_response(result, image_data, status=200):
+    """Streams result plus the base64 image as JSON, in place of jsonify({**result, 'image_data': ...})."""
+    return Response(iter_image_json(result, image_data), status=status, mimetype='application/json',
+                    headers={'Content-Length': str(image_json_length(result, image_data))})
+
+
+def generate_and_store(prompt, base_filename='', use_cache=True, response_mode='base64', candidates=1):
+    """
+    Generates and uploads an image, returning a JSON-ready payload.
+    Shared by the /generate_and_upload route and the background job workers.
+    In 'base64' mode the PNG is always included as image_data; in 'url' mode
+    it is only included when no public URL could be produced.
+    With candidates > 1 the payload lists the images under 'images'
+    (generate_and_upload_images()), each with its own image_data.
+    """
+    if candidates > 1:
+        result, images = generate_and_upload_images(prompt, base_filename, candidates, use_cache=use_cache)
+        for entry, image_data in zip(result.get('images', []), images):
+            if includes_image_data(entry, response_mode):
+                entry['image_data'] = encode_image_base64(image_data)
+        return result
+
+    result, image_data = generate_and_upload_image(prompt, base_filename, use_cache=use_cache)
+    if image_data is not None and includes_image_data(result, response_mode):
+        result['image_data'] = encode_image_base64(image_data)
+    return result
+
+
+def parse_candidates(request_data):
+    """The 'candidates' count of a generation request body (default 1), or None if invalid."""
+    value = request_data.get('candidates', 1) if isinstance(request_data, dict) else 1
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        return None
+    return value if 1 <= value <= GENERATION_MAX_CANDIDATES else None
+
+
+def admission_cost(endpoint, request_data):
+    """
+    Rate-limit tokens a generation request costs: one per Gemini call it can
+    make, so one per candidate, and one per item of a batch.
+    """
+    if endpoint == 'generate_batch':
+        items = request_data.get('items') if isinstance(request_data, dict) else None
+        return min(len(items), BATCH_MAX_ITEMS) if isinstance(items, list) and items else 1
+    return parse_candidates(request_data) or 1
+
+
+def includes_image_data(result, response_mode):
+    """Whether a JSON response carries the image: always in 'base64' mode, in 'url' mode only without a URL."""
+    return response_mode == 'base64' or not result.get('imageUrl')
+
+
+def negotiate_response_mode(req=None):
+    """
+    Picks the response mode for a generation request: the 'response_mode'
+    query parameter wins, otherwise 'Accept: image/png' selects 'binary' and
+    anything else keeps the original base64 JSON. Returns None if invalid.
+    req defaults to the current Flask request (the async app passes its own).
+    """
+    req = request if req is None else req
+    mode = req.args.get('response_mode')
+    if mode:
+        return mode if mode in RESPONSE_MODES else None
+    if req.accept_mimetypes.best_match(['application/json', 'image/png']) == 'image/png':
+        return 'binary'
+    return 'base64'
+
+
+def binary_image_headers(result):
+    """Response headers carrying a generation result's metadata in binary mode."""
+    headers = {'X-Status': result['status']}
+    if result.get('imageUrl'):
+        headers['X-Image-Url'] = result['imageUrl']
+    if result.get('message'):
+        headers['X-Message'] = quote(result['message'])
+    if result.get('text_response'):
+        headers['X-Text-Response'] = quote(result['text_response'])
+    if result.get('variants'):
+        headers['X-Image-Variants'] = quote(json.dumps(result['variants']))
+    return headers
+
+
+def generation_error_status():
+    """
+    Status code and headers for a failed generation: 503 with Retry-After
+    while the Gemini circuit breaker is open, otherwise 500.
+    """
+    retry_after = gemini_client.resilience.breaker.retry_after()
+    if retry_after:
+        return 503, {'Retry-After': str(retry_after)}
+    return 500, {}
+
+
+def binary_image_response(result, image_data):
+    """Returns the raw PNG as the response body with the metadata in headers."""
+    return Response(image_data, status=200, mimetype='image/png', headers=binary_image_headers(result))
+
+
+@app.before_request
+def start_background_init():
+    """Kicks off Firebase initialization in this worker without waiting for it."""
+    firebase_init.start()
+
+
+@app.after_request
+def record_first_response(response):
+    startup.mark_first_response()
+    return response
+
+
+@app.before_request
+def start_request_metrics():
+    if metrics.METRICS_ENABLED:
+        g.request_started = time.perf_counter()
+        metrics.start_request()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Observes the route's latency and adds the per-stage Server-Timing header."""
+    started = g.pop('request_started', None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_LATENCY.observe(elapsed, route, request.method, str(response.status_code))
+        response.headers['Server-Timing'] = metrics.server_timing_header(elapsed)
+    metrics.finish_request()
+    return response
+
+
+@app.before_request
+def admit_generation_request():
+    """Applies the per-client rate limit and concurrency slot to the generation routes."""
+    if not ADMISSION_ENABLED or request.endpoint not in ADMISSION_RATE_LIMITED_ENDPOINTS:
+        return None
+    client = identify_client(request.headers, request.remote_addr)
+    set_current_client(client)
+    try:
+        cost = admission_cost(request.endpoint, request.get_json(silent=True))
+        admission.check_rate(*client, cost=cost)
+        # A multi-image request takes one slot per Gemini call instead (gen_candidate())
+        if request.endpoint in ADMISSION_SLOT_ENDPOINTS and cost == 1:
+            with metrics.stage('queue'):
+                g.admission_granted = admission.acquire(*client)
+    except RateLimitedError as e:
+        return rate_limited_response(e)
+    return None
+
+
+@app.teardown_request
+def release_admission_slot(error=None):
+    granted = g.pop('admission_granted', None)
+    if granted is not None:
+        admission.release(granted)
+
+
+def rate_limited_response(error):
+    """429 response with a Retry-After header for a RateLimitedError."""
+    response = jsonify({
+        'status': 'error',
+        'message': 'Too many requests, please retry later.',
+        'reason': error.reason,
+        'retry_after': error.retry_after
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+@contextmanager
+def admission_slot(client):
+    """Holds a fair-queued generation slot for client (a no-op without admission control)."""
+    if not ADMISSION_ENABLED or client is None:
+        yield
+        return
+    granted = admission.acquire(*client)
+    try:
+        yield
+    finally:
+        admission.release(granted)
 
 
 @app.route('/', methods=['GET'])
@@ -189,6 +947,9 @@ def generate_and_upload():
     """
     Endpoint to generate an image and upload it to Firebase storage.
     Returns JSON response with the image URL and base64 data for download.
+    Clients may ask for a cheaper response with ?response_mode=url (JSON with
+    the URL only) or ?response_mode=binary / Accept: image/png (raw PNG body,
+    metadata in X-* headers).
     """
     if request.method != 'POST':
         return jsonify({'status': 'error', 'message': 'Invalid request method. Use POST.'}), 405
@@ -212,73 +973,265 @@ def generate_and_upload():
         if not prompt:
             return jsonify({'status': 'error', 'message': 'Please provide a prompt for the image.'}), 400
 
-        # Get filename from request or generate one
-        base_filename = request_data.get('filename', '').strip()
-        if not base_filename:
-            # Generate a filename based on prompt (first 20 chars) if none provided
-            base_filename = re.sub(r'[^\w\s-]', '', prompt[:20]).strip().replace(' ', '_').lower()
-        
-        # Add timestamp for uniqueness
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        filename = f"{base_filename}_{timestamp}.png"
+        # Clients can skip the prompt cache with {"bypass_cache": true}
+        use_cache = not request_data.get('bypass_cache', False)
 
-        # Generate the image
-        image_data, text_response = gen_image(prompt)
-        if not image_data:
-            return jsonify({'status': 'error', 'message': text_response}), 500
+        response_mode = negotiate_response_mode()
+        if response_mode is None:
+            return jsonify({
+                'status': 'error',
+                'message': f"Invalid response_mode. Use one of: {', '.join(RESPONSE_MODES)}."
+            }), 400
 
-        # Always convert to base64 for download functionality
-        image_base64 = base64.b64encode(image_data).decode('utf-8')
+        candidates = parse_candidates(request_data)
+        if candidates is None:
+            return jsonify({'status': 'error', 'message': INVALID_CANDIDATES_MESSAGE}), 400
+        if candidates > 1:
+            if response_mode == 'binary':
+                return jsonify({'status': 'error', 'message': 'Use base64 or url response_mode with candidates.'}), 400
+            result = generate_and_store(prompt, request_data.get('filename', ''), use_cache=use_cache,
+                                        response_mode=response_mode, candidates=candidates)
+            if result['status'] == 'error':
+                status, headers = generation_error_status()
+                return jsonify(result), status, headers
+            return jsonify(result), 200
 
-        # If Firebase is initialized, upload the image
-        if firebase_bucket:
-            try:
-                # Create a file-like object from the image data
-                image_file = io.BytesIO(image_data)
-                
-                # Upload to Firebase Storage
-                blob = firebase_bucket.blob(filename)
-                blob.upload_from_file(image_file, content_type='image/png')
-                
-                # Make the blob publicly accessible
-                blob.make_public()
-                
-                # Get the public URL
-                image_url = blob.public_url
-                
-                return jsonify({
-                    'status': 'success',
-                    'message': 'Image generated successfully!',
-                    'imageUrl': image_url,
-                    'image_data': image_base64,  # Always include base64 for download
-                    'text_response': text_response
-                }), 200
-            except Exception as e:
-                print(f"Error uploading to Firebase: {e}")
-                # If upload fails, fallback to returning base64 data only
-                return jsonify({
-                    'status': 'partial_success',
-                    'message': f'Image generated : {e}',
-                    'image_data': image_base64,
-                    'text_response': text_response
-                }), 200
-        else:
-            # Firebase not initialized, return base64 data
-            return jsonify({
-                'status': 'success',
-                'message': 'Image generated successfully!',
-                'image_data': image_base64,
-                'text_response': text_response
-            }), 200
+        result, image_data = generate_and_upload_image(
+            prompt, request_data.get('filename', ''), use_cache=use_cache
+        )
+        if image_data is None:
+            status, headers = generation_error_status()
+            return jsonify(result), status, headers
+        if response_mode == 'binary':
+            return binary_image_response(result, image_data)
+        if includes_image_data(result, response_mode):
+            return image_json_response(result, image_data)
+        return jsonify(result), 200
     except Exception as e:
         print(f"Error processing request: {e}")
         return jsonify({'status': 'error', 'message': f'Error processing request: {e}'}), 500
 
 
+def run_job(client=None, **payload):
+    """
+    Job handler: generate_and_store() within a generation slot of the client
+    that queued it (one slot per Gemini call for a multi-image job).
+    """
+    set_current_client(client)
+    if payload.get('candidates', 1) > 1:
+        return generate_and_store(**payload)
+    with admission_slot(client):
+        return generate_and_store(**payload)
+
+
+job_queue = JobQueue(run_job)  # Background generation jobs for /jobs
+
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    Endpoint to queue an image generation job without waiting for it.
+    Returns 202 with the job id and URLs to poll or stream its status,
+    or 429 with a Retry-After header when the queue is full.
+    """
+    if request.headers.get('Content-Type') != 'application/json':
+        return jsonify({
+            'status': 'error',
+            'message': 'Invalid Content-Type. Use application/json.'
+        }), 400
+
+    request_data = request.get_json(silent=True)
+    if request_data is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Invalid request: No JSON body provided or invalid JSON format.'
+        }), 400
+
+    prompt = request_data.get('prompt', '').strip()
+    if not prompt:
+        return jsonify({'status': 'error', 'message': 'Please provide a prompt for the image.'}), 400
+
+    # Job results are JSON, so only the base64 and URL-only modes apply
+    response_mode = request_data.get('response_mode', 'base64')
+    if response_mode not in ('base64', 'url'):
+        return jsonify({'status': 'error', 'message': 'Invalid response_mode. Use base64 or url.'}), 400
+
+    candidates = parse_candidates(request_data)
+    if candidates is None:
+        return jsonify({'status': 'error', 'message': INVALID_CANDIDATES_MESSAGE}), 400
+
+    try:
+        job = job_queue.submit({
+            'prompt': prompt,
+            'base_filename': request_data.get('filename', ''),
+            'use_cache': not request_data.get('bypass_cache', False),
+            'response_mode': response_mode,
+            'candidates': candidates,
+            'client': current_client(),
+        })
+    except QueueFullError as e:
+        response = jsonify({
+            'status': 'error',
+            'message': 'Server is busy, please retry later.',
+            'retry_after': e.retry_after
+        })
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+
+    return jsonify({
+        'status': job.status,
+        'job_id': job.id,
+        'status_url': url_for('get_job', job_id=job.id),
+        'events_url': url_for('stream_job_events', job_id=job.id)
+    }), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Endpoint to fetch a job's status; includes the generation result
+    (same payload as /generate_and_upload) once the job has finished.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def stream_job_events(job_id):
+    """
+    Server-Sent Events stream of a job's state changes. Each change is sent
+    as a 'status' event; the stream closes after the final state.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Job not found'}), 404
+
+    def events():
+        seen_version = -1
+        while True:
+            version = job_queue.wait_for_change(job, seen_version, timeout=15)
+            if version == seen_version:
+                yield ": keep-alive\n\n"
+                continue
+            seen_version = version
+            yield f"event: status\ndata: {json.dumps(job.to_dict())}\n\n"
+            if job.status in TERMINAL_STATES:
+                return
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+def _run_batch_item(index, item, use_cache, client=None):
+    """Generates and uploads one batch item, returning its NDJSON record."""
+    started = time.perf_counter()
+    prompt = (item.get('prompt') or '').strip()
+    if not prompt:
+        result = {'status': 'error', 'message': 'Please provide a prompt for the image.'}
+    else:
+        try:
+            # URL-only: base64 is only included for items that could not be uploaded
+            with admission_slot(client):
+                result = generate_and_store(prompt, item.get('filename', ''), use_cache=use_cache,
+                                            response_mode='url')
+        except RateLimitedError as e:
+            result = {'status': 'error', 'message': 'Too many requests, please retry later.',
+                      'reason': e.reason, 'retry_after': e.retry_after}
+        except Exception as e:
+            print(f"Error processing batch item {index}: {e}")
+            result = {'status': 'error', 'message': f'Error processing request: {e}'}
+
+    record = {'type': 'item', 'index': index, 'prompt': prompt}
+    record.update(result)
+    record['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return record
+
+
+@app.route('/generate_batch', methods=['POST'])
+def generate_batch():
+    """
+    Endpoint to generate and upload many images in one request.
+    Body: {"items": [{"prompt": ..., "filename": ...}, ...], "concurrency": N}.
+    Streams one NDJSON line per item as it completes (in completion order,
+    with its index and latency), then a summary line with the wall-clock time.
+    """
+    if request.headers.get('Content-Type') != 'application/json':
+        return jsonify({
+            'status': 'error',
+            'message': 'Invalid Content-Type. Use application/json.'
+        }), 400
+
+    request_data = request.get_json(silent=True)
+    if request_data is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Invalid request: No JSON body provided or invalid JSON format.'
+        }), 400
+
+    items = request_data.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({'status': 'error', 'message': 'Please provide a non-empty list of items.'}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({
+            'status': 'error',
+            'message': f'Too many items: at most {BATCH_MAX_ITEMS} per batch.'
+        }), 400
+    if not all(isinstance(item, dict) for item in items):
+        return jsonify({'status': 'error', 'message': 'Each item must be an object with a prompt.'}), 400
+
+    try:
+        concurrency = int(request_data.get('concurrency', BATCH_MAX_CONCURRENCY))
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'concurrency must be an integer.'}), 400
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY, len(items)))
+    use_cache = not request_data.get('bypass_cache', False)
+    client = current_client()
+
+    def results():
+        started = time.perf_counter()
+        succeeded = failed = 0
+        item_latency_ms = 0.0
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='batch')
+        try:
+            futures = [executor.submit(_run_batch_item, index, item, use_cache, client)
+                       for index, item in enumerate(items)]
+            for future in as_completed(futures):
+                record = future.result()
+                if record['status'] == 'error':
+                    failed += 1
+                else:
+                    succeeded += 1
+                item_latency_ms += record['latency_ms']
+                yield json.dumps(record) + "\n"
+        finally:
+            # Stop queued items if the client went away mid-stream
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        wall_time_ms = (time.perf_counter() - started) * 1000
+        yield json.dumps({
+            'type': 'summary',
+            'total': len(items),
+            'succeeded': succeeded,
+            'failed': failed,
+            'concurrency': concurrency,
+            'wall_time_ms': round(wall_time_ms, 1),
+            'sum_item_latency_ms': round(item_latency_ms, 1),
+            'speedup': round(item_latency_ms / wall_time_ms, 2) if wall_time_ms else None,
+        }) + "\n"
+
+    return Response(stream_with_context(results()), mimetype='application/x-ndjson')
+
+
 @app.route('/generate_image', methods=['POST'])
 def generate_image_route():
     """
-    Legacy endpoint to trigger image generation. Returns JSON response with image data.
+    Legacy endpoint to trigger image generation. Returns JSON response with image data,
+    or the raw PNG with ?response_mode=binary / Accept: image/png.
     """
     if request.method != 'POST':
         return jsonify({'status': 'error', 'message': 'Invalid request method. Use POST.'}), 405
@@ -302,34 +1255,311 @@ def generate_image_route():
         if not prompt:
             return jsonify({'status': 'error', 'message': 'Please provide a prompt for the image.'}), 400
 
-        image_data, text_response = gen_image(prompt)  # Get image data and text
+        # Nothing is uploaded here, so there is no URL-only mode
+        response_mode = negotiate_response_mode()
+        if response_mode not in ('base64', 'binary'):
+            return jsonify({'status': 'error', 'message': 'Invalid response_mode. Use base64 or binary.'}), 400
+
+        use_cache = not request_data.get('bypass_cache', False)
+        image_data, text_response = gen_image(prompt, use_cache=use_cache)  # Get image data and text
         if not image_data:
-            return jsonify({'status': 'error', 'message': text_response}), 500  # Return the error from gen_image
+            status, headers = generation_error_status()
+            return jsonify({'status': 'error', 'message': text_response}), status, headers  # Return the error from gen_image
 
-        # Convert image data to base64 for sending in JSON.  This is suitable for smaller images.
-        image_base64 = base64.b64encode(image_data).decode('utf-8')
-        return jsonify({
+        if response_mode == 'binary':
+            return binary_image_response({
+                'status': 'success',
+                'message': 'Image generated successfully!',
+                'text_response': text_response
+            }, image_data)
+
+        # Stream the image as base64 inside the JSON body, without building the whole string first
+        return image_json_response({
             'status': 'success',
             'message': 'Image generated successfully!',
-            'image_data': image_base64,  # Send base64 encoded image data
             'text_response': text_response
-        }), 200
+        }, image_data)
     except Exception as e:
         print(f"Error processing request: {e}")
         return jsonify({'status': 'error', 'message': f'Error processing request: {e}'}), 500
 
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    """
+    Endpoint exposing in-process performance counters (client reuse,
+    image cache and request coalescing) for this worker.
+    """
+    return jsonify(collect_stats())
+
+
+def collect_stats():
+    """Gathers the per-worker counters reported by /stats."""
+    return {
+        'pid': os.getpid(),
+        'gemini_client': gemini_client.get_stats(),
+        'gemini_resilience': gemini_client.get_resilience_stats(),
+        'image_cache': image_cache.get_stats(),
+        'negative_cache': negative_cache.get_stats(),
+        'generation_flight': generation_flight.get_stats(),
+        'upload_flight': upload_flight.get_stats(),
+        'jobs': job_queue.get_stats(),
+        'storage_uploads': storage_uploader.get_stats(),
+        'prompts_cache': prompts_cache.get_stats(),
+        'admission': admission.get_stats(),
+        'history_index': history_index.get_stats(),
+        'startup': startup.get_stats(),
+    }
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint for this worker's counters and histograms."""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+_static_versions = {}  # filename -> (mtime, content hash prefix)
+
+
+def static_asset_version(filename):
+    """Returns a short content hash of a file in static/ (recomputed when it changes), or None."""
+    path = os.path.join(app.root_path, 'static', filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _static_versions.get(filename)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'rb') as f:
+        version = hashlib.sha256(f.read()).hexdigest()[:12]
+    _static_versions[filename] = (mtime, version)
+    return version
+
+
+@app.template_global()
+def asset_url(filename):
+    """
+    URL of a static file fingerprinted with its content hash (?v=...). The
+    content behind a fingerprinted URL never changes, so it is served as
+    immutable; a new deploy changes the hash and therefore the URL.
+    """
+    version = static_asset_version(filename)
+    return f"/static/{filename}?v={version}" if version else f"/static/{filename}"
+
+
+def static_cache_control(filename, version):
+    """Immutable for a request carrying the file's current fingerprint, otherwise always revalidate."""
+    if version and version == static_asset_version(filename):
+        return IMMUTABLE_CACHE_CONTROL
+    return 'no-cache'
+
+
 @app.route('/static/<path:filename>')
 def static_files(filename):
     """Serve static files (like CSS, JS)."""
-    return send_from_directory('static', filename)
+    response = send_from_directory('static', filename)
+    response.headers['Cache-Control'] = static_cache_control(filename, request.args.get('v'))
+    return response
+
+
+@app.route('/sw.js')
+def service_worker():
+    """Serves the Service Worker from the site root, so it controls every page; always revalidated."""
+    response = send_from_directory('static', 'sw.js')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def find_image_url(digest):
+    """Public URL of an uploaded image by content hash, from the upload records or the history index."""
+    record = image_cache.get_upload(digest)
+    if record:
+        return record['url']
+    if HISTORY_INDEX_ENABLED:
+        try:
+            return history_index.find_image_url(digest)
+        except Exception as e:
+            print(f"Error looking up content hash {digest} in history: {e}")
+    return None
+
+
+@app.route('/images/<digest>.png', methods=['GET'])
+def content_addressed_image(digest):
+    """
+    Redirects the content hash of a generated image (the content_hash of a
+    generation result) to its public Storage URL. The bytes behind a hash
+    never change, so the redirect is cached as immutable and clients can key
+    their caches by it.
+    """
+    image_url = find_image_url(digest) if CONTENT_HASH_PATTERN.match(digest) else None
+    if not image_url:
+        response = jsonify({'status': 'error', 'message': 'Unknown image.'})
+        response.status_code = 404
+        response.headers['Cache-Control'] = 'no-store'  # It may be uploaded later
+        return response
+    return Response(status=302, headers={'Location': image_url, 'Cache-Control': IMMUTABLE_CACHE_CONTROL})
+
+# Fields of agent_responses documents used by the prompt endpoints
+PROMPT_FIELDS = ['agent_name', 'response_content', 'created_at', 'prompt_text']
+PROMPTS_PAGE_SIZE = int(os.environ.get('PROMPTS_PAGE_SIZE', '50'))
+PROMPTS_MAX_PAGE_SIZE = int(os.environ.get('PROMPTS_MAX_PAGE_SIZE', '500'))
+
+
+def prompt_data_from_doc(doc):
+    """Converts an agent_responses document into the JSON shape used by the frontend."""
+    doc_data = doc.to_dict() or {}
+
+    # Handle Firestore timestamp conversion
+    created_at = doc_data.get('created_at')
+    if created_at:
+        # Convert Firestore timestamp to ISO string for JavaScript
+        if hasattr(created_at, 'timestamp'):
+            # It's a Firestore timestamp object
+            created_at_iso = created_at.isoformat()
+        elif hasattr(created_at, 'seconds'):
+            # It's a timestamp dict with seconds and nanoseconds
+            created_at_iso = datetime.fromtimestamp(created_at.seconds).isoformat()
+        else:
+            # Fallback - assume it's already a datetime or string
+            created_at_iso = str(created_at)
+    else:
+        # Use current time as fallback
+        created_at_iso = datetime.now().isoformat()
+
+    return {
+        'id': doc.id,
+        'agent_name': doc_data.get('agent_name', 'Unknown Agent'),
+        'response_content': doc_data.get('response_content', ''),
+        'created_at': created_at_iso,  # Send as ISO string
+        'prompt_text': doc_data.get('prompt_text', ''),  # If you store original prompts
+    }
+
+
+def encode_page_token(created_at, doc_id):
+    """Builds an opaque cursor pointing just after this document."""
+    if hasattr(created_at, 'isoformat'):
+        cursor = {'created_at': created_at.isoformat(), 'id': doc_id}
+    else:
+        # Legacy documents may store created_at as a plain string or number
+        cursor = {'created_at_raw': created_at, 'id': doc_id}
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode('utf-8')).decode('ascii')
+
+
+def decode_page_token(token):
+    """Returns the (created_at, document id) cursor encoded in a page token."""
+    cursor = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    if 'created_at' in cursor:
+        return datetime.fromisoformat(cursor['created_at']), cursor['id']
+    return cursor['created_at_raw'], cursor['id']
+
+
+def fetch_prompts_page(limit, cursor=None):
+    """
+    Fetches one page of saved prompts, newest first, from Firestore.
+    Only the fields in PROMPT_FIELDS are read, and the query resumes after
+    the (created_at, id) cursor, so the cost of a page does not depend on
+    how deep into the collection it is.
+    Returns (prompts, next_page_token); the token is None on the last page.
+    """
+    query = (
+        db.collection('agent_responses')
+        .select(PROMPT_FIELDS)
+        .order_by('created_at', direction=firestore.Query.DESCENDING)
+        .order_by('__name__', direction=firestore.Query.DESCENDING)
+    )
+    if cursor:
+        created_at, doc_id = cursor
+        query = query.start_after({'created_at': created_at, '__name__': doc_id})
+
+    # Fetch one extra document to learn whether another page exists
+    with metrics.stage('firestore', FIRESTORE_QUERY_LATENCY, 'prompts_page'):
+        docs = list(query.limit(limit + 1).stream())
+    FIRESTORE_DOCUMENTS_READ.inc(len(docs), 'prompts_page')
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    next_page_token = None
+    if has_more and docs:
+        next_page_token = encode_page_token((docs[-1].to_dict() or {}).get('created_at'), docs[-1].id)
+    return [prompt_data_from_doc(doc) for doc in docs], next_page_token
+
+
+# Saved prompts served from memory, kept fresh by a Firestore listener (or poller)
+prompts_cache = PromptsCache(
+    lambda: db.collection('agent_responses') if db else None,
+    prompt_data_from_doc,
+    PROMPT_FIELDS,
+)
+
+
+def _cache_counts(counter):
+    """Samples hits or misses of every cache as {(cache,): count} for /metrics."""
+    image = image_cache.get_stats()
+    counts = {
+        ('image',): image[counter] + (image['disk_hits'] if counter == 'hits' else 0),
+        ('prompts',): prompts_cache.get_stats()[counter],
+    }
+    if counter == 'hits':
+        counts[('negative',)] = negative_cache.get_stats()['hits']
+    return counts
+
+
+# Counters the modules already keep, sampled when /metrics is scraped
+metrics.register_callback('cache_hits_total', 'counter', 'Cache hits by cache',
+                          lambda: _cache_counts('hits'), labelnames=('cache',))
+metrics.register_callback('cache_misses_total', 'counter', 'Cache misses by cache',
+                          lambda: _cache_counts('misses'), labelnames=('cache',))
+metrics.register_callback('negative_cache_saved_model_calls_total', 'counter',
+                          'Gemini calls avoided by answering from the negative cache',
+                          lambda: negative_cache.get_stats()['saved_model_calls'])
+metrics.register_callback('generation_coalesced_total', 'counter',
+                          'Generations that joined an identical in-flight request',
+                          lambda: generation_flight.get_stats()['coalesced'])
+metrics.register_callback('job_queue_depth', 'gauge', 'Jobs waiting in the background queue',
+                          lambda: job_queue.depth())
+metrics.register_callback('admission_active', 'gauge', 'Generation slots in use',
+                          lambda: admission.get_stats()['active'])
+metrics.register_callback('admission_waiting', 'gauge', 'Generation requests waiting for a slot',
+                          lambda: admission.get_stats()['waiting'])
+metrics.register_callback('gemini_circuit_open', 'gauge', '1 while the Gemini circuit breaker is open',
+                          lambda: 1 if gemini_client.resilience.breaker.state == 'open' else 0)
+
+
+def json_with_etag(payload, version=None, params=None):
+    """
+    Returns payload as JSON with a strong ETag, answering 304 when the
+    client's If-None-Match already matches. When the payload comes from the
+    prompts cache (version given), the ETag is remembered for that cache
+    version so a matching revalidation skips building the body entirely.
+    """
+    if version is not None:
+        etag = prompts_cache.cached_etag(version, params)
+        if etag and request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+
+    response = jsonify(payload)
+    body = response.get_data()
+    if version is not None:
+        etag = prompts_cache.store_etag(version, params, body)
+    else:
+        etag = hashlib.sha1(body).hexdigest()
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'  # Always revalidate, usually with a 304
+    return response.make_conditional(request)
+
 
 @app.route('/get_saved_prompts', methods=['GET'])
 def get_saved_prompts():
     """
-    Endpoint to fetch all saved prompts from Firebase database
-    Returns prompts in format suitable for frontend display
+    Endpoint to fetch saved prompts from Firebase database, one page at a time.
+    Query parameters: limit (page size) and page_token (the next_page_token of
+    the previous page). Returns prompts in format suitable for frontend display.
+    Pages are served from the in-process prompts cache once it has synced,
+    with an ETag so unchanged pages revalidate as 304.
     """
     try:
+        wait_for_firebase()
         if not db:
             return jsonify({
                 'success': False,
@@ -337,50 +1567,36 @@ def get_saved_prompts():
                 'prompts': []
             }), 500
 
-        # Get all saved prompts from the agent_responses collection
-        agent_responses_ref = db.collection('agent_responses')
-        docs = agent_responses_ref.order_by('created_at', direction=firestore.Query.DESCENDING).stream()
-        
-        prompts_list = []
-        
-        for doc in docs:
-            doc_data = doc.to_dict()
-            
-            # Handle Firestore timestamp conversion
-            created_at = doc_data.get('created_at')
-            if created_at:
-                # Convert Firestore timestamp to ISO string for JavaScript
-                if hasattr(created_at, 'timestamp'):
-                    # It's a Firestore timestamp object
-                    created_at_iso = created_at.isoformat()
-                elif hasattr(created_at, 'seconds'):
-                    # It's a timestamp dict with seconds and nanoseconds
-                    import datetime
-                    created_at_iso = datetime.datetime.fromtimestamp(created_at.seconds).isoformat()
-                else:
-                    # Fallback - assume it's already a datetime or string
-                    created_at_iso = str(created_at)
-            else:
-                # Use current time as fallback
-                from datetime import datetime
-                created_at_iso = datetime.now().isoformat()
-            
-            # Extract relevant fields
-            prompt_data = {
-                'id': doc.id,
-                'agent_name': doc_data.get('agent_name', 'Unknown Agent'),
-                'response_content': doc_data.get('response_content', ''),
-                'created_at': created_at_iso,  # Send as ISO string
-                'prompt_text': doc_data.get('prompt_text', ''),  # If you store original prompts
-            }
-            
-            prompts_list.append(prompt_data)
-        
-        return jsonify({
+        try:
+            limit = int(request.args.get('limit', PROMPTS_PAGE_SIZE))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'limit must be an integer', 'prompts': []}), 400
+        limit = max(1, min(limit, PROMPTS_MAX_PAGE_SIZE))
+
+        page_token = request.args.get('page_token')
+        cursor = None
+        if page_token:
+            try:
+                cursor = decode_page_token(page_token)
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Invalid page token: {e}")
+                return jsonify({'success': False, 'message': 'Invalid page_token', 'prompts': []}), 400
+
+        page = prompts_cache.get_page(limit, cursor) if PROMPTS_CACHE_ENABLED else None
+        version = None
+        if page is not None:
+            prompts_list, next_cursor, version = page
+            next_page_token = encode_page_token(*next_cursor) if next_cursor else None
+        else:
+            prompts_list, next_page_token = fetch_prompts_page(limit, cursor)
+
+        return json_with_etag({
             'success': True,
             'message': f'Found {len(prompts_list)} saved prompts',
-            'prompts': prompts_list
-        })
+            'prompts': prompts_list,
+            'next_page_token': next_page_token,
+            'has_more': next_page_token is not None
+        }, version, ('page', limit, page_token or ''))
         
     except Exception as e:
         print(f"Error fetching saved prompts: {str(e)}")
@@ -391,21 +1607,128 @@ def get_saved_prompts():
         }), 500
 
 
+def encode_history_cursor(cursor):
+    """Builds an opaque page token from a HistoryIndex.search() cursor."""
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode('utf-8')).decode('ascii')
+
+
+def decode_history_cursor(token, mode):
+    """Returns the HistoryIndex.search() cursor encoded in a page token."""
+    cursor = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    if mode == 'prefix':
+        key, row_id = cursor
+        return str(key), int(row_id)
+    return int(cursor)
+
+
+@app.route('/search_history', methods=['GET'])
+def search_history():
+    """
+    Endpoint to search past generations and saved prompts in the local
+    history index. Query parameters: q, mode ('text' matches every word of
+    the prompt or filename, newest first, with 'word*' as a word prefix;
+    'prefix' matches prompts starting with q), limit and page_token (the
+    next_page_token of the previous page).
+    """
+    if not HISTORY_INDEX_ENABLED:
+        return jsonify({'success': False, 'message': 'History index is disabled', 'results': []}), 404
+
+    query = request.args.get('q', '').strip()
+    mode = request.args.get('mode', 'text')
+    if mode not in SEARCH_MODES:
+        return jsonify({'success': False, 'message': f'mode must be one of {", ".join(SEARCH_MODES)}',
+                        'results': []}), 400
+    if not query:
+        return jsonify({'success': False, 'message': 'Please provide a query (q).', 'results': []}), 400
+    try:
+        limit = int(request.args.get('limit', HISTORY_SEARCH_LIMIT))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'limit must be an integer', 'results': []}), 400
+    limit = max(1, min(limit, HISTORY_SEARCH_MAX_LIMIT))
+
+    page_token = request.args.get('page_token')
+    cursor = None
+    if page_token:
+        try:
+            cursor = decode_history_cursor(page_token, mode)
+        except (ValueError, TypeError) as e:
+            print(f"Invalid history page token: {e}")
+            return jsonify({'success': False, 'message': 'Invalid page_token', 'results': []}), 400
+
+    try:
+        results, next_cursor = history_index.search(query, mode, limit, cursor)
+    except Exception as e:
+        print(f"Error searching history: {e}")
+        return jsonify({'success': False, 'message': f'Error searching history: {e}', 'results': []}), 500
+
+    next_page_token = encode_history_cursor(next_cursor) if next_cursor is not None else None
+    return jsonify({
+        'success': True,
+        'message': f'Found {len(results)} matching entries',
+        'results': results,
+        'next_page_token': next_page_token,
+        'has_more': next_page_token is not None
+    })
+
+
+@app.route('/history/backfill', methods=['POST'])
+def backfill_history():
+    """
+    Starts indexing what predates the history index in the background:
+    body {"sources": ["firestore", "storage"]} (both by default). Progress
+    is reported under history_index.backfill in /stats. The request must
+    carry ?token=<HISTORY_BACKFILL_TOKEN>; without that setting the route
+    is disabled, since a backfill lists the whole bucket.
+    """
+    if not HISTORY_BACKFILL_TOKEN:
+        return jsonify({'status': 'error', 'message': 'History backfill is disabled (HISTORY_BACKFILL_TOKEN is not set).'}), 404
+    if request.args.get('token') != HISTORY_BACKFILL_TOKEN:
+        return jsonify({'status': 'error', 'message': 'Invalid token.'}), 403
+    if not HISTORY_INDEX_ENABLED:
+        return jsonify({'status': 'error', 'message': 'History index is disabled'}), 404
+
+    requested = (request.get_json(silent=True) or {}).get('sources') or ['firestore', 'storage']
+    wait_for_firebase()
+    available = {
+        'firestore': (lambda: history_index.backfill_firestore(db.collection('agent_responses'))) if db else None,
+        'storage': (lambda: history_index.backfill_storage(firebase_bucket)) if firebase_bucket else None,
+    }
+    unknown = [name for name in requested if name not in available]
+    if unknown:
+        return jsonify({'status': 'error', 'message': f'Unknown sources: {", ".join(unknown)}'}), 400
+    sources = {name: available[name] for name in requested if available[name] is not None}
+    if not sources:
+        return jsonify({'status': 'error', 'message': 'Firebase is not initialized.'}), 503
+
+    if not history_index.start_backfill(sources):
+        return jsonify({'status': 'error', 'message': 'A backfill is already running.'}), 409
+    return jsonify({'status': 'started', 'sources': list(sources)}), 202
+
+
 @app.route('/get_prompt/<prompt_id>', methods=['GET'])
 def get_specific_prompt(prompt_id):
     """
     Endpoint to fetch a specific prompt by its document ID
     """
     try:
+        wait_for_firebase()
         if not db:
             return jsonify({
                 'success': False,
                 'message': 'Database connection not available'
             }), 500
 
+        # Serve from the prompts cache when it has this document
+        cached = prompts_cache.get_prompt(prompt_id) if PROMPTS_CACHE_ENABLED else None
+        if cached is not None:
+            prompt_data, version = cached
+            return json_with_etag({'success': True, 'prompt': prompt_data}, version, ('prompt', prompt_id))
+
         # Get specific document
         doc_ref = db.collection('agent_responses').document(prompt_id)
-        doc = doc_ref.get()
+        with metrics.stage('firestore', FIRESTORE_QUERY_LATENCY, 'prompt'):
+            doc = doc_ref.get(field_paths=PROMPT_FIELDS)
+        FIRESTORE_DOCUMENTS_READ.inc(1 if doc.exists else 0, 'prompt')
         
         if not doc.exists:
             return jsonify({
@@ -413,38 +1736,9 @@ def get_specific_prompt(prompt_id):
                 'message': 'Prompt not found'
             }), 404
             
-        doc_data = doc.to_dict()
-        
-        # Handle Firestore timestamp conversion
-        created_at = doc_data.get('created_at')
-        if created_at:
-            # Convert Firestore timestamp to ISO string for JavaScript
-            if hasattr(created_at, 'timestamp'):
-                # It's a Firestore timestamp object
-                created_at_iso = created_at.isoformat()
-            elif hasattr(created_at, 'seconds'):
-                # It's a timestamp dict with seconds and nanoseconds
-                import datetime
-                created_at_iso = datetime.datetime.fromtimestamp(created_at.seconds).isoformat()
-            else:
-                # Fallback - assume it's already a datetime or string
-                created_at_iso = str(created_at)
-        else:
-            # Use current time as fallback
-            from datetime import datetime
-            created_at_iso = datetime.now().isoformat()
-        
-        prompt_data = {
-            'id': doc.id,
-            'agent_name': doc_data.get('agent_name', 'Unknown Agent'),
-            'response_content': doc_data.get('response_content', ''),
-            'created_at': created_at_iso,  # Send as ISO string
-            'prompt_text': doc_data.get('prompt_text', ''),
-        }
-        
-        return jsonify({
+        return json_with_etag({
             'success': True,
-            'prompt': prompt_data
+            'prompt': prompt_data_from_doc(doc)
         })
         
     except Exception as e:
@@ -454,7 +1748,16 @@ def get_specific_prompt(prompt_id):
             'message': f'Error fetching prompt: {str(e)}'
         }), 500
 
-initialize_firebase()
+# Resolve credentials now, in the background. Clients are built per worker:
+# under gunicorn, post_worker_init builds them after fork (even in eager
+# mode, so the master never opens a gRPC channel), otherwise the first
+# request does. / and /static never wait for either.
+if startup.STARTUP_LAZY_INIT:
+    firebase_credentials_init.start()
+else:
+    firebase_credentials_init.run()
+    if not startup.clients_built_in_workers():
+        firebase_init.run()
 
 if __name__ == '__main__':
      # Initialize Firebase (for both storage and database)
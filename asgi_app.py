@@ -0,0 +1,548 @@
+"""
+Async (ASGI) variant of the image generator app.
+
+The I/O-heavy routes of app.py are served by a Quart app whose handlers
+await Gemini (through the google-genai aio client) and Firestore (through
+the async Firestore client) instead of holding a thread for the whole call.
+Storage uploads still use the google-cloud-storage client, which has no
+async API, so they run in a worker thread via asyncio.to_thread. The JSON
+contracts are identical to app.py; every other route (jobs, batch, ...) is
+forwarded to the existing Flask app.
+
+Run with:
+    uvicorn asgi_app:application --workers 2
+or:
+    gunicorn -k uvicorn.workers.UvicornWorker asgi_app:application
+"""
+import re
+import time
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+
+import firebase_admin
+from asgiref.wsgi import WsgiToAsgi
+from firebase_admin import firestore, firestore_async
+from google.genai import types
+from quart import Quart, Response, g, jsonify, render_template, request, send_from_directory
+
+import app as app_module
+import gemini_client
+import metrics
+import startup
+from admission import RateLimitedError, ADMISSION_ENABLED, identify_client, set_current_client, current_client
+from image_cache import make_key
+from negative_cache import TRANSIENT_ERROR
+from resilience import AttemptTimeoutError
+from singleflight import AsyncSingleFlight
+
+async_app = Quart(__name__, static_folder=None)
+async_app.add_template_global(app_module.asset_url)
+generation_flight = AsyncSingleFlight('async_generation')
+_async_db = None  # Async Firestore client, created on the serving event loop
+
+# Paths served natively by the async app; everything else goes to Flask
+ASYNC_ROUTES = re.compile(
+    r'^/(?:|generate_and_upload|generate_image|get_saved_prompts|get_prompt/[^/]+|static/.+|stats)$'
+)
+
+
+def get_async_db():
+    """Returns the async Firestore client, or None if Firebase is not initialized."""
+    global _async_db
+    if _async_db is None and app_module.db is not None and firebase_admin._apps:
+        _async_db = firestore_async.client(database_id="prompts-saved")
+    return _async_db
+
+
+async def _call_gemini_async(prompt, config, cache_key):
+    """Awaits Gemini for a prompt through the resilience layer; returns the raw response, like app._call_gemini."""
+    client = gemini_client.get_client(app_module.api_key)
+    negative_cache = app_module.negative_cache
+
+    try:
+        with metrics.stage('gemini', app_module.GEMINI_LATENCY):
+            response = await gemini_client.resilience.call_async(
+                client.aio.models.generate_content,
+                model=app_module.GEMINI_MODEL,
+                contents=prompt,
+                config=config,
+                previous_failures=negative_cache.transient_failures(cache_key),
+            )
+    except Exception as e:
+        if isinstance(e, AttemptTimeoutError) or gemini_client.is_retryable_error(e):
+            negative_cache.put(cache_key, TRANSIENT_ERROR, str(e))
+        raise
+    return response
+
+
+async def _generate_candidate_async(prompt, config, cache_key):
+    """Async version of app._generate_candidate, shared by gen_image_async and gen_candidate_async."""
+    response = await _call_gemini_async(prompt, config, cache_key)
+    image_data, text_response = app_module.record_generation_result(cache_key, response)
+    if image_data is None:
+        return [], text_response
+    return app_module.extract_generation_parts(response)[0], text_response
+
+
+async def gen_image_async(prompt: str, use_cache: bool = True):
+    """
+    Async version of app.gen_image: same cache and return values, but the
+    Gemini call is awaited. Concurrent calls for the same prompt share one
+    request.
+    """
+    if not app_module.api_key:
+        return None, "Error: GEMINI_API_KEY not set."
+    if not prompt or not prompt.strip():
+        return None, "Error: Image prompt is empty."
+    try:
+        config = types.GenerateContentConfig(response_modalities=['TEXT', 'IMAGE'])
+        cache_key = make_key(prompt, app_module.GEMINI_MODEL, config)
+        if use_cache:
+            with metrics.stage('cache'):
+                cached = app_module.image_cache.get(cache_key)
+            if cached is not None:
+                print("Image served from cache.")
+                return cached.image_data, cached.text_response
+            failed = app_module.negative_cache.get(cache_key)
+            if failed is not None:
+                print(f"Prompt failed recently ({failed.kind}); answering from the negative cache.")
+                return None, failed.message
+
+        (images, text_response), shared = await generation_flight.do(
+            cache_key, _generate_candidate_async, prompt, config, cache_key
+        )
+        if shared:
+            print("Joined an in-flight generation for the same prompt.")
+        return (images[-1] if images else None), text_response
+
+    except Exception as e:
+        print(f"Error during image generation: {e}")
+        return None, f"Error during image generation: {e}"
+
+
+async def gen_candidate_async(prompt, config, cache_key, use_cache=True):
+    """Async version of app.gen_candidate; returns (images, text_response)."""
+    try:
+        if use_cache:
+            cached = app_module.image_cache.get(cache_key)
+            if cached is not None:
+                return [cached.image_data], cached.text_response
+            failed = app_module.negative_cache.get(cache_key)
+            if failed is not None:
+                return [], failed.message
+
+        async with admission_slot(current_client()):  # One slot per candidate, as in app.py
+            (images, text_response), _ = await generation_flight.do(
+                cache_key, _generate_candidate_async, prompt, config, cache_key
+            )
+        return images, text_response
+    except Exception as e:
+        print(f"Error during image generation: {e}")
+        return [], f"Error during image generation: {e}"
+
+
+async def gen_images_async(prompt: str, count: int, use_cache: bool = True):
+    """Async version of app.gen_images: the candidates' Gemini calls are awaited together."""
+    if not app_module.api_key:
+        return [], "Error: GEMINI_API_KEY not set."
+    if not prompt or not prompt.strip():
+        return [], "Error: Image prompt is empty."
+    config = types.GenerateContentConfig(response_modalities=['TEXT', 'IMAGE'])
+    cache_key = make_key(prompt, app_module.GEMINI_MODEL, config)
+
+    outcomes = await asyncio.gather(*[
+        gen_candidate_async(prompt, config, app_module.candidate_cache_key(cache_key, index), use_cache)
+        for index in range(count)
+    ])
+    images = [image for candidate_images, _ in outcomes for image in candidate_images]
+    texts = [text for candidate_images, text in outcomes if candidate_images]
+    return images, texts[0] if texts else outcomes[0][1]
+
+
+async def generate_and_upload_images_async(prompt, base_filename='', count=1, use_cache=True):
+    """Async version of app.generate_and_upload_images; returns (result, images)."""
+    images, text_response = await gen_images_async(prompt, count, use_cache=use_cache)
+    if not images:
+        return {'status': 'error', 'message': text_response}, []
+    # The parallel uploads run on app.candidate_executor; this thread only waits for them
+    return await asyncio.to_thread(
+        app_module.store_generated_images, prompt, images, text_response, base_filename, count, use_cache
+    )
+
+
+async def generate_and_upload_image_async(prompt, base_filename='', use_cache=True):
+    """Async version of app.generate_and_upload_image; returns (result, image_data)."""
+    filename = app_module.make_filename(prompt, base_filename)
+
+    image_data, text_response = await gen_image_async(prompt, use_cache=use_cache)
+    if not image_data:
+        return {'status': 'error', 'message': text_response}, None
+
+    # google-cloud-storage and sqlite are blocking; keep them off the event loop
+    result, image_data = await asyncio.to_thread(
+        app_module.store_generated_image, image_data, text_response, filename, use_cache
+    )
+    await asyncio.to_thread(app_module.record_history, prompt, filename, image_data, result)
+    return result, image_data
+
+
+async def fetch_prompts_page_async(limit, cursor=None):
+    """Async version of app.fetch_prompts_page using the async Firestore client."""
+    query = (
+        get_async_db().collection('agent_responses')
+        .select(app_module.PROMPT_FIELDS)
+        .order_by('created_at', direction=firestore.Query.DESCENDING)
+        .order_by('__name__', direction=firestore.Query.DESCENDING)
+    )
+    if cursor:
+        created_at, doc_id = cursor
+        query = query.start_after({'created_at': created_at, '__name__': doc_id})
+
+    # Fetch one extra document to learn whether another page exists
+    with metrics.stage('firestore', app_module.FIRESTORE_QUERY_LATENCY, 'prompts_page'):
+        docs = [doc async for doc in query.limit(limit + 1).stream()]
+    app_module.FIRESTORE_DOCUMENTS_READ.inc(len(docs), 'prompts_page')
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    next_page_token = None
+    if has_more and docs:
+        next_page_token = app_module.encode_page_token((docs[-1].to_dict() or {}).get('created_at'), docs[-1].id)
+    return [app_module.prompt_data_from_doc(doc) for doc in docs], next_page_token
+
+
+async def json_with_etag(payload, version=None, params=None):
+    """Async counterpart of app.json_with_etag (strong ETag, 304 on If-None-Match)."""
+    prompts_cache = app_module.prompts_cache
+    if version is not None:
+        etag = prompts_cache.cached_etag(version, params)
+        if etag and request.if_none_match.contains(etag):
+            response = Response('', status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+
+    response = jsonify(payload)
+    body = await response.get_data()
+    if version is not None:
+        etag = prompts_cache.store_etag(version, params, body)
+    else:
+        etag = hashlib.sha1(body).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response('', status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'  # Always revalidate, usually with a 304
+    return response
+
+
+async def _read_generation_request():
+    """Validates a generation request body; returns (request_data, prompt, error_response)."""
+    # Check if the request has the correct Content-Type
+    if request.headers.get('Content-Type') != 'application/json':
+        return None, None, (jsonify({
+            'status': 'error',
+            'message': 'Invalid Content-Type. Use application/json.'
+        }), 400)
+
+    request_data = await request.get_json(silent=True)
+    if request_data is None:
+        return None, None, (jsonify({
+            'status': 'error',
+            'message': 'Invalid request: No JSON body provided or invalid JSON format.'
+        }), 400)
+
+    prompt = request_data.get('prompt', '').strip()
+    if not prompt:
+        return None, None, (jsonify({'status': 'error', 'message': 'Please provide a prompt for the image.'}), 400)
+    return request_data, prompt, None
+
+
+@async_app.after_request
+async def record_first_response(response):
+    startup.mark_first_response()
+    return response
+
+
+@async_app.before_request
+async def start_request_metrics():
+    if metrics.METRICS_ENABLED:
+        g.request_started = time.perf_counter()
+        metrics.start_request()
+
+
+@async_app.after_request
+async def record_request_metrics(response):
+    """Same route latency histogram and Server-Timing header as the Flask app."""
+    started = g.pop('request_started', None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        app_module.REQUEST_LATENCY.observe(elapsed, route, request.method, str(response.status_code))
+        response.headers['Server-Timing'] = metrics.server_timing_header(elapsed)
+    metrics.finish_request()
+    return response
+
+
+@async_app.before_request
+async def admit_generation_request():
+    """Same rate limit and fair-queued slot as the Flask app; waiting does not hold a thread."""
+    if not ADMISSION_ENABLED or request.endpoint not in app_module.ADMISSION_SLOT_ENDPOINTS:
+        return None
+    client = identify_client(request.headers, request.remote_addr)
+    set_current_client(client)
+    try:
+        request_data = await request.get_json(silent=True)
+        cost = app_module.admission_cost(request.endpoint, request_data)
+        app_module.admission.check_rate(*client, cost=cost)
+        if cost == 1:  # A multi-image request takes one slot per candidate instead
+            with metrics.stage('queue'):
+                g.admission_granted = await app_module.admission.acquire_async(*client)
+    except RateLimitedError as e:
+        return jsonify({
+            'status': 'error',
+            'message': 'Too many requests, please retry later.',
+            'reason': e.reason,
+            'retry_after': e.retry_after
+        }), 429, {'Retry-After': str(e.retry_after)}
+    return None
+
+
+@async_app.teardown_request
+async def release_admission_slot(error=None):
+    granted = g.pop('admission_granted', None)
+    if granted is not None:
+        app_module.admission.release(granted)
+
+
+@asynccontextmanager
+async def admission_slot(client):
+    """Async version of app.admission_slot: waits for the slot without holding a thread."""
+    if not ADMISSION_ENABLED or client is None:
+        yield
+        return
+    granted = await app_module.admission.acquire_async(*client)
+    try:
+        yield
+    finally:
+        app_module.admission.release(granted)
+
+
+@async_app.route('/', methods=['GET'])
+async def index():
+    """Renders the main HTML page."""
+    return await render_template('index.html')
+
+
+@async_app.route('/static/<path:filename>')
+async def static_files(filename):
+    """Serve static files (like CSS, JS)."""
+    response = await send_from_directory('static', filename)
+    response.headers['Cache-Control'] = app_module.static_cache_control(filename, request.args.get('v'))
+    return response
+
+
+def image_json_response(result, image_data):
+    """Async counterpart of app.image_json_response(): streams the JSON with the base64 image in chunks."""
+    async def body():
+        # Each chunk is a fraction of a millisecond to encode, so it runs on the loop rather than a thread
+        for chunk in app_module.iter_image_json(result, image_data):
+            yield chunk
+
+    return Response(body(), status=200, mimetype='application/json',
+                    headers={'Content-Length': str(app_module.image_json_length(result, image_data))})
+
+
+@async_app.route('/generate_and_upload', methods=['POST'])
+async def generate_and_upload():
+    """Async version of app.generate_and_upload (same request and response formats)."""
+    try:
+        request_data, prompt, error = await _read_generation_request()
+        if error:
+            return error
+
+        use_cache = not request_data.get('bypass_cache', False)
+        response_mode = app_module.negotiate_response_mode(request)
+        if response_mode is None:
+            return jsonify({
+                'status': 'error',
+                'message': f"Invalid response_mode. Use one of: {', '.join(app_module.RESPONSE_MODES)}."
+            }), 400
+
+        candidates = app_module.parse_candidates(request_data)
+        if candidates is None:
+            return jsonify({'status': 'error', 'message': app_module.INVALID_CANDIDATES_MESSAGE}), 400
+        if candidates > 1:
+            if response_mode == 'binary':
+                return jsonify({'status': 'error', 'message': 'Use base64 or url response_mode with candidates.'}), 400
+            result, images = await generate_and_upload_images_async(
+                prompt, request_data.get('filename', ''), candidates, use_cache=use_cache
+            )
+            if not images:
+                status, headers = app_module.generation_error_status()
+                return jsonify(result), status, headers
+            for entry, image_data in zip(result['images'], images):
+                if app_module.includes_image_data(entry, response_mode):
+                    entry['image_data'] = app_module.encode_image_base64(image_data)
+            return jsonify(result), 200
+
+        result, image_data = await generate_and_upload_image_async(
+            prompt, request_data.get('filename', ''), use_cache=use_cache
+        )
+        if image_data is None:
+            status, headers = app_module.generation_error_status()
+            return jsonify(result), status, headers
+        if response_mode == 'binary':
+            return Response(image_data, status=200, mimetype='image/png',
+                            headers=app_module.binary_image_headers(result))
+
+        if app_module.includes_image_data(result, response_mode):
+            return image_json_response(result, image_data)
+        return jsonify(result), 200
+    except Exception as e:
+        print(f"Error processing request: {e}")
+        return jsonify({'status': 'error', 'message': f'Error processing request: {e}'}), 500
+
+
+@async_app.route('/generate_image', methods=['POST'])
+async def generate_image_route():
+    """Async version of the legacy /generate_image endpoint."""
+    try:
+        request_data, prompt, error = await _read_generation_request()
+        if error:
+            return error
+
+        response_mode = app_module.negotiate_response_mode(request)
+        if response_mode not in ('base64', 'binary'):
+            return jsonify({'status': 'error', 'message': 'Invalid response_mode. Use base64 or binary.'}), 400
+
+        use_cache = not request_data.get('bypass_cache', False)
+        image_data, text_response = await gen_image_async(prompt, use_cache=use_cache)
+        if not image_data:
+            status, headers = app_module.generation_error_status()
+            return jsonify({'status': 'error', 'message': text_response}), status, headers
+
+        result = {
+            'status': 'success',
+            'message': 'Image generated successfully!',
+            'text_response': text_response
+        }
+        if response_mode == 'binary':
+            return Response(image_data, status=200, mimetype='image/png',
+                            headers=app_module.binary_image_headers(result))
+        return image_json_response(result, image_data)
+    except Exception as e:
+        print(f"Error processing request: {e}")
+        return jsonify({'status': 'error', 'message': f'Error processing request: {e}'}), 500
+
+
+@async_app.route('/get_saved_prompts', methods=['GET'])
+async def get_saved_prompts():
+    """Async version of app.get_saved_prompts (cache first, then async Firestore)."""
+    try:
+        await asyncio.to_thread(app_module.wait_for_firebase)
+        if not app_module.db:
+            return jsonify({
+                'success': False,
+                'message': 'Database connection not available',
+                'prompts': []
+            }), 500
+
+        try:
+            limit = int(request.args.get('limit', app_module.PROMPTS_PAGE_SIZE))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'limit must be an integer', 'prompts': []}), 400
+        limit = max(1, min(limit, app_module.PROMPTS_MAX_PAGE_SIZE))
+
+        page_token = request.args.get('page_token')
+        cursor = None
+        if page_token:
+            try:
+                cursor = app_module.decode_page_token(page_token)
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Invalid page token: {e}")
+                return jsonify({'success': False, 'message': 'Invalid page_token', 'prompts': []}), 400
+
+        page = app_module.prompts_cache.get_page(limit, cursor) if app_module.PROMPTS_CACHE_ENABLED else None
+        version = None
+        if page is not None:
+            prompts_list, next_cursor, version = page
+            next_page_token = app_module.encode_page_token(*next_cursor) if next_cursor else None
+        else:
+            prompts_list, next_page_token = await fetch_prompts_page_async(limit, cursor)
+
+        return await json_with_etag({
+            'success': True,
+            'message': f'Found {len(prompts_list)} saved prompts',
+            'prompts': prompts_list,
+            'next_page_token': next_page_token,
+            'has_more': next_page_token is not None
+        }, version, ('page', limit, page_token or ''))
+
+    except Exception as e:
+        print(f"Error fetching saved prompts: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Error fetching saved prompts: {str(e)}',
+            'prompts': []
+        }), 500
+
+
+@async_app.route('/get_prompt/<prompt_id>', methods=['GET'])
+async def get_specific_prompt(prompt_id):
+    """Async version of app.get_specific_prompt."""
+    try:
+        await asyncio.to_thread(app_module.wait_for_firebase)
+        if not app_module.db:
+            return jsonify({
+                'success': False,
+                'message': 'Database connection not available'
+            }), 500
+
+        cached = app_module.prompts_cache.get_prompt(prompt_id) if app_module.PROMPTS_CACHE_ENABLED else None
+        if cached is not None:
+            prompt_data, version = cached
+            return await json_with_etag({'success': True, 'prompt': prompt_data}, version, ('prompt', prompt_id))
+
+        with metrics.stage('firestore', app_module.FIRESTORE_QUERY_LATENCY, 'prompt'):
+            doc = await get_async_db().collection('agent_responses').document(prompt_id).get(
+                field_paths=app_module.PROMPT_FIELDS
+            )
+        app_module.FIRESTORE_DOCUMENTS_READ.inc(1 if doc.exists else 0, 'prompt')
+        if not doc.exists:
+            return jsonify({
+                'success': False,
+                'message': 'Prompt not found'
+            }), 404
+
+        return await json_with_etag({
+            'success': True,
+            'prompt': app_module.prompt_data_from_doc(doc)
+        })
+
+    except Exception as e:
+        print(f"Error fetching specific prompt: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Error fetching prompt: {str(e)}'
+        }), 500
+
+
+@async_app.route('/stats', methods=['GET'])
+async def get_stats():
+    """Per-worker counters, including the async request coalescing."""
+    stats = app_module.collect_stats()
+    stats['async_generation_flight'] = generation_flight.get_stats()
+    return jsonify(stats)
+
+
+wsgi_fallback = WsgiToAsgi(app_module.app)
+if not startup.clients_built_in_workers():  # Under gunicorn, post_worker_init starts it after fork
+    app_module.firebase_init.start()  # Build the Firebase clients in the background of this worker
+
+
+async def application(scope, receive, send):
+    """ASGI entry point: async routes go to Quart, the rest to the Flask app."""
+    if scope['type'] != 'http' or ASYNC_ROUTES.match(scope['path']):
+        await async_app(scope, receive, send)
+    else:
+        await wsgi_fallback(scope, receive, send)
@@ -0,0 +1,133 @@
+"""
+Load-tests the sync (gunicorn + Flask) and async (uvicorn + asgi_app) servers
+against a local fake Gemini with the same latency, and reports throughput
+and latency percentiles for POST /generate_and_upload.
+
+Both servers run as subprocesses with FIREBASE_DISABLED=true, so only
+generation and response handling are exercised. Every request uses a unique
+prompt with bypass_cache, so the cache and request coalescing do not help.
+
+Usage: python benchmarks/async_vs_sync.py [--concurrency 64] [--requests 512]
+                                          [--latency-ms 800] [--image-kb 256]
+                                          [--workers 2] [--threads 8]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_gemini import FakeGeminiServer  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_commands(port, workers, threads):
+    bind = f"127.0.0.1:{port}"
+    return {
+        'sync': [sys.executable, '-m', 'gunicorn', '--worker-class', 'gthread',
+                 '--threads', str(threads), '--workers', str(workers), '--bind', bind, 'app:app'],
+        'async': [sys.executable, '-m', 'uvicorn', 'asgi_app:application',
+                  '--workers', str(workers), '--port', str(port), '--log-level', 'warning'],
+    }
+
+
+def wait_until_up(base_url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(f"{base_url}/stats", timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not start")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def drive(base_url, label, concurrency, requests):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    client = httpx.Client(base_url=base_url, limits=limits, timeout=300)
+
+    def one(i):
+        start = time.perf_counter()
+        response = client.post('/generate_and_upload?response_mode=url', json={
+            'prompt': f'{label} load test prompt {i} {time.time_ns()}',
+            'bypass_cache': True,
+        })
+        return time.perf_counter() - start, response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    client.close()
+
+    latencies = [latency for latency, status in results if status == 200]
+    errors = len(results) - len(latencies)
+    return {
+        'requests': requests,
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+    }
+
+
+def run(concurrency, requests, latency_ms, image_kb, workers, threads):
+    gemini = FakeGeminiServer(latency_ms=latency_ms, image_kb=image_kb).start()
+    env = dict(os.environ, GEMINI_API_KEY='fake', GEMINI_BASE_URL=gemini.base_url,
+               FIREBASE_DISABLED='true', ADMISSION_ENABLED='false', GEMINI_MAX_CONNECTIONS=str(concurrency),
+               GEMINI_MAX_KEEPALIVE=str(concurrency))
+
+    results = {}
+    port = free_port()
+    for label, command in server_commands(port, workers, threads).items():
+        base_url = f"http://127.0.0.1:{port}"
+        server = subprocess.Popen(command, cwd=ROOT, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_up(base_url)
+            drive(base_url, label, min(concurrency, 8), min(requests, 16))  # Warm up clients and pools
+            results[label] = drive(base_url, label, concurrency, requests)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    gemini.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=64, help='Concurrent client connections')
+    parser.add_argument('--requests', type=int, default=512, help='Requests per server')
+    parser.add_argument('--latency-ms', type=float, default=800, help='Fake Gemini response delay')
+    parser.add_argument('--image-kb', type=int, default=256, help='Size of the fake PNG in KiB')
+    parser.add_argument('--workers', type=int, default=2, help='Worker processes per server')
+    parser.add_argument('--threads', type=int, default=8, help='Threads per gunicorn worker (sync only)')
+    args = parser.parse_args()
+
+    results = run(args.concurrency, args.requests, args.latency_ms, args.image_kb, args.workers, args.threads)
+    print(f"{'server':<8} {'rps':>8} {'p50 ms':>10} {'p99 ms':>10} {'errors':>8}")
+    for label, row in results.items():
+        print(f"{label:<8} {row['rps']:>8} {row['p50_ms']!s:>10} {row['p99_ms']!s:>10} {row['errors']:>8}")
+    print(json.dumps({'settings': vars(args), 'servers': results}))
+
+
+if __name__ == '__main__':
+    main()
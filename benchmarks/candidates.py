@@ -0,0 +1,92 @@
+"""
+Compares the latency of multi-image requests ({"candidates": K}) with
+asking for the same K images one request at a time.
+
+Gemini is replaced by an in-process fake client that sleeps --latency-ms
+per call and returns one PNG part, and Firebase Storage by the in-memory
+bucket, so the numbers show how well the K Gemini calls and uploads of a
+request overlap. Ideally a K-candidate request takes about as long as a
+single image.
+
+Usage: python benchmarks/candidates.py [--latency-ms 500] [--max-candidates 4] [--requests 5]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('FIREBASE_DISABLED', 'true')  # The fakes below stand in for Firebase
+os.environ.setdefault('ADMISSION_ENABLED', 'false')  # One client sends every request
+os.environ.setdefault('IMAGE_VARIANTS_ENABLED', 'false')
+
+import app as app_module  # noqa: E402
+import gemini_client  # noqa: E402
+from benchmarks.fakes import FakeBucket, FakeGeminiClient, make_image_bytes  # noqa: E402
+
+
+def fake_response(image_data):
+    """The shape of a generate_content response that parse_generation_response() reads."""
+    parts = [
+        SimpleNamespace(text='benchmark image', inline_data=None),
+        SimpleNamespace(text=None, inline_data=SimpleNamespace(data=image_data, mime_type='image/png')),
+    ]
+    return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=parts), finish_reason='STOP')])
+
+
+def timed_request(client, i, candidates):
+    started = time.perf_counter()
+    response = client.post('/generate_and_upload?response_mode=url', json={
+        'prompt': f'candidates benchmark {i} {time.time_ns()}', 'filename': 'bench',
+        'bypass_cache': True, 'candidates': candidates,
+    })
+    assert response.status_code == 200, response.data[:200]
+    images = response.get_json().get('images')
+    return time.perf_counter() - started, len(images) if images is not None else 1
+
+
+def run(latency_ms, max_candidates, requests, image_kb):
+    fake = FakeGeminiClient(latency=latency_ms / 1000.0, result=fake_response(make_image_bytes(image_kb * 1024)))
+    gemini_client.get_client = lambda api_key: fake
+    app_module.api_key = 'fake'
+    app_module.firebase_bucket = FakeBucket()
+    client = app_module.app.test_client()
+    timed_request(client, -1, 1)  # Warm up
+
+    results = {}
+    for k in range(1, max_candidates + 1):
+        batched = [timed_request(client, i, k) for i in range(requests)]
+        # The same K images as K single-image requests, one after another
+        serial = [sum(timed_request(client, i, 1)[0] for _ in range(k)) for i in range(requests)]
+        batched_ms = sorted(latency for latency, _ in batched)[len(batched) // 2] * 1000
+        serial_ms = sorted(serial)[len(serial) // 2] * 1000
+        results[k] = {
+            'images': batched[0][1],
+            'candidates_p50_ms': round(batched_ms, 1),
+            'serial_p50_ms': round(serial_ms, 1),
+            'vs_single_image': round(batched_ms / (results[1]['candidates_p50_ms'] if k > 1 else batched_ms), 2),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency-ms', type=float, default=500, help='Fake Gemini call duration')
+    parser.add_argument('--max-candidates', type=int, default=app_module.GENERATION_MAX_CANDIDATES,
+                        help='Largest K to measure')
+    parser.add_argument('--requests', type=int, default=5, help='Requests per K')
+    parser.add_argument('--image-kb', type=int, default=1500, help='Size of the fake PNG in KiB')
+    args = parser.parse_args()
+
+    results = run(args.latency_ms, args.max_candidates, args.requests, args.image_kb)
+    print(f"{'K':>3} {'images':>7} {'candidates p50 ms':>18} {'serial p50 ms':>14} {'x single':>9}")
+    for k, row in results.items():
+        print(f"{k:>3} {row['images']:>7} {row['candidates_p50_ms']:>18} {row['serial_p50_ms']:>14} "
+              f"{row['vs_single_image']:>9}")
+    print(json.dumps({'latency_ms': args.latency_ms, 'requests': args.requests, 'candidates': results}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Checks that sequential generations reuse the pooled Gemini connection.
+
+Starts the fake Gemini server (benchmarks/fake_gemini.py), points the real
+google-genai client at it through GEMINI_BASE_URL and runs --calls
+sequential gen_image() calls with the cache bypassed. With the shared,
+keep-alive client from gemini_client.py they should all go over one or two
+connections. The script reports the connection counters and exits non-zero
+if more than --max-connections were opened.
+
+Usage: python benchmarks/connection_reuse.py [--calls 20] [--max-connections 2] [--latency-ms 20]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('FIREBASE_DISABLED', 'true')  # Only Gemini is exercised
+
+from benchmarks.fake_gemini import FakeGeminiServer  # noqa: E402
+
+
+def run(calls, latency_ms, image_kb):
+    server = FakeGeminiServer(latency_ms=latency_ms, image_kb=image_kb).start()
+    os.environ['GEMINI_BASE_URL'] = server.base_url  # Read when the shared client is built
+
+    import app as app_module
+    import gemini_client
+    app_module.api_key = 'fake'
+    gemini_client.reset_clients()
+    before = gemini_client.get_stats()
+
+    started = time.perf_counter()
+    failures = 0
+    for i in range(calls):
+        image_data, _ = app_module.gen_image(f'connection reuse {i} {time.time_ns()}', use_cache=False)
+        failures += image_data is None
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    after = gemini_client.get_stats()
+    return {
+        'calls': calls,
+        'failures': failures,
+        'upstream_requests': server.requests,
+        'connections_opened': after['connections_opened'] - before['connections_opened'],
+        'connection_reuses': after['connection_reuses'] - before['connection_reuses'],
+        'client_constructions': after['client_constructions'] - before['client_constructions'],
+        'avg_call_ms': round(elapsed * 1000 / calls, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=20, help='Sequential gen_image() calls')
+    parser.add_argument('--max-connections', type=int, default=2, help='Most connections allowed for all calls')
+    parser.add_argument('--latency-ms', type=float, default=20, help='Fake Gemini response delay')
+    parser.add_argument('--image-kb', type=int, default=64, help='Size of the fake PNG in KiB')
+    args = parser.parse_args()
+
+    result = run(args.calls, args.latency_ms, args.image_kb)
+    print(f"{result['calls']} calls: {result['connections_opened']} connections opened, "
+          f"{result['connection_reuses']} reused, {result['failures']} failed, {result['avg_call_ms']} ms/call")
+    print(json.dumps(result))
+    if (result['failures'] or result['connections_opened'] > args.max_connections
+            or result['connections_opened'] + result['connection_reuses'] < args.calls):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
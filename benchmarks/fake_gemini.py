@@ -0,0 +1,97 @@
+"""
+Local stand-in for the Gemini generateContent REST endpoint.
+
+Answers every POST .../models/<model>:generateContent with one candidate
+holding a text part and an inline PNG, after a configurable delay, so the
+real google-genai client (sync or aio) can be pointed at it through
+GEMINI_BASE_URL.
+
+Usage: python benchmarks/fake_gemini.py [--port 8090] [--latency-ms 800] [--image-kb 1500]
+"""
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import make_png_bytes  # noqa: E402
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        if ':generateContent' not in self.path:
+            self.send_error(404)
+            return
+
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests += 1
+        body = self.server.response_body
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency_ms=800, image_kb=1500):
+        super().__init__(('127.0.0.1', port), FakeGeminiHandler)
+        self.latency = latency_ms / 1000.0
+        self.lock = threading.Lock()
+        self.requests = 0
+        image_b64 = base64.b64encode(make_png_bytes(image_kb * 1024)).decode('ascii')
+        self.response_body = json.dumps({
+            'candidates': [{
+                'content': {
+                    'role': 'model',
+                    'parts': [
+                        {'text': 'Here is your image.'},
+                        {'inlineData': {'mimeType': 'image/png', 'data': image_b64}},
+                    ],
+                },
+                'finishReason': 'STOP',
+            }],
+        }).encode('utf-8')
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        """Serves on a daemon thread and returns self."""
+        threading.Thread(target=self.serve_forever, name='fake-gemini', daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency-ms', type=float, default=800, help='Delay before each response')
+    parser.add_argument('--image-kb', type=int, default=1500, help='Size of the returned PNG in KiB')
+    args = parser.parse_args()
+
+    server = FakeGeminiServer(args.port, args.latency_ms, args.image_kb)
+    print(f"Fake Gemini listening on {server.base_url} (set GEMINI_BASE_URL to this)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,339 @@
+"""
+In-process stand-ins for the external services used by app.py, so the
+benchmarks can run offline. They implement only what the app calls.
+"""
+import io
+import os
+import time
+import zlib
+import bisect
+import random
+import struct
+import threading
+from datetime import datetime, timedelta, timezone
+
+
+def make_image_bytes(size):
+    """Returns `size` bytes starting with a PNG signature (incompressible payload)."""
+    signature = b'\x89PNG\r\n\x1a\n'
+    return signature + os.urandom(max(size - len(signature), 0))
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+
+def make_png_bytes(size):
+    """
+    Returns a valid RGB noise PNG of roughly `size` bytes. Noise does not
+    compress, so the file is about as large as the raw pixels, and Pillow
+    can decode it (e.g. for the variant encoders).
+    """
+    side = max(1, int((max(size, 64) / 3) ** 0.5))
+    rows = b''.join(b'\x00' + os.urandom(side * 3) for _ in range(side))  # Filter byte 0 per row
+    header = struct.pack('>IIBBBBB', side, side, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + _png_chunk(b'IHDR', header)
+            + _png_chunk(b'IDAT', zlib.compress(rows, 1)) + _png_chunk(b'IEND', b''))
+
+
+class FakeBlob:
+    """Minimal google.cloud.storage.Blob stand-in."""
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.metadata = None
+        self.cache_control = None
+        self.content_type = None
+        self.data = None
+        self.public = False
+
+    @property
+    def public_url(self):
+        return f"https://storage.googleapis.com/{self.bucket.name}/{self.name}"
+
+    def upload_from_file(self, file_obj, content_type=None, size=None, predefined_acl=None, **kwargs):
+        self.bucket._record('upload_from_file')
+        self.data = file_obj.read() if size is None else file_obj.read(size)
+        self.content_type = content_type
+        if predefined_acl == 'publicRead':
+            self.public = True
+        self.bucket._store(self)
+
+    def make_public(self):
+        self.bucket._record('make_public')
+        self.public = True
+
+
+class FakeBucket:
+    """
+    Minimal google.cloud.storage.Bucket stand-in that keeps blobs in memory.
+    call_counts() tells how often each method that costs a Storage round trip
+    was called (bucket.blob() is local), so checks can assert the calls a
+    request makes.
+    """
+
+    def __init__(self, name='fake-bucket'):
+        self.name = name
+        self._lock = threading.Lock()
+        self._blobs = {}
+        self._calls = {}
+        self.upload_count = 0
+
+    def _record(self, method):
+        with self._lock:
+            self._calls[method] = self._calls.get(method, 0) + 1
+
+    def call_counts(self):
+        """Returns method name -> number of calls so far."""
+        with self._lock:
+            return dict(self._calls)
+
+    def _store(self, blob):
+        with self._lock:
+            self._blobs[blob.name] = blob
+            self.upload_count += 1
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        self._record('get_blob')
+        with self._lock:
+            return self._blobs.get(name)
+
+    def list_blobs(self, prefix=None, max_results=None, page_token=None, page_size=None, **kwargs):
+        self._record('list_blobs')
+        return FakeBlobIterator(self, prefix, max_results, page_token, page_size)
+
+
+class FakeBlobIterator:
+    """
+    Stand-in for the page iterator returned by Bucket.list_blobs: iterating
+    yields blobs, .pages yields one list per list call (at most 1000 blobs,
+    like GCS) and .next_page_token is the name to resume after.
+    """
+
+    PAGE_LIMIT = 1000
+
+    def __init__(self, bucket, prefix, max_results, page_token, page_size):
+        self._bucket = bucket
+        self._prefix = prefix
+        self._max_results = max_results
+        self._page_size = min(page_size or self.PAGE_LIMIT, self.PAGE_LIMIT)
+        self.next_page_token = page_token
+        self.calls = 0
+
+    @property
+    def pages(self):
+        returned = 0
+        while True:
+            size = self._page_size
+            if self._max_results is not None:
+                size = min(size, self._max_results - returned)
+                if size <= 0:
+                    return
+            with self._bucket._lock:
+                names = sorted(name for name in self._bucket._blobs
+                               if (self._prefix is None or name.startswith(self._prefix))
+                               and (self.next_page_token is None or name > self.next_page_token))
+                page = [self._bucket._blobs[name] for name in names[:size]]
+            self.calls += 1
+            self.next_page_token = page[-1].name if len(names) > size else None
+            returned += len(page)
+            yield page
+            if self.next_page_token is None:
+                return
+
+    def __iter__(self):
+        for page in self.pages:
+            yield from page
+
+
+class FakeDocumentSnapshot:
+    """Minimal Firestore DocumentSnapshot stand-in."""
+
+    def __init__(self, doc_id, data, fields=None):
+        self.id = doc_id
+        self.exists = data is not None
+        if data is not None and fields is not None:
+            data = {key: value for key, value in data.items() if key in fields}
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocumentReference:
+    def __init__(self, collection, doc_id):
+        self._collection = collection
+        self.id = doc_id
+
+    def get(self, field_paths=None):
+        return FakeDocumentSnapshot(self.id, self._collection._docs.get(self.id), field_paths)
+
+
+class FakeQuery:
+    """
+    Firestore query stand-in supporting the chains app.py builds:
+    select / order_by / start_after / limit / stream. Results ordered by
+    (created_at, __name__) are served from a sorted index with a binary
+    search for the cursor, like a real Firestore index seek.
+    """
+
+    def __init__(self, collection, fields=None, orders=(), cursor=None, limit_count=None, after=None):
+        self._collection = collection
+        self._fields = fields
+        self._orders = tuple(orders)
+        self._cursor = cursor
+        self._limit = limit_count
+        self._after = after  # created_at lower bound from where('created_at', '>', ...)
+
+    def _copy(self, **changes):
+        state = {
+            'fields': self._fields,
+            'orders': self._orders,
+            'cursor': self._cursor,
+            'limit_count': self._limit,
+            'after': self._after,
+        }
+        state.update(changes)
+        return FakeQuery(self._collection, **state)
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def start_after(self, values):
+        return self._copy(cursor=(values['created_at'], values['__name__']))
+
+    def limit(self, count):
+        return self._copy(limit_count=count)
+
+    def where(self, filter):
+        # Only the created_at > value filter used by the prompts cache poller
+        assert filter.field_path == 'created_at' and filter.op_string == '>'
+        return self._copy(after=filter.value)
+
+    def stream(self):
+        keys = self._collection._index()
+        descending = bool(self._orders) and self._orders[0][1] == 'DESCENDING'
+        if descending:
+            end = bisect.bisect_left(keys, self._cursor) if self._cursor else len(keys)
+            positions = range(end - 1, -1, -1)
+        else:
+            start = bisect.bisect_right(keys, self._cursor) if self._cursor else 0
+            if self._after is not None:
+                start = max(start, bisect.bisect_right(keys, (self._after, chr(0x10FFFF))))
+            positions = range(start, len(keys))
+        for count, position in enumerate(positions):
+            if self._limit is not None and count >= self._limit:
+                return
+            doc_id = keys[position][1]
+            yield FakeDocumentSnapshot(doc_id, self._collection._docs[doc_id], self._fields)
+
+
+class FakeCollection(FakeQuery):
+    """In-memory Firestore collection; documents are dicts with a created_at datetime."""
+
+    def __init__(self):
+        super().__init__(self)
+        self._docs = {}
+        self._keys = None
+
+    def _index(self):
+        if self._keys is None:
+            self._keys = sorted((data['created_at'], doc_id) for doc_id, data in self._docs.items())
+        return self._keys
+
+    def document(self, doc_id):
+        return FakeDocumentReference(self, doc_id)
+
+    def on_snapshot(self, callback):
+        # No change feed here; callers fall back to polling
+        raise NotImplementedError('FakeCollection does not support listeners')
+
+    def set(self, doc_id, data):
+        self._docs[doc_id] = data
+        self._keys = None
+
+
+class FakeFirestore:
+    """Minimal Firestore client stand-in holding named in-memory collections."""
+
+    def __init__(self):
+        self._collections = {}
+
+    def collection(self, name):
+        return self._collections.setdefault(name, FakeCollection())
+
+
+def make_user_images(bucket, user_uid, count, size=2048):
+    """Stores `count` small PNG blobs under user_images/<user_uid>/ in bucket."""
+    data = make_png_bytes(size)
+    for i in range(count):
+        blob = bucket.blob(f"user_images/{user_uid}/image_{i:05d}.png")
+        blob.upload_from_file(io.BytesIO(data), content_type='image/png', predefined_acl='publicRead')
+    return bucket
+
+
+def make_agent_responses(db, count):
+    """Fills db's agent_responses collection with `count` documents, one minute apart."""
+    collection = db.collection('agent_responses')
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for i in range(count):
+        collection.set(f"doc{i:08d}", {
+            'agent_name': f"Agent {i % 17}",
+            'response_content': f"A generated prompt number {i} describing a scene " * 3,
+            'prompt_text': f"prompt {i}",
+            'created_at': start + timedelta(minutes=i),
+            'raw_payload': 'x' * 512,  # Unselected field, skipped by select()
+        })
+    return collection
+
+
+class FakeGeminiModels:
+    """
+    Stand-in for genai.Client().models with injected latency and errors.
+
+    Each call sleeps for `latency` seconds, or `slow_latency` with probability
+    `slow_rate` (a heavy tail), then raises ConnectionError with probability
+    `error_rate`, otherwise returns `result`. The first `slow_first` calls
+    are always slow and the first `fail_first` always fail, for scripted checks.
+    """
+
+    def __init__(self, latency=0.05, slow_latency=1.0, slow_rate=0.0, error_rate=0.0, result='image', seed=None,
+                 slow_first=0, fail_first=0):
+        self.latency = latency
+        self.slow_latency = slow_latency
+        self.slow_rate = slow_rate
+        self.error_rate = error_rate
+        self.slow_first = slow_first
+        self.fail_first = fail_first
+        self.result = result
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def _draw(self):
+        with self._lock:
+            self.calls += 1
+            slow = self._random.random() < self.slow_rate or self.calls <= self.slow_first
+            fail = self._random.random() < self.error_rate or self.calls <= self.fail_first
+        return (self.slow_latency if slow else self.latency), fail
+
+    def generate_content(self, **kwargs):
+        delay, fail = self._draw()
+        time.sleep(delay)
+        if fail:
+            raise ConnectionError("injected upstream failure")
+        return self.result
+
+
+class FakeGeminiClient:
+    """genai.Client stand-in exposing only .models.generate_content."""
+
+    def __init__(self, **kwargs):
+        self.models = FakeGeminiModels(**kwargs)
@@ -0,0 +1,218 @@
+"""
+Exercises the Gemini resilience layer (resilience.ResilientCall) against a
+fake client that injects latency and errors.
+
+Scenarios:
+  tail      heavy-tailed latency, without and with hedging (p50/p99/max)
+  errors    random connection errors, showing retries turning them into successes
+  outage    every call fails, showing the circuit breaker failing fast
+
+Then scripted checks with exact expectations, and the script exits non-zero
+if any fails:
+  retries      two failures then a success: 3 upstream calls, 2 retries; all
+               failing: max_attempts upstream calls, then the error
+  hedge        a slow first attempt: one hedge fires and wins, well before
+               the slow attempt would have returned
+  breaker      closed -> open after failure_threshold failures, fail fast,
+               half-open probe failing -> open, probe succeeding -> closed
+  saturation   a timed-out attempt keeps its worker; with every worker busy
+               the next call is rejected without reaching upstream
+
+Usage: python benchmarks/gemini_resilience.py [--calls 200] [--concurrency 8]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import FakeGeminiClient  # noqa: E402
+from resilience import (CLOSED, OPEN, AttemptRejectedError, AttemptTimeoutError,  # noqa: E402
+                        CircuitOpenError, ResilientCall)
+
+
+def is_retryable(error):
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def drive(resilient, client, calls, concurrency):
+    def one(_):
+        started = time.perf_counter()
+        try:
+            resilient.call(client.models.generate_content, model='fake', contents='prompt')
+            outcome = 'ok'
+        except CircuitOpenError:
+            outcome = 'rejected'
+        except Exception:
+            outcome = 'error'
+        return time.perf_counter() - started, outcome
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(calls)))
+    latencies = [latency for latency, _ in results]
+    outcomes = [outcome for _, outcome in results]
+    stats = resilient.get_stats()
+    return {
+        'ok': outcomes.count('ok'),
+        'errors': outcomes.count('error'),
+        'rejected': outcomes.count('rejected'),
+        'upstream_calls': client.models.calls,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'max_ms': round(max(latencies) * 1000, 1),
+        'retries': stats['retries'],
+        'hedges': stats['hedges'],
+        'hedge_wins': stats['hedge_wins'],
+        'breaker': stats['breaker'],
+    }
+
+
+def run(calls, concurrency):
+    results = {}
+    for hedge in (False, True):
+        client = FakeGeminiClient(latency=0.05, slow_latency=1.0, slow_rate=0.05, seed=1)
+        resilient = ResilientCall('fake-gemini', is_retryable, attempt_timeout=5, hedge=hedge,
+                                  hedge_min_delay=0.1, hedge_min_samples=10)
+        results['tail_hedged' if hedge else 'tail_plain'] = drive(resilient, client, calls, concurrency)
+
+    client = FakeGeminiClient(latency=0.02, error_rate=0.2, seed=2)
+    resilient = ResilientCall('fake-gemini', is_retryable, attempt_timeout=5, backoff=0.01, max_delay=0.1,
+                              failure_threshold=1000)
+    results['errors'] = drive(resilient, client, calls, concurrency)
+
+    client = FakeGeminiClient(latency=0.02, error_rate=1.0, seed=3)
+    resilient = ResilientCall('fake-gemini', is_retryable, attempt_timeout=5, backoff=0.01, max_delay=0.1,
+                              failure_threshold=5, reset_timeout=60)
+    results['outage'] = drive(resilient, client, calls, concurrency)
+    return results
+
+
+def outcome_of(resilient, client):
+    """Makes one call; returns 'ok' or the name of the exception it raised."""
+    try:
+        resilient.call(client.models.generate_content, model='fake', contents='prompt')
+        return 'ok'
+    except Exception as e:
+        return type(e).__name__
+
+
+def check_retries():
+    client = FakeGeminiClient(latency=0.001, fail_first=2)
+    resilient = ResilientCall('fake-gemini', is_retryable, attempt_timeout=5, max_attempts=3,
+                              backoff=0.001, max_delay=0.01, failure_threshold=100)
+    observed = [outcome_of(resilient, client)]
+    stats = resilient.get_stats()
+    observed += [client.models.calls, stats['attempts'], stats['retries'], stats['failures']]
+
+    client = FakeGeminiClient(latency=0.001, error_rate=1.0)
+    resilient = ResilientCall('fake-gemini', is_retryable, attempt_timeout=5, max_attempts=3,
+                              backoff=0.001, max_delay=0.01, failure_threshold=100)
+    observed.append(outcome_of(resilient, client))
+    stats = resilient.get_stats()
+    observed += [client.models.calls, stats['retries'], stats['failures']]
+    return observed, ['ok', 3, 3, 2, 0, 'ConnectionError', 3, 2, 1]
+
+
+def check_hedge():
+    client = FakeGeminiClient(latency=0.01, slow_latency=1.0, slow_first=1)
+    resilient = ResilientCall('fake-gemini', is_retryable, attempt_timeout=5, hedge=True,
+                              hedge_min_delay=0.05, hedge_min_samples=1000)
+    started = time.perf_counter()
+    observed = [outcome_of(resilient, client)]
+    elapsed = time.perf_counter() - started
+    stats = resilient.get_stats()
+    observed += [client.models.calls, stats['hedges'], stats['hedge_wins'], elapsed < 0.5]
+    return observed, ['ok', 2, 1, 1, True]
+
+
+def check_breaker():
+    client = FakeGeminiClient(latency=0.001, error_rate=1.0)
+    resilient = ResilientCall('fake-gemini', is_retryable, attempt_timeout=5, max_attempts=1,
+                              failure_threshold=3, reset_timeout=0.2)
+    observed = []
+
+    def step():
+        calls_before = client.models.calls
+        outcome = outcome_of(resilient, client)
+        observed.append((outcome, resilient.breaker.state, client.models.calls - calls_before))
+
+    for _ in range(3):
+        step()
+    step()  # Open: fails fast without an upstream call
+    time.sleep(0.25)
+    step()  # Half-open probe fails: open again
+    step()
+    time.sleep(0.25)
+    client.models.error_rate = 0.0
+    step()  # Half-open probe succeeds: closed
+    observed.append(resilient.breaker.get_stats()['opened'])
+    expected = [
+        ('ConnectionError', CLOSED, 1),
+        ('ConnectionError', CLOSED, 1),
+        ('ConnectionError', OPEN, 1),
+        ('CircuitOpenError', OPEN, 0),
+        ('ConnectionError', OPEN, 1),
+        ('CircuitOpenError', OPEN, 0),
+        ('ok', CLOSED, 1),
+        2,
+    ]
+    return observed, expected
+
+
+def check_saturation():
+    client = FakeGeminiClient(latency=0.3)
+    resilient = ResilientCall('fake-gemini', is_retryable, attempt_timeout=0.05, max_attempts=1,
+                              failure_threshold=100, workers=1)
+    observed = [outcome_of(resilient, client)]  # Times out; the attempt keeps the only worker
+    observed.append(outcome_of(resilient, client))
+    observed += [client.models.calls, resilient.get_stats()['rejected'], resilient.breaker.state]
+    time.sleep(0.35)
+    resilient.attempt_timeout = 5
+    observed += [outcome_of(resilient, client), client.models.calls]
+    expected = [AttemptTimeoutError.__name__, AttemptRejectedError.__name__, 1, 1, CLOSED, 'ok', 2]
+    return observed, expected
+
+
+CHECKS = {
+    'retries': check_retries,
+    'hedge': check_hedge,
+    'breaker': check_breaker,
+    'saturation': check_saturation,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=200, help='Calls per scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent callers')
+    args = parser.parse_args()
+
+    results = run(args.calls, args.concurrency)
+    print(f"{'scenario':<12} {'ok':>5} {'errors':>7} {'rejected':>9} {'upstream':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, row in results.items():
+        print(f"{name:<12} {row['ok']:>5} {row['errors']:>7} {row['rejected']:>9} {row['upstream_calls']:>9} "
+              f"{row['p50_ms']:>8} {row['p99_ms']:>8}")
+
+    checks = {}
+    for name, check in CHECKS.items():
+        observed, expected = check()
+        checks[name] = observed == expected
+        print(f"{name:<12} {'ok' if checks[name] else 'FAILED'}")
+        if not checks[name]:
+            print(f"  expected {expected}\n  observed {observed}")
+    print(json.dumps({'calls': args.calls, 'concurrency': args.concurrency, 'scenarios': results,
+                      'checks': checks}))
+    if not all(checks.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Measures history index search latency (history_index.HistoryIndex) at scale.
+
+Fills a temporary SQLite index with --entries synthetic generations (prompts
+drawn from a fixed vocabulary, so common words match a large share of the
+rows), then times full-text queries (rare, common and multi-word, and a
+word prefix like 'dra*') and prompt-prefix queries, reporting p50/p99/max
+per query type.
+
+It also rebuilds an index from an in-memory fake bucket holding single and
+multi-candidate generations with their variants (as backfill_storage()
+reads them after a redeploy), times the backfill and exits non-zero if any
+image is missed or a variant is attached to the wrong image.
+
+Usage: python benchmarks/history_search.py [--entries 1000000] [--queries 200] [--limit 50] [--backfill-images 5000]
+"""
+import os
+import sys
+import io
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history_index import HistoryIndex, GENERATED  # noqa: E402
+from benchmarks.fakes import FakeBucket  # noqa: E402
+
+VOCABULARY = (
+    'cat dog fox owl whale dragon robot castle forest desert ocean city mountain river garden '
+    'sunset night storm neon watercolor sketch portrait landscape cyberpunk medieval futuristic '
+    'golden silver crystal misty cozy ancient floating giant tiny glowing'
+).split()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def fill(index, entries, batch=10000):
+    rng = random.Random(1)
+    start = time.time() - entries  # One entry per second, ending now
+    for offset in range(0, entries, batch):
+        rows = []
+        for i in range(offset, min(offset + batch, entries)):
+            words = rng.sample(VOCABULARY, 6)
+            prompt = f"{' '.join(words)} scene {i}"
+            filename = f"{'_'.join(words[:3])}_{i:014d}.png"
+            rows.append({
+                'ref': filename,
+                'source': GENERATED,
+                'prompt': prompt,
+                'filename': filename,
+                'content_hash': f"{i:064x}",
+                'bytes': 1500000,
+                'image_url': f"https://storage.googleapis.com/bench/{filename}",
+                'variants': {'webp': f"https://storage.googleapis.com/bench/{filename[:-4]}_webp.webp"},
+                'created_at': start + i,
+            })
+        index.add_many(rows)
+
+
+def time_queries(index, queries, limit):
+    latencies = []
+    matched = 0
+    for query, mode in queries:
+        started = time.perf_counter()
+        results, _ = index.search(query, mode, limit)
+        latencies.append(time.perf_counter() - started)
+        matched += len(results)
+    return {
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3),
+        'avg_results': round(matched / len(queries), 1),
+    }
+
+
+def fill_bucket(bucket, images):
+    """
+    Uploads `images` generations named as app.py names them: every third one
+    is a 3-candidate request (<slug>_<ts>_<n>.png), each with a webp and a
+    thumb variant. Returns the expected {blob name: variant names}.
+    """
+    expected = {}
+    for i in range(images):
+        stem = f"bench_{i}_{time.strftime('%Y%m%d%H%M%S', time.gmtime(1735689600 + i))}"
+        names = [f"{stem}_{n}.png" for n in range(1, 4)] if i % 3 == 0 else [f"{stem}.png"]
+        for name in names:
+            uploads = [name] + [f"{name[:-4]}_{variant}.webp" for variant in ('webp', 'thumb')]
+            for upload in uploads:
+                bucket.blob(upload).upload_from_file(io.BytesIO(b'\x89PNG'), content_type='image/png')
+            expected[name] = {'webp', 'thumb'}
+    return expected
+
+
+def run_backfill(images):
+    bucket = FakeBucket()
+    expected = fill_bucket(bucket, images)
+    with tempfile.TemporaryDirectory() as directory:
+        index = HistoryIndex(os.path.join(directory, 'history.sqlite3'))
+        started = time.perf_counter()
+        added = index.backfill_storage(bucket)
+        backfill_s = time.perf_counter() - started
+        rows = index._connect().execute('SELECT filename, variants FROM history').fetchall()
+    indexed = {row['filename']: set(json.loads(row['variants'] or '{}')) for row in rows}
+    return {
+        'blobs': len(bucket._blobs),
+        'expected': len(expected),
+        'added': added,
+        'missing': len(set(expected) - set(indexed)),
+        'wrong_variants': sum(1 for name, variants in expected.items()
+                              if name in indexed and indexed[name] != variants),
+        'backfill_s': round(backfill_s, 2),
+    }
+
+
+def run(entries, queries, limit):
+    rng = random.Random(2)
+    with tempfile.TemporaryDirectory() as directory:
+        index = HistoryIndex(os.path.join(directory, 'history.sqlite3'))
+        started = time.perf_counter()
+        fill(index, entries)
+        index.optimize()  # As after a backfill
+        fill_s = time.perf_counter() - started
+
+        suites = {
+            'text_rare': [(f"scene {rng.randrange(entries)}", 'text') for _ in range(queries)],
+            'text_common': [(rng.choice(VOCABULARY), 'text') for _ in range(queries)],
+            'text_multi_word': [(' '.join(rng.sample(VOCABULARY, 3)), 'text') for _ in range(queries)],
+            'text_word_prefix': [(f"{rng.choice(VOCABULARY)} {rng.choice(VOCABULARY)[:3]}*", 'text')
+                                  for _ in range(queries)],
+            'prefix': [(' '.join(rng.sample(VOCABULARY, 2)), 'prefix') for _ in range(queries)],
+        }
+        results = {name: time_queries(index, suite, limit) for name, suite in suites.items()}
+        size_mb = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)) / 1e6
+    return {'fill_s': round(fill_s, 1), 'db_mb': round(size_mb, 1), 'queries': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=1000000, help='Entries in the index')
+    parser.add_argument('--queries', type=int, default=200, help='Queries per query type')
+    parser.add_argument('--limit', type=int, default=50, help='Results per query')
+    parser.add_argument('--backfill-images', type=int, default=5000, help='Generations in the fake bucket')
+    args = parser.parse_args()
+
+    backfill = run_backfill(args.backfill_images)
+    print(f"Backfilled {backfill['added']} of {backfill['expected']} images from {backfill['blobs']} blobs "
+          f"in {backfill['backfill_s']}s ({backfill['missing']} missing, "
+          f"{backfill['wrong_variants']} with wrong variants)")
+
+    results = run(args.entries, args.queries, args.limit)
+    print(f"Indexed {args.entries} entries in {results['fill_s']}s ({results['db_mb']} MB)")
+    print(f"{'query':<18} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'results':>8}")
+    for name, row in results['queries'].items():
+        print(f"{name:<18} {row['p50_ms']:>8} {row['p99_ms']:>8} {row['max_ms']:>8} {row['avg_results']:>8}")
+    print(json.dumps({'entries': args.entries, 'limit': args.limit, 'backfill': backfill, **results}))
+    if backfill['missing'] or backfill['wrong_variants']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
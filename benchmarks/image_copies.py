@@ -0,0 +1,137 @@
+"""
+Measures how much memory one /generate_and_upload request allocates on top
+of the image itself, using tracemalloc.
+
+Gemini and Firebase Storage are replaced with in-process fakes; each fake
+generation hands back a fresh copy of the image, like the decoded Gemini
+response, so a request that makes no further copies peaks at about one
+image. Each response body is consumed chunk by chunk, as a WSGI server
+would, and the per-request peak of traced memory is reported for:
+
+  legacy_base64  the old path: base64 str in the payload, then jsonify()
+  base64         the streamed JSON body (app.image_json_response)
+  url            URL-only JSON
+  binary         raw PNG body
+
+Each served mode has an allocation bound, in multiples of the image size
+(MAX_PEAK_IMAGES); the generated image itself is the 1x. The legacy path
+must peak at least LEGACY_MIN_EXTRA_IMAGES above streamed base64, which
+shows the measurement sees whole-image copies at all. The script exits
+non-zero if any check fails.
+
+Usage: python benchmarks/image_copies.py [--image-kb 1500] [--requests 20]
+"""
+import gc
+import os
+import sys
+import json
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('FIREBASE_DISABLED', 'true')  # The fakes below stand in for Firebase
+os.environ.setdefault('ADMISSION_ENABLED', 'false')  # One client sends every request
+os.environ.setdefault('IMAGE_VARIANTS_ENABLED', 'false')  # Variants are encoded in other processes
+os.environ.setdefault('HISTORY_INDEX_ENABLED', 'false')
+
+from werkzeug.test import EnvironBuilder  # noqa: E402
+
+import app as app_module  # noqa: E402
+from benchmarks.fakes import FakeBucket, make_image_bytes  # noqa: E402
+
+MODES = ('legacy_base64', 'base64', 'url', 'binary')
+
+# Largest allowed per-request peak, in multiples of the image size
+MAX_PEAK_IMAGES = {
+    'base64': 1.25,  # The image plus one base64 chunk buffer at a time
+    'url': 1.1,  # The image; it is uploaded from a view of the same buffer
+    'binary': 1.1,  # The image; the response body is that same bytes object
+}
+LEGACY_MIN_EXTRA_IMAGES = 2  # base64 str + serialized JSON (+ its encoding) on top of the image
+
+
+def measure(call):
+    """Runs call() and returns (traced peak above the starting point in bytes, its return value)."""
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    value = call()
+    return tracemalloc.get_traced_memory()[1] - before, value
+
+
+def wsgi_request(mode, i):
+    """Serves one request through the WSGI app, reading the body a chunk at a time."""
+    environ = EnvironBuilder(
+        path='/generate_and_upload', method='POST', query_string={'response_mode': mode},
+        json={'prompt': f'benchmark prompt {i}', 'filename': 'bench'},
+    ).get_environ()
+    statuses = []
+    body = app_module.app(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    size = 0
+    try:
+        for chunk in body:
+            size += len(chunk)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    assert statuses[0].startswith('200'), statuses[0]
+    return size
+
+
+def legacy_request(i):
+    """What /generate_and_upload did before streaming: the whole payload built by jsonify()."""
+    with app_module.app.test_request_context('/generate_and_upload', method='POST'):
+        result = app_module.generate_and_store(f'benchmark prompt {i}', 'bench', response_mode='base64')
+        return len(app_module.jsonify(result).get_data())
+
+
+def run(image_kb, requests):
+    image_data = make_image_bytes(image_kb * 1024)
+    # A new bytes object per call, as decoding the Gemini response would produce
+    app_module.gen_image = lambda prompt, use_cache=True: (bytes(memoryview(image_data)), 'benchmark image')
+    app_module.firebase_bucket = FakeBucket()
+
+    tracemalloc.start()
+    results = {}
+    try:
+        for mode in MODES:
+            call = (lambda i: legacy_request(i)) if mode == 'legacy_base64' else (lambda i: wsgi_request(mode, i))
+            call(-1)  # Warm up
+            peaks = []
+            for i in range(requests):
+                peak, size = measure(lambda: call(i))
+                peaks.append(peak)
+            results[mode] = {
+                'response_bytes': size,
+                'peak_bytes': max(peaks),
+                'peak_images': round(max(peaks) / len(image_data), 2),
+            }
+    finally:
+        tracemalloc.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--image-kb', type=int, default=1500, help='Size of the fake PNG in KiB')
+    parser.add_argument('--requests', type=int, default=20, help='Requests per mode')
+    args = parser.parse_args()
+
+    results = run(args.image_kb, args.requests)
+    checks = {mode: results[mode]['peak_images'] <= limit for mode, limit in MAX_PEAK_IMAGES.items()}
+    checks['legacy_base64'] = (results['legacy_base64']['peak_images']
+                               >= results['base64']['peak_images'] + LEGACY_MIN_EXTRA_IMAGES)
+    print(f"{'mode':<14} {'bytes':>12} {'peak bytes':>12} {'peak/image':>11} {'limit':>7} {'check':>7}")
+    for mode, row in results.items():
+        limit = MAX_PEAK_IMAGES.get(mode)
+        limit = f"{limit}x" if limit is not None else f">+{LEGACY_MIN_EXTRA_IMAGES}x"
+        print(f"{mode:<14} {row['response_bytes']:>12} {row['peak_bytes']:>12} {row['peak_images']:>11} "
+              f"{limit:>7} {'ok' if checks[mode] else 'FAILED':>7}")
+    print(json.dumps({'image_kb': args.image_kb, 'requests': args.requests, 'modes': results,
+                      'limits': MAX_PEAK_IMAGES, 'checks': checks}))
+    if not all(checks.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
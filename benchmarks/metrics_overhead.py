@@ -0,0 +1,94 @@
+"""
+Measures the per-request cost of the /metrics instrumentation and the
+Server-Timing header.
+
+Runs the same requests through the Flask test client with metrics enabled
+and disabled (generation and uploads are faked, so the requests are cheap
+and any overhead shows up), and times the primitives (Histogram.observe,
+metrics.stage and a /metrics scrape) on their own.
+
+Usage: python benchmarks/metrics_overhead.py [--requests 2000]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('FIREBASE_DISABLED', 'true')  # The fakes below stand in for Firebase
+os.environ.setdefault('ADMISSION_ENABLED', 'false')  # One client sends every request
+
+import app as app_module  # noqa: E402
+import metrics  # noqa: E402
+from benchmarks.fakes import FakeBucket, make_image_bytes  # noqa: E402
+
+
+def time_requests(client, requests, enabled):
+    metrics.METRICS_ENABLED = enabled
+    started = time.perf_counter()
+    for i in range(requests):
+        response = client.post('/generate_and_upload?response_mode=url',
+                               json={'prompt': f'metrics overhead {i % 10}', 'filename': 'bench'})
+        assert response.status_code == 200, response.data[:200]
+    return (time.perf_counter() - started) * 1e6 / requests, response.headers.get('Server-Timing')
+
+
+def time_primitive(fn, iterations=100000):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) * 1e6 / iterations
+
+
+def run(requests):
+    image_data = make_image_bytes(64 * 1024)
+    app_module.gen_image = lambda prompt, use_cache=True: (image_data, 'benchmark image')
+    app_module.firebase_bucket = FakeBucket()
+    app_module.submit_variants = lambda data: None
+    client = app_module.app.test_client()
+    time_requests(client, min(requests, 100), True)  # Warm up
+
+    # Alternate the order to even out drift
+    off_us, _ = time_requests(client, requests, False)
+    on_us, header = time_requests(client, requests, True)
+    off_us_2, _ = time_requests(client, requests, False)
+    off_us = min(off_us, off_us_2)
+
+    metrics.METRICS_ENABLED = True
+    histogram = metrics.Histogram('benchmark_seconds', 'Benchmark histogram', labelnames=('route',))
+
+    def staged():
+        with metrics.stage('bench', histogram, '/bench'):
+            pass
+
+    scrape_started = time.perf_counter()
+    body = client.get('/metrics').get_data()
+    scrape_ms = (time.perf_counter() - scrape_started) * 1000
+
+    return {
+        'request_us_metrics_off': round(off_us, 1),
+        'request_us_metrics_on': round(on_us, 1),
+        'overhead_us_per_request': round(on_us - off_us, 1),
+        'overhead_pct': round((on_us - off_us) * 100 / off_us, 2),
+        'observe_us': round(time_primitive(lambda: histogram.observe(0.01, '/bench')), 3),
+        'stage_us': round(time_primitive(staged), 3),
+        'scrape_ms': round(scrape_ms, 2),
+        'scrape_bytes': len(body),
+        'server_timing_example': header,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per configuration')
+    args = parser.parse_args()
+
+    results = run(args.requests)
+    for name, value in results.items():
+        print(f"{name:<28} {value}")
+    print(json.dumps({'requests': args.requests, 'results': results}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Compares response size and server CPU time for the /generate_and_upload
+response modes (base64 JSON, URL-only JSON, raw PNG).
+
+Gemini and Firebase Storage are replaced with in-process fakes, so only
+the server-side response handling is measured. Every request generates a
+new image, and the fake bucket counts the Storage calls each one makes.
+The script exits non-zero unless every request uploads with exactly one
+upload_from_file call and no make_public, get_blob or list call, and a
+repeated image reuses its upload with one get_blob call and no upload.
+
+Usage: python benchmarks/response_modes.py [--image-kb 1500] [--requests 50]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('FIREBASE_DISABLED', 'true')  # The fakes below stand in for Firebase
+os.environ.setdefault('ADMISSION_ENABLED', 'false')  # One client sends every request
+os.environ['IMAGE_VARIANTS_ENABLED'] = 'false'  # Variant uploads would vary the expected call counts
+os.environ['STORAGE_ASYNC_UPLOADS'] = 'false'  # Uploads finish before the response, so counts are exact
+
+import app as app_module  # noqa: E402
+from benchmarks.fakes import FakeBucket, make_image_bytes  # noqa: E402
+
+# Storage calls one request may make
+NEW_IMAGE_CALLS = {'upload_from_file': 1}  # Public ACL and cache headers travel with the upload
+REUSED_IMAGE_CALLS = {'get_blob': 1}  # The earlier blob is checked, nothing is uploaded
+
+
+def calls_between(before, after):
+    """Storage calls made between two FakeBucket.call_counts() snapshots."""
+    return {name: after[name] - before.get(name, 0) for name in after if after[name] != before.get(name, 0)}
+
+
+def run(image_kb, requests):
+    base_image = make_image_bytes(image_kb * 1024)
+    # A distinct image per prompt, so every request takes the upload path
+    app_module.gen_image = lambda prompt, use_cache=True: (base_image + prompt.encode(), 'benchmark image')
+    bucket = app_module.firebase_bucket = FakeBucket()
+    client = app_module.app.test_client()
+
+    results = {}
+    for mode in app_module.RESPONSE_MODES:
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        size = 0
+        unexpected = []
+        for i in range(requests):
+            before = bucket.call_counts()
+            response = client.post(
+                f'/generate_and_upload?response_mode={mode}',
+                json={'prompt': f'benchmark prompt {mode} {i}', 'filename': 'bench'},
+            )
+            assert response.status_code == 200, response.data[:200]
+            size = len(response.get_data())
+            calls = calls_between(before, bucket.call_counts())
+            if calls != NEW_IMAGE_CALLS:
+                unexpected.append(calls)
+        cpu_ms = (time.process_time() - cpu_start) * 1000 / requests
+        wall_ms = (time.perf_counter() - wall_start) * 1000 / requests
+
+        # The same prompt again yields the same bytes: the upload must be reused
+        before = bucket.call_counts()
+        response = client.post(
+            f'/generate_and_upload?response_mode={mode}',
+            json={'prompt': f'benchmark prompt {mode} {requests - 1}', 'filename': 'bench'},
+        )
+        assert response.status_code == 200, response.data[:200]
+        reused_calls = calls_between(before, bucket.call_counts())
+
+        results[mode] = {
+            'response_bytes': size,
+            'cpu_ms_per_request': round(cpu_ms, 3),
+            'wall_ms_per_request': round(wall_ms, 3),
+            'unexpected_calls': unexpected,
+            'reused_calls': reused_calls,
+            'ok': not unexpected and reused_calls == REUSED_IMAGE_CALLS,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--image-kb', type=int, default=1500, help='Size of the fake PNG in KiB')
+    parser.add_argument('--requests', type=int, default=50, help='Requests per mode')
+    args = parser.parse_args()
+
+    results = run(args.image_kb, args.requests)
+    print(f"{'mode':<8} {'bytes':>12} {'cpu ms/req':>12} {'wall ms/req':>12} {'storage calls':>14}")
+    for mode, row in results.items():
+        print(f"{mode:<8} {row['response_bytes']:>12} {row['cpu_ms_per_request']:>12} "
+              f"{row['wall_ms_per_request']:>12} {'ok' if row['ok'] else 'FAILED':>14}")
+        if not row['ok']:
+            print(f"  expected {NEW_IMAGE_CALLS} per new image, {REUSED_IMAGE_CALLS} per reused one; "
+                  f"saw {row['unexpected_calls'][:3]} and {row['reused_calls']}")
+    print(json.dumps({'image_kb': args.image_kb, 'requests': args.requests, 'modes': results}))
+    if not all(row['ok'] for row in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
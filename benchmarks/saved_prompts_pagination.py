@@ -0,0 +1,83 @@
+"""
+Measures /get_saved_prompts latency per page across a large collection.
+
+Firestore is replaced with an in-memory stand-in whose ordered queries seek
+to the cursor with a binary search, like a Firestore index, so the numbers
+show the cost of the endpoint itself. With cursor pagination the first and
+the last pages should cost the same.
+
+With --cache the pages are served from the in-process prompts cache
+(after its initial load) instead of querying the stand-in on every request.
+
+Usage: python benchmarks/saved_prompts_pagination.py [--docs 100000] [--limit 50] [--cache]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('FIREBASE_DISABLED', 'true')  # The fakes below stand in for Firebase
+
+import app as app_module  # noqa: E402
+from benchmarks.fakes import FakeFirestore, make_agent_responses  # noqa: E402
+
+
+def run(docs, limit, use_cache=False):
+    app_module.db = FakeFirestore()
+    make_agent_responses(app_module.db, docs)
+    app_module.PROMPTS_CACHE_ENABLED = use_cache
+    client = app_module.app.test_client()
+    if use_cache:
+        client.get('/get_saved_prompts')  # Starts the cache sync
+        while not app_module.prompts_cache.get_stats()['ready']:
+            time.sleep(0.05)
+
+    latencies = []
+    page_token = None
+    fetched = 0
+    while True:
+        url = f'/get_saved_prompts?limit={limit}'
+        if page_token:
+            url += f'&page_token={page_token}'
+        started = time.perf_counter()
+        response = client.get(url)
+        latencies.append((time.perf_counter() - started) * 1000)
+        data = response.get_json()
+        assert data['success'], data
+        fetched += len(data['prompts'])
+        page_token = data['next_page_token']
+        if not page_token:
+            break
+
+    tenth = max(1, len(latencies) // 10)
+    return {
+        'docs': docs,
+        'limit': limit,
+        'cache': use_cache,
+        'pages': len(latencies),
+        'fetched': fetched,
+        'first_pages_ms': round(statistics.median(latencies[:tenth]), 3),
+        'last_pages_ms': round(statistics.median(latencies[-tenth:]), 3),
+        'p50_ms': round(statistics.median(latencies), 3),
+        'max_ms': round(max(latencies), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--docs', type=int, default=100000, help='Documents in agent_responses')
+    parser.add_argument('--limit', type=int, default=50, help='Page size')
+    parser.add_argument('--cache', action='store_true', help='Serve pages from the prompts cache')
+    args = parser.parse_args()
+
+    result = run(args.docs, args.limit, args.cache)
+    print(f"{result['pages']} pages, {result['fetched']} prompts: "
+          f"first 10% median {result['first_pages_ms']} ms, last 10% median {result['last_pages_ms']} ms")
+    print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Measures time to first response of a freshly started server when the
+startup backends are slow.
+
+Each run starts the app in a subprocess in which Secret Manager, Firebase
+app initialization, the Storage client and the Firestore client are replaced
+with fakes that sleep for --delay-ms each. It then polls / until it answers
+and records when / and /get_saved_prompts first succeed, for the lazy
+(background) startup and the old eager one (STARTUP_LAZY_INIT=false).
+
+Eager startup waits for three slow backends in a row (credentials, app
+initialization, then both clients in parallel) before the server listens;
+lazy startup waits for none. The script exits non-zero unless lazy startup
+answers / at least 2 x --delay-ms sooner, and answers /get_saved_prompts no
+later than eager startup plus one --delay-ms of polling slack.
+
+Usage: python benchmarks/startup_time.py [--delay-ms 2000] [--runs 3]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def serve(port, delay):
+    """Child process: patches the slow backends in, imports the app and serves it."""
+    import firebase_admin
+    from firebase_admin import credentials, firestore, storage
+    from google.cloud import secretmanager
+    from werkzeug.serving import make_server
+    from benchmarks.fakes import FakeBucket, FakeFirestore, make_agent_responses
+
+    class SlowSecretManager:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            return False
+
+        def access_secret_version(self, request):
+            time.sleep(delay)
+            return type('Response', (), {'payload': type('Payload', (), {'data': b'{}'})()})()
+
+    def slow(result):
+        def call(*args, **kwargs):
+            time.sleep(delay)
+            return result
+        return call
+
+    db = FakeFirestore()
+    make_agent_responses(db, 200)
+    secretmanager.SecretManagerServiceClient = SlowSecretManager
+    credentials.Certificate = lambda info: object()
+    firebase_admin.initialize_app = slow(None)
+    firebase_admin.get_app = lambda: None
+    storage.bucket = slow(FakeBucket())
+    firestore.client = slow(db)
+    os.environ.pop('FIREBASE_CREDS_B64', None)
+    os.environ.pop('FIREBASE_DISABLED', None)
+
+    import app as app_module
+    make_server('127.0.0.1', port, app_module.app, threaded=True).serve_forever()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(client, path, started, timeout=120):
+    """Polls path until it returns 200; returns milliseconds since started."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if client.get(path).status_code == 200:
+                return round((time.perf_counter() - started) * 1000, 1)
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"{path} did not answer within {timeout}s")
+
+
+def measure(lazy, delay_ms):
+    port = free_port()
+    env = dict(os.environ, STARTUP_LAZY_INIT='true' if lazy else 'false')
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', str(port), '--delay-ms', str(delay_ms)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=120) as client:
+            index_ms = wait_for(client, '/', started)
+            prompts_ms = wait_for(client, '/get_saved_prompts', started)
+            stats = client.get('/stats').json()['startup']
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return {
+        'index_ms': index_ms,
+        'saved_prompts_ms': prompts_ms,
+        'phases': {name: phase['duration_ms'] for name, phase in stats['phases'].items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--delay-ms', type=float, default=2000, help='Delay of each fake startup backend')
+    parser.add_argument('--runs', type=int, default=3, help='Server starts per mode')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.delay_ms / 1000.0)
+        return
+
+    results = {}
+    for label, lazy in (('lazy', True), ('eager', False)):
+        runs = [measure(lazy, args.delay_ms) for _ in range(args.runs)]
+        results[label] = {
+            'index_ms': min(run['index_ms'] for run in runs),
+            'saved_prompts_ms': min(run['saved_prompts_ms'] for run in runs),
+            'phases': runs[-1]['phases'],
+        }
+
+    print(f"{'startup':<8} {'first / ms':>12} {'first prompts ms':>18}")
+    for label, row in results.items():
+        print(f"{label:<8} {row['index_ms']:>12} {row['saved_prompts_ms']:>18}")
+    lazy, eager = results['lazy'], results['eager']
+    checks = {
+        'index_saves_two_delays': lazy['index_ms'] <= eager['index_ms'] - 2 * args.delay_ms,
+        'saved_prompts_not_slower': lazy['saved_prompts_ms'] <= eager['saved_prompts_ms'] + args.delay_ms,
+    }
+    for name, ok in checks.items():
+        print(f"{name:<26} {'ok' if ok else 'FAILED'}")
+    print(json.dumps({'delay_ms': args.delay_ms, 'runs': args.runs, 'modes': results, 'checks': checks}))
+    if not all(checks.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
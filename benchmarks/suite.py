@@ -0,0 +1,264 @@
+"""
+Offline load test of the main endpoints.
+
+Starts the fake Gemini server (benchmarks/fake_gemini.py) and, in a
+subprocess, app.py and db_fetch.py behind one werkzeug server, with the
+Storage bucket and the agent_responses collection replaced by the in-memory
+fakes. It then drives each endpoint with --concurrency clients for
+--requests requests and reports throughput, latency percentiles and the
+server's peak RSS per endpoint:
+
+  generate_and_upload   POST /generate_and_upload (unique prompts, cache bypassed)
+  generate_image        POST /generate_image (unique prompts, cache bypassed)
+  get_saved_prompts     GET /get_saved_prompts?limit=50
+  user_images           GET /api/user_images/<uid> (first page)
+  user_images_ndjson    GET /api/user_images/<uid>?format=ndjson (whole folder, streamed)
+
+The last line is JSON; save it with --output and pass it back with
+--compare to print the change against an earlier run.
+
+Usage: python benchmarks/suite.py [--concurrency 8] [--requests 200] [--latency-ms 200]
+                                  [--image-kb 1500] [--endpoints generate_image,...]
+                                  [--output run.json] [--compare baseline.json]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ENDPOINTS = ('generate_and_upload', 'generate_image', 'get_saved_prompts', 'user_images', 'user_images_ndjson')
+USER_UID = 'bench-user'
+
+
+def serve(port, docs, user_images):
+    """Child process: wires the fakes into app.py and db_fetch.py and serves both."""
+    os.environ['FIREBASE_DISABLED'] = 'true'  # The fakes below stand in for Firebase
+    os.environ.setdefault('ADMISSION_ENABLED', 'false')  # One client sends every request
+    from werkzeug.serving import make_server
+    from benchmarks.fakes import FakeBucket, FakeFirestore, make_agent_responses, make_user_images
+
+    import app as app_module
+    import db_fetch
+
+    bucket = FakeBucket()
+    db = FakeFirestore()
+    make_agent_responses(db, docs)
+    make_user_images(bucket, USER_UID, user_images)
+    app_module.firebase_bucket = bucket
+    app_module.db = db
+    db_fetch.firebase_bucket = bucket
+
+    def dispatch(environ, start_response):
+        target = db_fetch.app if environ.get('PATH_INFO', '').startswith('/api/') else app_module.app
+        return target(environ, start_response)
+
+    make_server('127.0.0.1', port, dispatch, threaded=True).serve_forever()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(client, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if client.get('/').status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    raise RuntimeError(f"Server did not answer within {timeout}s")
+
+
+def read_rss_mb(pid):
+    """Returns the resident set size of pid in MiB, or None where /proc is not available."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+class RssSampler:
+    """Samples a process's RSS on a background thread and keeps the peak."""
+
+    def __init__(self, pid, interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+
+    def _run(self):
+        while True:
+            rss = read_rss_mb(self.pid)
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def make_request(client, endpoint, i):
+    if endpoint == 'generate_and_upload':
+        return client.post('/generate_and_upload', json={
+            'prompt': f'benchmark scene {i} {time.time_ns()}', 'filename': 'bench', 'bypass_cache': True,
+        })
+    if endpoint == 'generate_image':
+        return client.post('/generate_image', json={
+            'prompt': f'benchmark image {i} {time.time_ns()}', 'bypass_cache': True,
+        })
+    if endpoint == 'get_saved_prompts':
+        return client.get('/get_saved_prompts', params={'limit': 50})
+    if endpoint == 'user_images_ndjson':
+        return client.get(f'/api/user_images/{USER_UID}', params={'format': 'ndjson'})
+    return client.get(f'/api/user_images/{USER_UID}')
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def drive(client, pid, endpoint, requests, concurrency):
+    def one(i):
+        started = time.perf_counter()
+        try:
+            ok = make_request(client, endpoint, i).status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    with RssSampler(pid) as sampler:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one, range(requests)))
+        elapsed = time.perf_counter() - started
+
+    latencies = [latency for latency, _ in results]
+    return {
+        'requests': requests,
+        'errors': sum(1 for _, ok in results if not ok),
+        'rps': round(requests / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p90_ms': round(percentile(latencies, 90) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'max_ms': round(max(latencies) * 1000, 1),
+        'peak_rss_mb': round(sampler.peak, 1) if sampler.peak is not None else None,
+    }
+
+
+def run(args):
+    from benchmarks.fake_gemini import FakeGeminiServer
+
+    gemini = FakeGeminiServer(0, args.latency_ms, args.image_kb).start()
+    port = free_port()
+    env = dict(os.environ, GEMINI_API_KEY='fake', GEMINI_BASE_URL=gemini.base_url)
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', str(port),
+         '--docs', str(args.docs), '--user-images', str(args.user_images)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    results = {}
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=300, limits=limits) as client:
+            wait_until_up(client)
+            for endpoint in args.endpoints:
+                make_request(client, endpoint, -1)  # Warm up
+                results[endpoint] = drive(client, server.pid, endpoint, args.requests, args.concurrency)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        gemini.shutdown()
+    return results
+
+
+def compare(results, baseline):
+    """Prints each metric's change against a previous run's JSON output."""
+    print(f"\n{'endpoint':<20} {'metric':<12} {'baseline':>10} {'now':>10} {'change':>9}")
+    for endpoint, row in results.items():
+        before = baseline.get('endpoints', {}).get(endpoint)
+        if not before:
+            continue
+        for metric in ('rps', 'p50_ms', 'p99_ms', 'peak_rss_mb'):
+            old, new = before.get(metric), row.get(metric)
+            if not old or new is None:
+                continue
+            print(f"{endpoint:<20} {metric:<12} {old:>10} {new:>10} {(new - old) * 100 / old:>+8.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+    parser.add_argument('--latency-ms', type=float, default=200, help='Fake Gemini response delay')
+    parser.add_argument('--image-kb', type=int, default=1500, help='Size of the fake Gemini PNG in KiB')
+    parser.add_argument('--docs', type=int, default=5000, help='Documents in the fake agent_responses collection')
+    parser.add_argument('--user-images', type=int, default=500, help='Blobs under the benchmark user folder')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help='Comma-separated subset of endpoints')
+    parser.add_argument('--output', help='Also write the JSON results to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.docs, args.user_images)
+        return
+
+    args.endpoints = [name for name in args.endpoints.split(',') if name]
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    results = run(args)
+    print(f"{'endpoint':<20} {'rps':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'errors':>7} {'peak RSS MiB':>13}")
+    for endpoint, row in results.items():
+        print(f"{endpoint:<20} {row['rps']:>8} {row['p50_ms']:>8} {row['p90_ms']:>8} {row['p99_ms']:>8} "
+              f"{row['errors']:>7} {str(row['peak_rss_mb']):>13}")
+
+    output = {
+        'config': {
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'latency_ms': args.latency_ms,
+            'image_kb': args.image_kb,
+            'docs': args.docs,
+            'user_images': args.user_images,
+        },
+        'endpoints': results,
+    }
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(results, json.load(baseline))
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump(output, out, indent=2)
+    print(json.dumps(output))
+
+
+if __name__ == '__main__':
+    main()
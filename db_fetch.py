@@ -1,8 +1,11 @@
 import os
+import json
 import firebase_admin
 from firebase_admin import credentials, storage
 from dotenv import load_dotenv 
-from flask import Flask, jsonify, request 
+from flask import Flask, Response, jsonify, request, stream_with_context
+
+from user_images_cache import shared_cache
 
 load_dotenv()
 
@@ -14,11 +17,29 @@ if not api_key:
 app = Flask(__name__)
 
 firebase_bucket = None
+_firebase_initialized = False
+
+# User image listing settings (overridable via env)
+USER_IMAGES_PAGE_SIZE = int(os.environ.get('USER_IMAGES_PAGE_SIZE', '100'))
+USER_IMAGES_MAX_PAGE_SIZE = int(os.environ.get('USER_IMAGES_MAX_PAGE_SIZE', '1000'))
+STORAGE_EVENTS_TOKEN = os.environ.get('STORAGE_EVENTS_TOKEN')  # Shared secret for /api/storage_events
+LIST_FIELDS = 'items(name),nextPageToken'  # Only object names are needed to build public URLs
+
+user_images_cache = shared_cache()  # Short TTL unless STORAGE_EVENTS_TOKEN is set
+
+@app.before_request
+def ensure_firebase():
+    """Initializes Firebase on the first request (Flask 2.3 removed before_first_request)."""
+    global _firebase_initialized
+    if not _firebase_initialized:
+        _firebase_initialized = True
+        initialize_firebase()
 
-@app.before_first_request
 def initialize_firebase():
     """Initializes the Firebase Admin SDK."""
     global firebase_bucket
+    if firebase_bucket is not None:
+        return
     if not firebase_admin._apps:
         try:
             cred = credentials.Certificate("service_account_key.json")
@@ -41,6 +62,65 @@ def initialize_firebase():
              print(f"Error getting existing Firebase bucket: {e}")
              firebase_bucket = None 
 
+def _image_entry(blob):
+    """Returns the name/full_path/url record for a blob, or None if it has no public URL."""
+    file_url = get_public_url(blob)
+    if not file_url:
+        print(f"Warning: Could not get public URL for {blob.name}")
+        return None
+    return {
+        'name': os.path.basename(blob.name),
+        'full_path': blob.name,
+        'url': file_url
+    }
+
+def iter_files_in_folder(bucket, folder_path, page_size=None, page_token=None):
+    """
+    Yields (entries, next_page_token) for each listing page of a folder,
+    starting at page_token. Only one page of blobs is held at a time, and
+    the listing asks GCS for the object names alone (LIST_FIELDS).
+
+    Args:
+        bucket: The Firebase Storage bucket object.
+        folder_path: The folder prefix, with a trailing slash.
+        page_size: Blobs per GCS list call (defaults to USER_IMAGES_PAGE_SIZE).
+        page_token: The next_page_token of an earlier page, to resume from.
+    """
+    blobs = bucket.list_blobs(
+        prefix=folder_path,
+        page_size=page_size or USER_IMAGES_PAGE_SIZE,
+        page_token=page_token,
+        fields=LIST_FIELDS,
+    )
+    for page in blobs.pages:
+        entries = [_image_entry(blob) for blob in page if blob.name != folder_path]
+        yield [entry for entry in entries if entry], blobs.next_page_token
+
+def list_files_page(bucket, folder_path, max_results, page_token=None):
+    """
+    Lists one page of files in a folder with a single GCS list call.
+
+    Args:
+        bucket: The Firebase Storage bucket object.
+        folder_path: The folder prefix, with a trailing slash.
+        max_results: The page size.
+        page_token: The next_page_token of the previous page, or None for the first.
+
+    Returns:
+        (image_data, next_page_token); next_page_token is None on the last page.
+    """
+    blobs = bucket.list_blobs(
+        prefix=folder_path,
+        max_results=max_results,
+        page_token=page_token,
+        fields=LIST_FIELDS,
+    )
+    page = next(blobs.pages, None)
+    if page is None:
+        return [], None
+    entries = [_image_entry(blob) for blob in page if blob.name != folder_path]
+    return [entry for entry in entries if entry], blobs.next_page_token
+
 def list_files_in_folder(bucket, folder_path):
     """
     Lists files in a specified folder path within the Firebase Storage bucket.
@@ -59,23 +139,13 @@ def list_files_in_folder(bucket, folder_path):
         return None
     print(f"\nAttempting to list files in folder: {folder_path}")
     try:
-        blobs = bucket.list_blobs(prefix=folder_path)
-        file_list = [blob for blob in blobs if blob.name != folder_path]
-        if not file_list:
-            print(f"No files found in folder: {folder_path}")
-            return [] 
-        print(f"Found {len(file_list)} file(s).")
         image_data = []
-        for blob in file_list:
-            file_url = get_public_url(blob) 
-            if file_url:
-                image_data.append({
-                    'name': os.path.basename(blob.name), 
-                    'full_path': blob.name, 
-                    'url': file_url
-                })
-            else:
-                print(f"Warning: Could not get public URL for {blob.name}")
+        for entries, _ in iter_files_in_folder(bucket, folder_path):
+            image_data.extend(entries)
+        if not image_data:
+            print(f"No files found in folder: {folder_path}")
+            return []
+        print(f"Found {len(image_data)} file(s).")
         return image_data
     except Exception as e:
         print(f"Error listing files: {e}")
@@ -107,14 +177,19 @@ def get_public_url(blob):
 @app.route('/api/user_images/<user_uid>', methods=['GET'])
 def get_user_images(user_uid):
     """
-    API endpoint to fetch image URLs for a specific user.
+    API endpoint to fetch image URLs for a specific user, one page at a time.
+
+    Query parameters: limit (page size), page_token (the next_page_token of
+    the previous page) and format=ndjson, which streams every image from
+    page_token on as one JSON line each (at most limit images if given),
+    followed by a summary line with the next_page_token.
 
     Args:
         user_uid: The unique ID of the user (from the URL path).
 
     Returns:
-        A JSON response containing a list of image data (name, full_path, url)
-        or an error message.
+        A JSON response containing a page of image data (name, full_path, url)
+        and the next_page_token, or an error message.
     """
     if firebase_bucket is None:
         return jsonify({'status': 'error', 'message': 'Firebase Storage is not initialized.'}), 500
@@ -122,15 +197,103 @@ def get_user_images(user_uid):
     if not user_uid:
         return jsonify({'status': 'error', 'message': 'User UID is required.'}), 400
 
-    user_folder_path = f"user_images/{user_uid}/" 
-    image_list = list_files_in_folder(firebase_bucket, user_folder_path)
+    limit = request.args.get('limit', type=int)
+    if 'limit' in request.args and limit is None:
+        return jsonify({'status': 'error', 'message': 'limit must be an integer.'}), 400
+    page_token = request.args.get('page_token') or None
+    user_folder_path = f"user_images/{user_uid}/"
+
+    if request.args.get('format') == 'ndjson':
+        max_images = max(1, limit) if limit is not None else None
+        return Response(
+            stream_with_context(_stream_user_images(user_folder_path, max_images, page_token)),
+            mimetype='application/x-ndjson'
+        )
+
+    limit = max(1, min(limit or USER_IMAGES_PAGE_SIZE, USER_IMAGES_MAX_PAGE_SIZE))
+    page_key = (page_token, limit)
+    page = user_images_cache.get(user_uid, page_key)
+    if page is None:
+        generation = user_images_cache.generation()
+        try:
+            page = list_files_page(firebase_bucket, user_folder_path, limit, page_token)
+        except Exception as e:
+            print(f"Error listing files in {user_folder_path}: {e}")
+            return jsonify({'status': 'error', 'message': 'An error occurred while fetching images.'}), 500
+        user_images_cache.put(user_uid, page_key, page, generation)
+    image_list, next_page_token = page
+
+    if not image_list and not page_token:
+        message = f'No images found for user {user_uid}.'
+    else:
+        message = f'Successfully fetched images for user {user_uid}.'
+    return jsonify({
+        'status': 'success',
+        'message': message,
+        'images': image_list,
+        'next_page_token': next_page_token,
+        'has_more': next_page_token is not None
+    }), 200
+
+def _iter_limited_pages(bucket, folder_path, max_images, page_token):
+    """
+    Like iter_files_in_folder, but each list call asks for at most the images
+    still wanted, so no page goes past max_images and the returned
+    next_page_token resumes right after the last image yielded.
+    """
+    remaining = max_images
+    while remaining > 0:
+        entries, page_token = list_files_page(
+            bucket, folder_path, min(remaining, USER_IMAGES_MAX_PAGE_SIZE), page_token
+        )
+        yield entries, page_token
+        remaining -= len(entries)
+        if page_token is None:
+            return
+
+def _stream_user_images(folder_path, max_images, page_token):
+    """Yields NDJSON lines for the images in folder_path (at most max_images), one listing page at a time."""
+    count = 0
+    next_page_token = None
+    try:
+        if max_images is None:
+            pages = iter_files_in_folder(firebase_bucket, folder_path, USER_IMAGES_MAX_PAGE_SIZE, page_token)
+        else:
+            pages = _iter_limited_pages(firebase_bucket, folder_path, max_images, page_token)
+        for entries, next_page_token in pages:
+            for entry in entries:
+                yield json.dumps(entry) + "\n"
+                count += 1
+    except Exception as e:
+        print(f"Error streaming files in {folder_path}: {e}")
+        yield json.dumps({'type': 'error', 'message': 'An error occurred while fetching images.', 'count': count}) + "\n"
+        return
+    yield json.dumps({'type': 'summary', 'count': count, 'next_page_token': next_page_token}) + "\n"
 
-    if image_list is None:
-        return jsonify({'status': 'error', 'message': 'An error occurred while fetching images.'}), 500
-    elif not image_list:
-        return jsonify({'status': 'success', 'message': f'No images found for user {user_uid}.', 'images': []}), 200
+@app.route('/api/storage_events', methods=['POST'])
+def storage_events():
+    """
+    Receives Cloud Storage object notifications (a Pub/Sub push subscription
+    on OBJECT_FINALIZE, or the object resource itself as the JSON body) and
+    invalidates the listing cache of the user whose folder changed.
+    The push URL must carry ?token=<STORAGE_EVENTS_TOKEN>; without that
+    setting the route is disabled, so anonymous callers cannot flush caches.
+    """
+    if not STORAGE_EVENTS_TOKEN:
+        return jsonify({'status': 'error', 'message': 'Storage events are disabled (STORAGE_EVENTS_TOKEN is not set).'}), 404
+    if request.args.get('token') != STORAGE_EVENTS_TOKEN:
+        return jsonify({'status': 'error', 'message': 'Invalid token.'}), 403
+
+    body = request.get_json(silent=True) or {}
+    message = body.get('message')
+    if isinstance(message, dict):
+        object_name = (message.get('attributes') or {}).get('objectId')
     else:
-        return jsonify({'status': 'success', 'message': f'Successfully fetched images for user {user_uid}.', 'images': image_list}), 200
+        object_name = body.get('name')
+
+    uid = user_images_cache.invalidate_path(object_name)
+    # Always 2xx, so Pub/Sub does not redeliver events for other folders
+    return jsonify({'status': 'success', 'invalidated': uid}), 200
 
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,173 @@
+import os
+import weakref
+import threading
+
+import httpx
+from google import genai
+from google.genai import errors as genai_errors
+from google.genai import types
+
+from resilience import ResilientCall
+
+# Connection settings for the shared Gemini client (overridable via env)
+GEMINI_TIMEOUT_MS = int(os.environ.get('GEMINI_TIMEOUT_MS', '120000'))
+GEMINI_MAX_CONNECTIONS = int(os.environ.get('GEMINI_MAX_CONNECTIONS', '10'))
+GEMINI_MAX_KEEPALIVE = int(os.environ.get('GEMINI_MAX_KEEPALIVE', '5'))
+GEMINI_KEEPALIVE_EXPIRY = float(os.environ.get('GEMINI_KEEPALIVE_EXPIRY', '60'))
+
+# Resilience settings for generate_content calls (overridable via env)
+GEMINI_ATTEMPT_TIMEOUT = float(os.environ.get('GEMINI_ATTEMPT_TIMEOUT', '90'))
+GEMINI_MAX_ATTEMPTS = int(os.environ.get('GEMINI_MAX_ATTEMPTS', '3'))
+GEMINI_RETRY_BACKOFF = float(os.environ.get('GEMINI_RETRY_BACKOFF', '0.5'))
+GEMINI_RETRY_MAX_DELAY = float(os.environ.get('GEMINI_RETRY_MAX_DELAY', '8'))
+GEMINI_HEDGE_ENABLED = os.environ.get('GEMINI_HEDGE_ENABLED', 'false').lower() == 'true'
+GEMINI_HEDGE_MIN_DELAY = float(os.environ.get('GEMINI_HEDGE_MIN_DELAY', '5'))
+GEMINI_BREAKER_FAILURES = int(os.environ.get('GEMINI_BREAKER_FAILURES', '5'))
+GEMINI_BREAKER_RESET = float(os.environ.get('GEMINI_BREAKER_RESET', '30'))
+GEMINI_ATTEMPT_WORKERS = int(os.environ.get('GEMINI_ATTEMPT_WORKERS', str(max(GEMINI_MAX_CONNECTIONS * 2, 8))))
+
+_lock = threading.Lock()
+_clients = {}  # api_key -> genai.Client, only valid in the process that built it
+_owner_pid = os.getpid()
+_seen_streams = weakref.WeakSet()  # Open network streams already used by a response
+_stats = {
+    'client_constructions': 0,
+    'client_reuses': 0,
+    'connections_opened': 0,
+    'connection_reuses': 0,
+}
+
+
+def _reset_after_fork():
+    """Drops clients inherited from the parent so every worker opens its own sockets."""
+    global _lock, _owner_pid
+    _lock = threading.Lock()
+    _clients.clear()
+    _seen_streams.clear()
+    _owner_pid = os.getpid()
+    for key in _stats:
+        _stats[key] = 0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _track_connection(response):
+    """httpx response hook: counts whether the request went over a new or a kept-alive connection."""
+    stream = response.extensions.get('network_stream')
+    if stream is None:
+        return
+    # Held weakly: closed connections drop out, and a new stream is never
+    # mistaken for an old one (as with id(), which CPython reuses)
+    with _lock:
+        if stream in _seen_streams:
+            _stats['connection_reuses'] += 1
+        else:
+            _seen_streams.add(stream)
+            _stats['connections_opened'] += 1
+
+
+async def _track_connection_async(response):
+    """Async variant of _track_connection for the client's aio (httpx.AsyncClient) side."""
+    _track_connection(response)
+
+
+def is_retryable_error(error):
+    """True for Gemini errors worth retrying: throttling, server errors, timeouts and dropped connections."""
+    if isinstance(error, genai_errors.ServerError):
+        return True
+    if isinstance(error, genai_errors.APIError):
+        return error.code == 429
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError, ConnectionError, TimeoutError))
+
+
+# Deadlines, retries, hedging and the circuit breaker shared by all generate_content calls
+resilience = ResilientCall(
+    'gemini',
+    is_retryable_error,
+    attempt_timeout=GEMINI_ATTEMPT_TIMEOUT,
+    max_attempts=GEMINI_MAX_ATTEMPTS,
+    backoff=GEMINI_RETRY_BACKOFF,
+    max_delay=GEMINI_RETRY_MAX_DELAY,
+    hedge=GEMINI_HEDGE_ENABLED,
+    hedge_min_delay=GEMINI_HEDGE_MIN_DELAY,
+    failure_threshold=GEMINI_BREAKER_FAILURES,
+    reset_timeout=GEMINI_BREAKER_RESET,
+    workers=GEMINI_ATTEMPT_WORKERS,
+)
+
+
+def _build_client(api_key):
+    """Builds a genai.Client backed by a bounded, keep-alive httpx connection pool."""
+    limits = httpx.Limits(
+        max_connections=GEMINI_MAX_CONNECTIONS,
+        max_keepalive_connections=GEMINI_MAX_KEEPALIVE,
+        keepalive_expiry=GEMINI_KEEPALIVE_EXPIRY,
+    )
+    http_options = types.HttpOptions(
+        timeout=GEMINI_TIMEOUT_MS,
+        client_args={
+            'limits': limits,
+            'event_hooks': {'response': [_track_connection]},
+        },
+        async_client_args={
+            'limits': limits,
+            'event_hooks': {'response': [_track_connection_async]},
+        },
+    )
+    base_url = os.environ.get('GEMINI_BASE_URL')
+    if base_url:
+        http_options.base_url = base_url
+    return genai.Client(api_key=api_key, http_options=http_options)
+
+
+def get_client(api_key):
+    """
+    Returns the process-wide Gemini client for the given API key.
+
+    The client is created lazily on first use and reused by every request
+    handled by this worker. After a fork the registry is emptied, so gunicorn
+    workers never share a connection pool with the master process.
+
+    Args:
+        api_key: The Gemini API key.
+
+    Returns:
+        A genai.Client instance.
+    """
+    if _owner_pid != os.getpid():
+        _reset_after_fork()
+    client = _clients.get(api_key)
+    if client is not None:
+        with _lock:
+            _stats['client_reuses'] += 1
+        return client
+    with _lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = _build_client(api_key)
+            _clients[api_key] = client
+            _stats['client_constructions'] += 1
+            print("Created shared Gemini client for this worker.")
+        else:
+            _stats['client_reuses'] += 1
+    return client
+
+
+def reset_clients():
+    """Closes the registry so the next get_client() builds a fresh client."""
+    with _lock:
+        _clients.clear()
+        _seen_streams.clear()
+
+
+def get_stats():
+    """Returns a copy of the client construction and connection reuse counters."""
+    with _lock:
+        return dict(_stats)
+
+
+def get_resilience_stats():
+    """Returns retry/hedge counters, circuit breaker state and latency histogram of Gemini calls."""
+    return resilience.get_stats()
@@ -0,0 +1,34 @@
+"""
+gunicorn settings, loaded automatically from the working directory.
+
+The app is imported once in the master (preload_app), which resolves the
+Firebase credentials. The master waits for them before forking workers, so
+no Secret Manager call is in flight during a fork and every worker inherits
+the result instead of fetching it again. The Storage and Firestore clients
+hold gRPC channels, which must not cross a fork, so they are only ever built
+in each worker after it starts (in the background, or before serving with
+STARTUP_LAZY_INIT=false), never in the master.
+"""
+import os
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# Read by startup.clients_built_in_workers(): the app must not build clients at import
+os.environ['STARTUP_CLIENTS_IN_WORKERS'] = 'true'
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    import app
+    app.firebase_credentials_init.wait(timeout=None)
+    server.log.info("Firebase credentials resolved before forking workers")
+
+
+def post_worker_init(worker):
+    import app
+    import startup
+    if startup.STARTUP_LAZY_INIT:
+        app.firebase_init.start()
+    else:
+        app.firebase_init.run()
@@ -0,0 +1,398 @@
+import os
+import re
+import copy
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime
+
+import metrics
+from image_cache import normalize_prompt
+
+# History index settings (overridable via env)
+HISTORY_INDEX_ENABLED = os.environ.get('HISTORY_INDEX_ENABLED', 'true').lower() == 'true'
+HISTORY_INDEX_PATH = os.environ.get('HISTORY_INDEX_PATH', 'history_index.sqlite3')
+HISTORY_SEARCH_LIMIT = int(os.environ.get('HISTORY_SEARCH_LIMIT', '50'))
+HISTORY_SEARCH_MAX_LIMIT = int(os.environ.get('HISTORY_SEARCH_MAX_LIMIT', '500'))
+HISTORY_BACKFILL_PAGE_SIZE = int(os.environ.get('HISTORY_BACKFILL_PAGE_SIZE', '500'))
+
+# Entry sources
+GENERATED = 'generated'
+FIRESTORE = 'firestore'
+STORAGE = 'storage'
+
+SEARCH_MODES = ('text', 'prefix')
+
+SEARCH_LATENCY = metrics.Histogram(
+    'history_search_duration_seconds', 'History index search latency by mode', labelnames=('mode',)
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY,            -- Minus created_at in microseconds: ascending rowid is newest first
+    ref TEXT NOT NULL UNIQUE,          -- blob name, or firestore:<doc id>
+    source TEXT NOT NULL,
+    prompt TEXT NOT NULL DEFAULT '',
+    prompt_key TEXT NOT NULL DEFAULT '',
+    filename TEXT,
+    content_hash TEXT,
+    bytes INTEGER,
+    image_url TEXT,
+    variants TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_prompt_key ON history(prompt_key);
+CREATE INDEX IF NOT EXISTS history_content_hash ON history(content_hash);
+CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+    prompt, filename, content='history', content_rowid='id', detail='none', prefix='2 3 4',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS history_insert AFTER INSERT ON history BEGIN
+    INSERT INTO history_fts(rowid, prompt, filename) VALUES (new.id, new.prompt, new.filename);
+END;
+CREATE TRIGGER IF NOT EXISTS history_delete AFTER DELETE ON history BEGIN
+    INSERT INTO history_fts(history_fts, rowid, prompt, filename) VALUES ('delete', old.id, old.prompt, old.filename);
+END;
+"""
+
+COLUMNS = 'id, source, prompt, filename, content_hash, bytes, image_url, variants, created_at'
+JOINED_COLUMNS = ', '.join(f'h.{column}' for column in COLUMNS.split(', '))
+# <slug>_<timestamp>.png, or <slug>_<timestamp>_<n>.png for candidate n of a multi-image request;
+# variants add _<name> (starting with a letter, so a candidate number is never read as one)
+GENERATED_NAME = re.compile(r'^(?P<stem>[^/]+)_(?P<timestamp>\d{14})(?:_(?P<candidate>\d+))?\.png$')
+VARIANT_NAME = re.compile(r'^(?P<stem>[^/]+_\d{14}(?:_\d+)?)_(?P<variant>[A-Za-z]\w*)\.\w+$')
+
+
+def to_epoch(value):
+    """Converts a Firestore/Storage timestamp (datetime, number or ISO string) to epoch seconds."""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            return None
+    if hasattr(value, 'seconds'):
+        return value.seconds + getattr(value, 'nanos', 0) / 1e9
+    return None
+
+
+def match_expression(query):
+    """
+    Turns free text into an FTS5 query: every word must match, and a word
+    ending in * matches as a prefix ('drag*' finds 'dragon'). Prefixes of up
+    to four characters are served from the prefix index; longer ones merge
+    every matching term and are slower for very common stems.
+    Returns None if the query has no words.
+    """
+    words = re.findall(r'(\w+)(\*?)', query.lower())
+    if not words:
+        return None
+    return ' '.join(f'"{word}"{star}' for word, star in words)
+
+
+class HistoryIndex:
+    """
+    Local SQLite index of generated images and saved prompts for history search.
+
+    Every generation is recorded with its prompt, filename, content hash,
+    size, variant URLs and timestamp; backfill_firestore() and
+    backfill_storage() load what predates the index. Prompts and filenames
+    are full-text indexed (FTS5), and rows are keyed by their timestamp in
+    microseconds, so newest-first text search reads the FTS doclist in
+    rowid order and stops at the page size instead of sorting every match.
+    Prefix search seeks the normalized-prompt index. The database is shared
+    by all worker processes on the machine (WAL mode); each thread uses its
+    own connection.
+    """
+
+    def __init__(self, path=HISTORY_INDEX_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._backfill = None  # Thread running a backfill in this process
+        self._stats = {
+            'indexed': 0,
+            'duplicates': 0,
+            'searches': 0,
+            'errors': 0,
+            'backfill': {'running': False},
+        }
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(SCHEMA)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self._stats[counter] += amount
+
+    # Writes
+
+    def add_many(self, entries):
+        """
+        Adds entries (dicts with ref, source, prompt, filename, content_hash,
+        bytes, image_url, variants, created_at) in one transaction. Entries
+        whose ref is already indexed are skipped. Returns how many were added.
+        """
+        conn = self._connect()
+        added = 0
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for entry in entries:
+                if conn.execute('SELECT 1 FROM history WHERE ref = ?', (entry['ref'],)).fetchone():
+                    continue
+                created_at = entry.get('created_at') or time.time()
+                row_id = -int(created_at * 1_000_000)
+                while conn.execute('SELECT 1 FROM history WHERE id = ?', (row_id,)).fetchone():
+                    row_id -= 1  # Same microsecond as another entry
+                variants = entry.get('variants')
+                conn.execute(
+                    'INSERT INTO history (id, ref, source, prompt, prompt_key, filename, content_hash,'
+                    ' bytes, image_url, variants, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (row_id, entry['ref'], entry['source'], entry.get('prompt') or '',
+                     normalize_prompt(entry.get('prompt')), entry.get('filename'), entry.get('content_hash'),
+                     entry.get('bytes'), entry.get('image_url'),
+                     json.dumps(variants) if variants else None, created_at)
+                )
+                added += 1
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        self._count('indexed', added)
+        self._count('duplicates', len(entries) - added)
+        return added
+
+    def add(self, **entry):
+        """Adds one entry; see add_many(). Returns True if it was new."""
+        return self.add_many([entry]) == 1
+
+    def set_variants(self, variants_by_ref):
+        """Fills in the variant map of already indexed entries that have none."""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'UPDATE history SET variants = ? WHERE ref = ? AND variants IS NULL',
+                [(json.dumps(variants), ref) for ref, variants in variants_by_ref.items()]
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def optimize(self):
+        """Merges the full-text index into one segment (worth it after a large backfill)."""
+        self._connect().execute("INSERT INTO history_fts(history_fts) VALUES ('optimize')")
+
+    # Search
+
+    def find_image_url(self, digest):
+        """Returns the public URL of the newest indexed image with this content hash, or None."""
+        row = self._connect().execute(
+            'SELECT image_url FROM history WHERE content_hash = ? AND image_url IS NOT NULL ORDER BY id LIMIT 1',
+            (digest,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def search(self, query, mode='text', limit=HISTORY_SEARCH_LIMIT, cursor=None):
+        """
+        Searches the index.
+
+        Args:
+            query: Free text ('text' mode) or the start of a prompt ('prefix' mode).
+            mode: 'text' matches every word in the prompt or filename, newest
+                first; 'prefix' matches prompts starting with the query
+                (case and whitespace insensitive), in prompt order.
+            limit: Page size.
+            cursor: The next_cursor of the previous page, or None.
+
+        Returns:
+            (entries, next_cursor); next_cursor is None on the last page.
+        """
+        conn = self._connect()
+        self._count('searches')
+        with metrics.stage('history', SEARCH_LATENCY, mode):
+            if mode == 'prefix':
+                key = normalize_prompt(query)
+                after = cursor or (key, -1)
+                rows = conn.execute(
+                    f'SELECT {COLUMNS}, prompt_key FROM history'
+                    ' WHERE prompt_key >= ? AND prompt_key < ? AND (prompt_key, id) > (?, ?)'
+                    ' ORDER BY prompt_key, id LIMIT ?',
+                    (key, key + '\U0010ffff', after[0], after[1], limit + 1)
+                ).fetchall()
+            else:
+                expression = match_expression(query)
+                if expression is None:
+                    return [], None
+                rows = conn.execute(
+                    f'SELECT {JOINED_COLUMNS} FROM ('
+                    '  SELECT rowid FROM history_fts WHERE history_fts MATCH ? AND rowid > ?'
+                    '  ORDER BY rowid LIMIT ?'
+                    ') AS hits JOIN history h ON h.id = hits.rowid ORDER BY h.id',
+                    (expression, cursor if cursor is not None else -2 ** 63, limit + 1)
+                ).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = (last['prompt_key'], last['id']) if mode == 'prefix' else last['id']
+        return [self._to_result(row) for row in rows], next_cursor
+
+    @staticmethod
+    def _to_result(row):
+        return {
+            'id': row['id'],
+            'source': row['source'],
+            'prompt': row['prompt'],
+            'filename': row['filename'],
+            'content_hash': row['content_hash'],
+            'bytes': row['bytes'],
+            'image_url': row['image_url'],
+            'variants': json.loads(row['variants']) if row['variants'] else None,
+            'created_at': datetime.fromtimestamp(row['created_at']).isoformat(),
+        }
+
+    # Backfill
+
+    def backfill_firestore(self, collection, page_size=HISTORY_BACKFILL_PAGE_SIZE):
+        """
+        Indexes every agent_responses document (response_content as the
+        prompt), reading the collection in created_at order, one page at a
+        time. Returns the number of new entries.
+        """
+        added = 0
+        cursor = None
+        while True:
+            query = (
+                collection.select(['response_content', 'prompt_text', 'created_at'])
+                .order_by('created_at')
+                .order_by('__name__')
+            )
+            if cursor:
+                query = query.start_after(cursor)
+            docs = list(query.limit(page_size).stream())
+            if not docs:
+                return added
+            entries = []
+            for doc in docs:
+                data = doc.to_dict() or {}
+                entries.append({
+                    'ref': f"firestore:{doc.id}",
+                    'source': FIRESTORE,
+                    'prompt': data.get('response_content') or data.get('prompt_text') or '',
+                    'created_at': to_epoch(data.get('created_at')),
+                })
+            added += self.add_many(entries)
+            self._progress(FIRESTORE, len(docs))
+            last = docs[-1]
+            cursor = {'created_at': (last.to_dict() or {}).get('created_at'), '__name__': last.id}
+            if len(docs) < page_size:
+                return added
+
+    def backfill_storage(self, bucket, page_size=HISTORY_BACKFILL_PAGE_SIZE):
+        """
+        Indexes the generated images at the top level of the bucket
+        (<prompt slug>_<timestamp>.png, the names make_filename() produces,
+        with an _<n> suffix for multi-image candidates), with the slug as the
+        prompt, and attaches their uploaded variants.
+        Returns the number of new entries.
+        """
+        added = 0
+        variants = {}
+        blobs = bucket.list_blobs(
+            page_size=page_size, delimiter='/',
+            fields='items(name,size,timeCreated,metadata,mediaLink),nextPageToken'
+        )
+        for page in blobs.pages:
+            entries = []
+            for blob in page:
+                variant = VARIANT_NAME.match(blob.name)
+                if variant and not blob.name.endswith('.png'):
+                    variants.setdefault(f"{variant.group('stem')}.png", {})[variant.group('variant')] = blob.public_url
+                    continue
+                generated = GENERATED_NAME.match(blob.name)
+                if not generated:
+                    continue
+                created_at = to_epoch(getattr(blob, 'time_created', None))
+                if created_at is None:
+                    created_at = datetime.strptime(generated.group('timestamp'), '%Y%m%d%H%M%S').timestamp()
+                entries.append({
+                    'ref': blob.name,
+                    'source': STORAGE,
+                    'prompt': generated.group('stem').replace('_', ' '),
+                    'filename': blob.name,
+                    'content_hash': (blob.metadata or {}).get('content_sha256'),
+                    'bytes': getattr(blob, 'size', None),
+                    'image_url': blob.public_url,
+                    'created_at': created_at,
+                })
+            if entries:
+                added += self.add_many(entries)
+            self._progress(STORAGE, len(entries))
+        if variants:
+            self.set_variants(variants)
+        return added
+
+    def _progress(self, source, count):
+        with self._lock:
+            backfill = self._stats['backfill']
+            backfill.setdefault('scanned', {}).setdefault(source, 0)
+            backfill['scanned'][source] += count
+
+    def start_backfill(self, sources):
+        """
+        Runs the given backfills ({name: callable returning the number added})
+        on a background thread. Returns False if one is already running here.
+        """
+        with self._lock:
+            if self._backfill is not None and self._backfill.is_alive():
+                return False
+            self._stats['backfill'] = {'running': True, 'started_at': time.time(), 'added': {}}
+            self._backfill = threading.Thread(
+                target=self._run_backfill, args=(sources,), name='history-backfill', daemon=True
+            )
+            self._backfill.start()
+        return True
+
+    def _run_backfill(self, sources):
+        for name, run in sources.items():
+            try:
+                added = run()
+                print(f"History backfill from {name}: {added} new entries")
+            except Exception as e:
+                print(f"Error backfilling history from {name}: {e}")
+                self._count('errors')
+                added = None
+            with self._lock:
+                self._stats['backfill']['added'][name] = added
+        try:
+            self.optimize()
+        except Exception as e:
+            print(f"Error optimizing history index: {e}")
+        with self._lock:
+            self._stats['backfill']['running'] = False
+            self._stats['backfill']['finished_at'] = time.time()
+
+    def get_stats(self):
+        """Returns write/search counters and the state of the last backfill."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['backfill'] = copy.deepcopy(self._stats['backfill'])
+        stats['path'] = self.path
+        return stats
@@ -0,0 +1,339 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Cache settings (overridable via env)
+IMAGE_CACHE_MAX_ENTRIES = int(os.environ.get('IMAGE_CACHE_MAX_ENTRIES', '256'))
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+IMAGE_CACHE_TTL = float(os.environ.get('IMAGE_CACHE_TTL', '86400'))
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR')  # Disk tier is off unless set
+IMAGE_CACHE_MAX_UPLOADS = int(os.environ.get('IMAGE_CACHE_MAX_UPLOADS', '10000'))  # Upload records in memory
+IMAGE_CACHE_DISK_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_DISK_MAX_BYTES', str(2 * 1024 ** 3)))
+IMAGE_CACHE_DISK_SWEEP_INTERVAL = float(os.environ.get('IMAGE_CACHE_DISK_SWEEP_INTERVAL', '300'))
+
+STALE_TMP_SECONDS = 3600  # Temp files older than this were left by a crashed writer
+
+
+def normalize_prompt(prompt):
+    """Collapses whitespace and case so trivially different prompts share a cache entry."""
+    return re.sub(r'\s+', ' ', prompt or '').strip().casefold()
+
+
+def content_hash(image_data):
+    """Returns the SHA-256 hex digest used to address image bytes."""
+    return hashlib.sha256(image_data).hexdigest()
+
+
+def _config_fingerprint(config):
+    """Serializes a GenerateContentConfig (or plain dict) deterministically."""
+    if config is None:
+        return ''
+    if hasattr(config, 'model_dump'):
+        config = config.model_dump(mode='json', exclude_none=True)
+    try:
+        return json.dumps(config, sort_keys=True, default=str)
+    except TypeError:
+        return repr(config)
+
+
+def make_key(prompt, model, config=None):
+    """
+    Builds the cache key for a generation request.
+
+    Args:
+        prompt: The raw text prompt.
+        model: The Gemini model name.
+        config: The GenerateContentConfig used for the call.
+
+    Returns:
+        A hex digest identifying the (prompt, model, config) combination.
+    """
+    raw = '\x1f'.join([normalize_prompt(prompt), model or '', _config_fingerprint(config)])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class CacheEntry:
+    """A cached generation result."""
+
+    __slots__ = ('image_data', 'text_response', 'content_hash', 'created_at')
+
+    def __init__(self, image_data, text_response, digest=None, created_at=None):
+        self.image_data = image_data
+        self.text_response = text_response
+        self.content_hash = digest or content_hash(image_data)
+        self.created_at = created_at if created_at is not None else time.time()
+
+    @property
+    def size(self):
+        return len(self.image_data)
+
+
+class ImageCache:
+    """
+    Prompt -> image cache with an in-memory LRU tier and an optional disk tier.
+
+    The memory tier is bounded by entry count and total image bytes. The disk
+    tier stores PNG bytes under their content hash (<hash>.png) and a small
+    JSON index per cache key (<key>.json) pointing at it, so identical images
+    produced by different prompts are stored once. It also remembers where a
+    given content hash was uploaded (an LRU of max_uploads records), so
+    callers can skip re-uploading it. The disk tier is swept at most every
+    sweep_interval seconds: files past the TTL are removed, then the least
+    recently written images until the PNGs fit in disk_max_bytes.
+    """
+
+    def __init__(self, max_entries=IMAGE_CACHE_MAX_ENTRIES, max_bytes=IMAGE_CACHE_MAX_BYTES,
+                 ttl=IMAGE_CACHE_TTL, disk_dir=IMAGE_CACHE_DIR, max_uploads=IMAGE_CACHE_MAX_UPLOADS,
+                 disk_max_bytes=IMAGE_CACHE_DISK_MAX_BYTES, sweep_interval=IMAGE_CACHE_DISK_SWEEP_INTERVAL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.max_uploads = max_uploads
+        self.disk_max_bytes = disk_max_bytes
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._last_sweep = 0.0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._uploads = OrderedDict()  # content hash -> {'blob_name': ..., 'url': ...}, least recently used first
+        self._stats = {
+            'hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'upload_reuses': 0,
+            'disk_evictions': 0,
+        }
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _expired(self, created_at):
+        return self.ttl > 0 and time.time() - created_at > self.ttl
+
+    def _evict_locked(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, old = self._entries.popitem(last=False)
+            self._bytes -= old.size
+            self._stats['evictions'] += 1
+
+    def _store_locked(self, key, entry):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.size
+        if entry.size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._bytes += entry.size
+        self._evict_locked()
+
+    def get(self, key):
+        """Returns the CacheEntry for key, or None on a miss or expired entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._expired(entry.created_at):
+                    self._entries.pop(key)
+                    self._bytes -= entry.size
+                    self._stats['expirations'] += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['disk_hits'] += 1
+            self._store_locked(key, entry)
+        return entry
+
+    def put(self, key, image_data, text_response=''):
+        """Stores a generation result and returns its CacheEntry."""
+        entry = CacheEntry(image_data, text_response)
+        with self._lock:
+            self._store_locked(key, entry)
+        self._write_disk(key, entry)
+        return entry
+
+    def remember_upload(self, digest, blob_name, url):
+        """Records that the image with this content hash lives at blob_name/url."""
+        record = {'blob_name': blob_name, 'url': url}
+        with self._lock:
+            self._remember_upload_locked(digest, record)
+        if self.disk_dir:
+            self._write_json(os.path.join(self.disk_dir, f"{digest}.upload.json"), record)
+
+    def get_upload(self, digest):
+        """Returns {'blob_name', 'url'} for a previously uploaded content hash, or None."""
+        with self._lock:
+            record = self._uploads.get(digest)
+            if record is not None:
+                self._uploads.move_to_end(digest)
+        if record is None and self.disk_dir:
+            record = self._read_json(os.path.join(self.disk_dir, f"{digest}.upload.json"))
+            if record:
+                with self._lock:
+                    self._remember_upload_locked(digest, record)
+        return record
+
+    def _remember_upload_locked(self, digest, record):
+        self._uploads[digest] = record
+        self._uploads.move_to_end(digest)
+        while len(self._uploads) > self.max_uploads:
+            self._uploads.popitem(last=False)
+
+    def forget_upload(self, digest):
+        """Drops a stale upload record (e.g. the blob was deleted from the bucket)."""
+        with self._lock:
+            self._uploads.pop(digest, None)
+        if self.disk_dir:
+            try:
+                os.remove(os.path.join(self.disk_dir, f"{digest}.upload.json"))
+            except OSError:
+                pass
+
+    def count_upload_reuse(self):
+        with self._lock:
+            self._stats['upload_reuses'] += 1
+
+    def clear(self):
+        """Empties the memory tier (the disk tier is left in place)."""
+        with self._lock:
+            self._entries.clear()
+            self._uploads.clear()
+            self._bytes = 0
+
+    def get_stats(self):
+        """Returns hit/miss/eviction counters and current memory usage."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        return stats
+
+    # Disk tier helpers
+
+    @staticmethod
+    def _read_json(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_json(path, data):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing image cache file '{path}': {e}")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        index = self._read_json(os.path.join(self.disk_dir, f"{key}.json"))
+        if not index or self._expired(index.get('created_at', 0)):
+            return None
+        try:
+            with open(os.path.join(self.disk_dir, f"{index['content_hash']}.png"), 'rb') as f:
+                image_data = f.read()
+        except (OSError, KeyError):
+            return None
+        return CacheEntry(image_data, index.get('text_response', ''),
+                          index['content_hash'], index['created_at'])
+
+    def _write_disk(self, key, entry):
+        if not self.disk_dir:
+            return
+        image_path = os.path.join(self.disk_dir, f"{entry.content_hash}.png")
+        try:
+            os.utime(image_path)  # Already stored by another prompt: mark it recently used
+        except OSError:
+            tmp_path = f"{image_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(entry.image_data)
+                os.replace(tmp_path, image_path)
+            except OSError as e:
+                print(f"Error writing cached image '{image_path}': {e}")
+                return
+        self._write_json(os.path.join(self.disk_dir, f"{key}.json"), {
+            'content_hash': entry.content_hash,
+            'text_response': entry.text_response,
+            'created_at': entry.created_at,
+        })
+        self._maybe_sweep_disk()
+
+    def _maybe_sweep_disk(self):
+        now = time.time()
+        if now - self._last_sweep < self.sweep_interval or not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_sweep = now
+            self.sweep_disk()
+        finally:
+            self._sweep_lock.release()
+
+    def sweep_disk(self):
+        """
+        Bounds the disk tier: removes index, upload and image files older than
+        the TTL and stale temp files, then the least recently written images
+        until the PNGs fit in disk_max_bytes. Returns the number of files removed.
+        Safe to run from several processes sharing the directory.
+        """
+        if not self.disk_dir:
+            return 0
+        now = time.time()
+        images = []
+        removed = 0
+        try:
+            names = os.listdir(self.disk_dir)
+        except OSError as e:
+            print(f"Error listing image cache directory '{self.disk_dir}': {e}")
+            return 0
+        for name in names:
+            path = os.path.join(self.disk_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            age = now - stat.st_mtime
+            if name.endswith('.tmp'):
+                expired = age > STALE_TMP_SECONDS
+            else:
+                expired = self.ttl > 0 and age > self.ttl
+            if expired:
+                removed += self._remove(path)
+            elif name.endswith('.png'):
+                images.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in images)
+        for _, size, path in sorted(images):
+            if total <= self.disk_max_bytes:
+                break
+            removed += self._remove(path)
+            total -= size
+        if removed:
+            with self._lock:
+                self._stats['disk_evictions'] += removed
+        return removed
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
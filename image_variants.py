@@ -0,0 +1,136 @@
+import io
+import os
+import json
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, features
+
+# Variant settings (overridable via env). IMAGE_VARIANTS is a JSON list of
+# {"name", "format", "quality", "max_size"} objects; max_size (longest edge
+# in pixels) turns a variant into a thumbnail.
+DEFAULT_VARIANTS = [
+    {'name': 'webp', 'format': 'WEBP', 'quality': 80},
+    {'name': 'thumb', 'format': 'WEBP', 'quality': 70, 'max_size': 256},
+]
+IMAGE_VARIANTS_ENABLED = os.environ.get('IMAGE_VARIANTS_ENABLED', 'true').lower() == 'true'
+IMAGE_VARIANT_PROCESSES = int(os.environ.get('IMAGE_VARIANT_PROCESSES', '2'))
+
+FORMAT_INFO = {
+    'WEBP': ('webp', 'image/webp'),
+    'JPEG': ('jpg', 'image/jpeg'),
+    'AVIF': ('avif', 'image/avif'),
+    'PNG': ('png', 'image/png'),
+}
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_specs = None  # Parsed IMAGE_VARIANTS, loaded on first use
+
+
+def _format_supported(fmt):
+    """Checks whether this Pillow build can encode the format (AVIF needs a plugin)."""
+    if fmt == 'WEBP':
+        return features.check('webp')
+    if fmt == 'AVIF':
+        return 'AVIF' in Image.SAVE or 'AVIF' in Image.registered_extensions().values()
+    return fmt in FORMAT_INFO
+
+
+def load_variant_specs():
+    """Returns the configured variant specs, dropping formats Pillow cannot encode."""
+    specs = DEFAULT_VARIANTS
+    raw = os.environ.get('IMAGE_VARIANTS')
+    if raw:
+        try:
+            specs = json.loads(raw)
+        except ValueError as e:
+            print(f"Invalid IMAGE_VARIANTS, using defaults: {e}")
+    usable = []
+    for spec in specs:
+        fmt = spec.get('format', 'WEBP').upper()
+        if not _format_supported(fmt):
+            print(f"Skipping image variant '{spec.get('name')}': {fmt} encoding not available.")
+            continue
+        usable.append(dict(spec, format=fmt))
+    return usable
+
+
+def encode_variants(image_data, specs):
+    """
+    Decodes the image once and encodes every requested variant.
+    Runs inside the process pool, so it only takes and returns plain data.
+
+    Args:
+        image_data: The original image bytes.
+        specs: List of variant spec dicts (see DEFAULT_VARIANTS).
+
+    Returns:
+        A list of dicts with 'name', 'extension', 'content_type', 'data',
+        'width' and 'height' for each variant.
+    """
+    source = Image.open(io.BytesIO(image_data))
+    source.load()
+    variants = []
+    for spec in specs:
+        image = source
+        if spec.get('max_size'):
+            image = source.copy()
+            image.thumbnail((spec['max_size'], spec['max_size']))
+        fmt = spec['format']
+        if fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        buffer = io.BytesIO()
+        save_args = {'quality': spec.get('quality', 80)}
+        if fmt == 'WEBP':
+            save_args['method'] = spec.get('method', 4)
+        elif fmt == 'JPEG':
+            save_args['optimize'] = True
+            save_args['progressive'] = True
+        image.save(buffer, format=fmt, **save_args)
+        extension, content_type = FORMAT_INFO[fmt]
+        variants.append({
+            'name': spec['name'],
+            'extension': extension,
+            'content_type': content_type,
+            'data': buffer.getvalue(),
+            'width': image.width,
+            'height': image.height,
+        })
+    return variants
+
+
+def _get_pool():
+    """Returns this process's encoder pool, creating it lazily (and again after a fork)."""
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # Spawned (not forked) children: forking a threaded server process can deadlock
+            _pool = ProcessPoolExecutor(
+                max_workers=IMAGE_VARIANT_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+            _pool_pid = os.getpid()
+    return _pool
+
+
+def submit_variants(image_data, specs=None):
+    """
+    Starts encoding variants off the request thread.
+    Returns a Future resolving to encode_variants() output, or None when
+    variants are disabled or none are configured.
+    """
+    global _specs
+    if not IMAGE_VARIANTS_ENABLED:
+        return None
+    if specs is None:
+        if _specs is None:
+            _specs = load_variant_specs()
+        specs = _specs
+    if not specs:
+        return None
+    return _get_pool().submit(encode_variants, image_data, specs)
@@ -0,0 +1,190 @@
+import os
+import time
+import uuid
+import queue
+import threading
+
+# Job queue settings (overridable via env)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '4'))
+JOB_MAX_QUEUE = int(os.environ.get('JOB_MAX_QUEUE', '32'))
+JOB_RESULT_TTL = float(os.environ.get('JOB_RESULT_TTL', '900'))
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+TERMINAL_STATES = (SUCCEEDED, FAILED)
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue is at capacity; retry_after is a hint in seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Job queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Job:
+    """A single generation job and its current state."""
+
+    def __init__(self, payload):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.version = 0  # Bumped on every state change, used by event streams
+
+    def to_dict(self, include_result=True):
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if self.error is not None:
+            data['error'] = self.error
+        if include_result and self.result is not None:
+            data['result'] = self.result
+        return data
+
+
+class JobQueue:
+    """
+    Bounded queue of generation jobs executed by a fixed pool of worker threads.
+
+    submit() never blocks: when the queue is full it raises QueueFullError so
+    the caller can answer 429 with a Retry-After hint. Workers are started on
+    first use (and again after a fork), so importing the module under a
+    preloading gunicorn master does not leak threads into workers.
+    """
+
+    def __init__(self, handler, workers=JOB_WORKERS, max_queue=JOB_MAX_QUEUE, result_ttl=JOB_RESULT_TTL):
+        self.handler = handler
+        self.workers = workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}
+        self._threads = []
+        self._owner_pid = None
+        self._avg_duration = 10.0  # Seconds, refined as jobs complete
+        self._stats = {'submitted': 0, 'rejected': 0, 'succeeded': 0, 'failed': 0}
+
+    def _ensure_workers(self):
+        if self._owner_pid == os.getpid():
+            return
+        with self._lock:
+            if self._owner_pid == os.getpid():
+                return
+            if self._owner_pid is not None:
+                # Forked: inherited threads and queued work do not exist here
+                self._queue = queue.Queue(maxsize=self.max_queue)
+                self._jobs.clear()
+            self._threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._owner_pid = os.getpid()
+
+    def _retry_after(self):
+        waves = (self._queue.qsize() // max(self.workers, 1)) + 1
+        return max(1, int(round(waves * self._avg_duration)))
+
+    def _prune_locked(self):
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.status in TERMINAL_STATES and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, payload):
+        """
+        Enqueues a job for the handler.
+
+        Args:
+            payload: Dict of arguments passed to the handler as keyword arguments.
+
+        Returns:
+            The queued Job.
+
+        Raises:
+            QueueFullError: If the queue is at capacity.
+        """
+        self._ensure_workers()
+        job = Job(payload)
+        with self._lock:
+            self._prune_locked()
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self._stats['rejected'] += 1
+                raise QueueFullError(self._retry_after())
+            self._jobs[job.id] = job
+            self._stats['submitted'] += 1
+        return job
+
+    def get(self, job_id):
+        """Returns the Job with this id, or None if unknown or expired."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait_for_change(self, job, seen_version, timeout):
+        """
+        Blocks until job.version differs from seen_version or timeout elapses.
+        Returns the job's current version.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: job.version != seen_version, timeout=timeout)
+            return job.version
+
+    def _update(self, job, **fields):
+        with self._changed:
+            for name, value in fields.items():
+                setattr(job, name, value)
+            job.version += 1
+            self._changed.notify_all()
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            self._update(job, status=RUNNING, started_at=time.time())
+            try:
+                result = self.handler(**job.payload)
+            except Exception as e:
+                print(f"Error running job {job.id}: {e}")
+                result = None
+                error = str(e)
+            else:
+                error = result.get('message') if result.get('status') == 'error' else None
+
+            finished_at = time.time()
+            with self._lock:
+                duration = finished_at - job.started_at
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+                self._stats[FAILED if error else SUCCEEDED] += 1
+            self._update(job, status=FAILED if error else SUCCEEDED,
+                         result=result, error=error, finished_at=finished_at)
+            self._queue.task_done()
+
+    def depth(self):
+        """Returns the number of jobs waiting for a worker."""
+        return self._queue.qsize()
+
+    def get_stats(self):
+        """Returns submission/rejection counters and current queue depth."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['queue_depth'] = self._queue.qsize()
+            stats['max_queue'] = self.max_queue
+            stats['workers'] = self.workers
+            stats['tracked_jobs'] = len(self._jobs)
+        return stats
@@ -0,0 +1,178 @@
+"""
+Minimal Prometheus-style metrics: counters, histograms and scrape-time
+callbacks, rendered in the text exposition format by render().
+
+stage() times one step of a request: it feeds a histogram and, inside a
+request started with start_request(), adds the step to that request's
+Server-Timing header. Recording is a bisect and a short lock per
+observation, so it stays cheap on the request path.
+"""
+import os
+import math
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_PREFIX = 'imagegen_'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = (16e3, 64e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6, 16e6)
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+_metrics = []  # Registered metrics, in registration order
+_callbacks = []  # (name, type, help, fn, labelnames) sampled at scrape time
+_timings = contextvars.ContextVar('server_timings', default=None)
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and math.isinf(value):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count, optionally split by label values."""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = METRICS_PREFIX + name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        _metrics.append(self)
+
+    def inc(self, amount=1, *labelvalues):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        for labelvalues, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram with sum and count, optionally split by label values."""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS, labelnames=()):
+        self.name = METRICS_PREFIX + name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+        _metrics.append(self)
+
+    def observe(self, value, *labelvalues):
+        if not METRICS_ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labelvalues, series in snapshot.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, labelvalues, ('le', _format_value(float(bound))))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum{labels} {_format_value(series[-1])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+def register_callback(name, type, help, fn, labelnames=()):
+    """
+    Registers a metric sampled at scrape time. fn returns a number, or (with
+    labelnames) a dict mapping label-value tuples to numbers. Used to expose
+    counters the modules already keep (cache hits, queue depth, ...).
+    """
+    _callbacks.append((METRICS_PREFIX + name, type, help, fn, tuple(labelnames)))
+
+
+def render():
+    """Returns all metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.render())
+    for name, type, help, fn, labelnames in _callbacks:
+        try:
+            value = fn()
+        except Exception as e:
+            print(f"Error collecting metric '{name}': {e}")
+            continue
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {type}")
+        samples = value.items() if isinstance(value, dict) else [((), value)]
+        for labelvalues, sample in samples:
+            if sample is None:
+                continue
+            lines.append(f"{name}{_format_labels(labelnames, labelvalues)} {_format_value(sample)}")
+    return '\n'.join(lines) + '\n'
+
+
+# Per-request stage timing
+
+def start_request():
+    """Starts collecting Server-Timing entries for the current request (thread or task)."""
+    _timings.set([])
+
+
+@contextmanager
+def stage(name, histogram=None, *labelvalues):
+    """Times a block into histogram and, within a request, into its Server-Timing header."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        if histogram is not None:
+            histogram.observe(elapsed, *labelvalues)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def server_timing_header(total=None):
+    """Returns the Server-Timing value for the current request (e.g. 'gemini;dur=812.3, total;dur=830.1')."""
+    entries = _timings.get() or []
+    if total is not None:
+        entries = entries + [('total', total)]
+    return ', '.join(f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in entries)
+
+
+def finish_request():
+    """Stops collecting Server-Timing entries for the current request."""
+    _timings.set(None)
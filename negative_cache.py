@@ -0,0 +1,118 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# Negative cache settings (overridable via env)
+NEGATIVE_CACHE_MAX_ENTRIES = int(os.environ.get('NEGATIVE_CACHE_MAX_ENTRIES', '1024'))
+NEGATIVE_CACHE_BLOCK_TTL = float(os.environ.get('NEGATIVE_CACHE_BLOCK_TTL', '600'))
+NEGATIVE_CACHE_EMPTY_TTL = float(os.environ.get('NEGATIVE_CACHE_EMPTY_TTL', '60'))
+NEGATIVE_CACHE_TRANSIENT_TTL = float(os.environ.get('NEGATIVE_CACHE_TRANSIENT_TTL', '30'))
+
+# Failure classes
+SAFETY_BLOCKED = 'safety_blocked'
+EMPTY_RESPONSE = 'empty_response'
+TRANSIENT_ERROR = 'transient_error'
+DETERMINISTIC_FAILURES = (SAFETY_BLOCKED, EMPTY_RESPONSE)  # Answered from the cache
+
+
+class NegativeEntry:
+    """A recent failed generation for one cache key."""
+
+    __slots__ = ('kind', 'message', 'created_at', 'expires_at', 'failures')
+
+    def __init__(self, kind, message, ttl, failures=1):
+        self.kind = kind
+        self.message = message
+        self.created_at = time.time()
+        self.expires_at = self.created_at + ttl
+        self.failures = failures
+
+
+class NegativeCache:
+    """
+    Short-lived cache of failed generations, keyed like ImageCache.
+
+    Safety blocks and empty responses are deterministic for a prompt, so a
+    repeat of the same prompt within the TTL is answered with the stored
+    failure instead of another model call. Transient errors are remembered
+    too, but never answered from the cache: the caller retries them, backing
+    off further for prompts with recent transient_failures().
+    """
+
+    def __init__(self, max_entries=NEGATIVE_CACHE_MAX_ENTRIES, block_ttl=NEGATIVE_CACHE_BLOCK_TTL,
+                 empty_ttl=NEGATIVE_CACHE_EMPTY_TTL, transient_ttl=NEGATIVE_CACHE_TRANSIENT_TTL):
+        self.max_entries = max_entries
+        self.ttls = {
+            SAFETY_BLOCKED: block_ttl,
+            EMPTY_RESPONSE: empty_ttl,
+            TRANSIENT_ERROR: transient_ttl,
+        }
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {
+            'hits': 0,
+            'saved_model_calls': 0,
+            'stored': {kind: 0 for kind in self.ttls},
+            'expirations': 0,
+        }
+
+    def get(self, key):
+        """
+        Returns the NegativeEntry to answer with for key (a deterministic
+        failure within its TTL), or None if the model should be called.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() >= entry.expires_at:
+                del self._entries[key]
+                self._stats['expirations'] += 1
+                return None
+            if entry.kind not in DETERMINISTIC_FAILURES:
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            self._stats['saved_model_calls'] += 1
+            return entry
+
+    def put(self, key, kind, message):
+        """Records a failed generation of the given failure class."""
+        ttl = self.ttls.get(kind, 0)
+        if ttl <= 0:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            failures = 1
+            if previous is not None and previous.kind == kind and time.time() < previous.expires_at:
+                failures = previous.failures + 1
+            self._entries[key] = NegativeEntry(kind, message, ttl, failures)
+            self._stats['stored'][kind] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget(self, key):
+        """Drops the entry for key (e.g. after a successful generation)."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def transient_failures(self, key):
+        """Returns how many times in a row key recently failed with a transient error."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.kind != TRANSIENT_ERROR or time.time() >= entry.expires_at:
+                return 0
+            return entry.failures
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        """Returns hit, saved-call and per-class counters."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['stored'] = dict(self._stats['stored'])
+            stats['entries'] = len(self._entries)
+        return stats
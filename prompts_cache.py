@@ -0,0 +1,278 @@
+import os
+import time
+import bisect
+import hashlib
+import threading
+from datetime import datetime
+from collections import OrderedDict
+
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+import metrics
+
+# Cache settings (overridable via env)
+PROMPTS_CACHE_ENABLED = os.environ.get('PROMPTS_CACHE_ENABLED', 'true').lower() == 'true'
+PROMPTS_CACHE_MODE = os.environ.get('PROMPTS_CACHE_MODE', 'snapshot')  # 'snapshot' or 'poll'
+PROMPTS_CACHE_POLL_INTERVAL = float(os.environ.get('PROMPTS_CACHE_POLL_INTERVAL', '10'))
+PROMPTS_CACHE_FULL_REFRESH = float(os.environ.get('PROMPTS_CACHE_FULL_REFRESH', '3600'))
+PROMPTS_CACHE_MAX_ETAGS = int(os.environ.get('PROMPTS_CACHE_MAX_ETAGS', '256'))  # ETags kept per version
+
+# Firestore metrics, shared with the routes in app.py that query directly
+FIRESTORE_QUERY_LATENCY = metrics.Histogram(
+    'firestore_query_duration_seconds', 'Firestore query latency by query', labelnames=('query',)
+)
+FIRESTORE_DOCUMENTS_READ = metrics.Counter(
+    'firestore_documents_read_total', 'Documents read from Firestore by query', labelnames=('query',)
+)
+
+
+def sort_key(created_at, doc_id):
+    """
+    Orders created_at values the way Firestore does across types
+    (numbers < timestamps < strings), with the document id as tie-break.
+    Returns None for documents an order_by('created_at') query would skip.
+    """
+    if isinstance(created_at, bool) or created_at is None:
+        return None
+    if isinstance(created_at, (int, float)):
+        return (0, created_at, doc_id)
+    if isinstance(created_at, datetime):
+        return (1, created_at.timestamp(), doc_id)
+    if isinstance(created_at, str):
+        return (2, created_at, doc_id)
+    return None
+
+
+class PromptsCache:
+    """
+    In-process read-through cache of the agent_responses collection.
+
+    Every document is held once, already converted for the frontend, in a
+    sorted index mirroring the Firestore order_by('created_at', '__name__')
+    query. The index is kept fresh incrementally: by default a Firestore
+    on_snapshot listener pushes only changed documents; in 'poll' mode a
+    background thread fetches documents with created_at newer than the last
+    one seen (plus a periodic full refresh to pick up edits and deletes).
+    Until the first sync completes, callers should fall back to Firestore.
+    """
+
+    def __init__(self, get_collection, to_prompt, fields, mode=PROMPTS_CACHE_MODE,
+                 poll_interval=PROMPTS_CACHE_POLL_INTERVAL, full_refresh=PROMPTS_CACHE_FULL_REFRESH,
+                 max_etags=PROMPTS_CACHE_MAX_ETAGS):
+        self.get_collection = get_collection
+        self.to_prompt = to_prompt
+        self.fields = fields
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.full_refresh = full_refresh
+        self.max_etags = max_etags
+        self._lock = threading.Lock()
+        self._prompts = {}  # doc id -> (sort key, prompt dict, raw created_at)
+        self._keys = []  # sorted sort keys
+        self._version = 0
+        self._ready = False
+        self._started_pid = None
+        self._watch = None
+        self._last_seen = None  # Newest created_at seen (poll mode)
+        self._last_sync = None
+        self._last_change = None
+        self._etags = OrderedDict()  # (version, page params) -> ETag, least recently used first
+        self._stats = {'hits': 0, 'misses': 0, 'deltas': 0, 'full_loads': 0, 'sync_errors': 0}
+
+    # Sync
+
+    def start(self):
+        """Starts the listener or poller once per process; safe to call on every request."""
+        if self._started_pid == os.getpid():
+            return
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            if self._started_pid is not None:
+                # Forked: the parent's listener thread does not exist here
+                self._prompts.clear()
+                self._keys = []
+                self._ready = False
+                self._watch = None
+            self._started_pid = os.getpid()
+
+        collection = self.get_collection()
+        if collection is None:
+            with self._lock:
+                self._started_pid = None
+            return
+        if self.mode == 'snapshot':
+            try:
+                self._watch = collection.on_snapshot(self._on_snapshot)
+                print("Watching agent_responses for changes.")
+                return
+            except Exception as e:
+                print(f"Could not start Firestore listener, polling instead: {e}")
+        threading.Thread(target=self._poll_loop, name='prompts-cache-poller', daemon=True).start()
+
+    def _put_locked(self, doc, data, bulk=False):
+        # In bulk loads keys are appended and sorted once at the end
+        self._remove_locked(doc.id)
+        key = sort_key(data.get('created_at'), doc.id)
+        if key is None:
+            return
+        self._prompts[doc.id] = (key, self.to_prompt(doc), data.get('created_at'))
+        if bulk:
+            self._keys.append(key)
+        else:
+            bisect.insort(self._keys, key)
+
+    def _remove_locked(self, doc_id):
+        existing = self._prompts.pop(doc_id, None)
+        if existing is not None:
+            index = bisect.bisect_left(self._keys, existing[0])
+            if index < len(self._keys) and self._keys[index] == existing[0]:
+                del self._keys[index]
+
+    def _mark_synced_locked(self, changed):
+        now = time.time()
+        self._last_sync = now
+        if changed:
+            self._version += 1
+            self._last_change = now
+            self._etags.clear()
+        self._ready = True
+
+    def _on_snapshot(self, docs, changes, read_time):
+        """Firestore listener callback: applies only the changed documents."""
+        FIRESTORE_DOCUMENTS_READ.inc(len(changes), 'cache_snapshot')
+        with self._lock:
+            bulk = not self._ready  # The first snapshot carries the whole collection
+            for change in changes:
+                if change.type.name == 'REMOVED':
+                    self._remove_locked(change.document.id)
+                else:
+                    self._put_locked(change.document, change.document.to_dict() or {}, bulk)
+            if bulk:
+                self._keys.sort()
+            if self._ready:
+                self._stats['deltas'] += len(changes)
+            else:
+                self._stats['full_loads'] += 1
+            self._mark_synced_locked(bool(changes))
+
+    def _full_load(self, collection):
+        with metrics.stage('firestore', FIRESTORE_QUERY_LATENCY, 'cache_full_load'):
+            docs = list(collection.select(self.fields).stream())
+        FIRESTORE_DOCUMENTS_READ.inc(len(docs), 'cache_full_load')
+        with self._lock:
+            self._prompts.clear()
+            self._keys = []
+            for doc in docs:
+                data = doc.to_dict() or {}
+                self._put_locked(doc, data, bulk=True)
+                created_at = data.get('created_at')
+                if isinstance(created_at, datetime) and (self._last_seen is None or created_at > self._last_seen):
+                    self._last_seen = created_at
+            self._keys.sort()
+            self._stats['full_loads'] += 1
+            self._mark_synced_locked(True)
+
+    def _poll_delta(self, collection):
+        query = collection.select(self.fields).order_by('created_at')
+        if self._last_seen is not None:
+            query = query.where(filter=FieldFilter('created_at', '>', self._last_seen))
+        with metrics.stage('firestore', FIRESTORE_QUERY_LATENCY, 'cache_delta'):
+            docs = list(query.stream())
+        FIRESTORE_DOCUMENTS_READ.inc(len(docs), 'cache_delta')
+        with self._lock:
+            for doc in docs:
+                data = doc.to_dict() or {}
+                self._put_locked(doc, data)
+                created_at = data.get('created_at')
+                if isinstance(created_at, datetime) and (self._last_seen is None or created_at > self._last_seen):
+                    self._last_seen = created_at
+            self._stats['deltas'] += len(docs)
+            self._mark_synced_locked(bool(docs))
+
+    def _poll_loop(self):
+        last_full = 0.0
+        while True:
+            collection = self.get_collection()
+            if collection is not None:
+                try:
+                    if not self._ready or time.time() - last_full > self.full_refresh:
+                        self._full_load(collection)
+                        last_full = time.time()
+                    else:
+                        self._poll_delta(collection)
+                except Exception as e:
+                    with self._lock:
+                        self._stats['sync_errors'] += 1
+                    print(f"Error refreshing saved prompts cache: {e}")
+            time.sleep(self.poll_interval)
+
+    # Reads
+
+    def get_page(self, limit, cursor=None):
+        """
+        Returns one page of prompts, newest first, starting after the
+        (created_at, id) cursor, as (prompts, next_cursor, version);
+        next_cursor is None on the last page. Returns None if the cache has
+        not synced yet.
+        """
+        self.start()
+        with self._lock:
+            if not self._ready:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            end = len(self._keys)
+            if cursor is not None:
+                cursor_key = sort_key(cursor[0], cursor[1])
+                end = bisect.bisect_left(self._keys, cursor_key) if cursor_key else 0
+            start = max(0, end - limit)
+            keys = self._keys[start:end][::-1]
+            prompts = [self._prompts[key[2]][1] for key in keys]
+            next_cursor = None
+            if start > 0 and keys:
+                last_id = keys[-1][2]
+                next_cursor = (self._prompts[last_id][2], last_id)
+            return prompts, next_cursor, self._version
+
+    def get_prompt(self, doc_id):
+        """Returns the cached prompt dict, or None on a miss (unsynced or unknown id)."""
+        self.start()
+        with self._lock:
+            entry = self._prompts.get(doc_id) if self._ready else None
+            self._stats['hits' if entry else 'misses'] += 1
+            return (entry[1], self._version) if entry else None
+
+    def cached_etag(self, version, params):
+        """Returns the ETag already computed for these request params at this version, if any."""
+        with self._lock:
+            etag = self._etags.get((version, params))
+            if etag is not None:
+                self._etags.move_to_end((version, params))
+            return etag
+
+    def store_etag(self, version, params, body):
+        """Computes a strong ETag from the response body and remembers it (LRU) for this version."""
+        etag = hashlib.sha1(body).hexdigest()
+        with self._lock:
+            if version == self._version and self.max_etags > 0:
+                # Bounded: params carry the client's page_token and limit
+                self._etags[(version, params)] = etag
+                self._etags.move_to_end((version, params))
+                while len(self._etags) > self.max_etags:
+                    self._etags.popitem(last=False)
+        return etag
+
+    def get_stats(self):
+        """Returns hit/miss counters, hit rate and staleness in seconds."""
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else None
+            stats['ready'] = self._ready
+            stats['mode'] = 'snapshot' if self._watch is not None else 'poll'
+            stats['documents'] = len(self._prompts)
+            stats['version'] = self._version
+            stats['seconds_since_sync'] = round(time.time() - self._last_sync, 3) if self._last_sync else None
+            stats['seconds_since_change'] = round(time.time() - self._last_change, 3) if self._last_change else None
+        return stats
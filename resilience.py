@@ -0,0 +1,406 @@
+import os
+import math
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Circuit breaker states
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Latency histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, float('inf'))
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while the circuit is open; retry_after is in seconds."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is temporarily unavailable (circuit open), retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AttemptTimeoutError(TimeoutError):
+    """Raised when a single attempt (including its hedge) misses its deadline."""
+
+
+class AttemptRejectedError(RuntimeError):
+    """Raised without calling upstream when every sync attempt worker is busy."""
+
+
+class LatencyHistogram:
+    """
+    Cumulative latency histogram plus a window of recent samples for
+    percentiles (the hedge delay is derived from the recent p95).
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS, window=500):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counts = [0] * len(buckets)
+        self._sum = 0.0
+        self._count = 0
+        self._recent = deque(maxlen=window)
+
+    def observe(self, seconds):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    self._counts[i] += 1
+                    break
+            self._sum += seconds
+            self._count += 1
+            self._recent.append(seconds)
+
+    def percentile(self, pct):
+        """Returns the pct-th percentile of the recent samples, or None if there are none."""
+        with self._lock:
+            samples = sorted(self._recent)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+    def samples(self):
+        with self._lock:
+            return len(self._recent)
+
+    def get_stats(self):
+        """Returns cumulative bucket counts (le -> count), count, sum and recent percentiles."""
+        with self._lock:
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(self.buckets, self._counts):
+                cumulative += count
+                buckets['+Inf' if math.isinf(bound) else str(bound)] = cumulative
+            stats = {'count': self._count, 'sum_s': round(self._sum, 3), 'buckets': buckets}
+        for pct in (50, 95, 99):
+            value = self.percentile(pct)
+            stats[f'p{pct}_s'] = round(value, 3) if value is not None else None
+        return stats
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After failure_threshold failures in a row the circuit opens and calls fail
+    fast with CircuitOpenError. After reset_timeout seconds one probe call is
+    let through (half-open); its success closes the circuit, its failure
+    opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._stats = {'opened': 0, 'rejected': 0}
+
+    def before_call(self):
+        """Raises CircuitOpenError if the call must not reach upstream."""
+        with self._lock:
+            if self._state == OPEN:
+                remaining = self._opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    self._stats['rejected'] += 1
+                    raise CircuitOpenError(self.name, math.ceil(remaining))
+                self._state = HALF_OPEN
+            if self._state == HALF_OPEN:
+                if self._probe_in_flight:
+                    self._stats['rejected'] += 1
+                    raise CircuitOpenError(self.name, math.ceil(self.reset_timeout))
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._state = CLOSED
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """Gives back a half-open probe that never reached upstream."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._stats['opened'] += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def retry_after(self):
+        """Seconds until the next probe is allowed while open, otherwise 0."""
+        with self._lock:
+            if self._state != OPEN:
+                return 0
+            return max(0, math.ceil(self._opened_at + self.reset_timeout - time.monotonic()))
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['state'] = self._state
+            stats['consecutive_failures'] = self._failures
+        return stats
+
+
+class ResilientCall:
+    """
+    Wraps calls to a flaky upstream with per-attempt deadlines, retries with
+    jittered exponential backoff, optional hedging and a circuit breaker.
+
+    Each attempt must finish within attempt_timeout seconds. With hedging on,
+    a second identical attempt starts if the first has not finished after
+    the recent p95 latency (at least hedge_min_delay), and whichever succeeds
+    first wins. Retryable errors (per is_retryable) and timeouts count
+    against the circuit breaker and are retried up to max_attempts in total.
+
+    Sync calls run on a private pool of `workers` threads so the deadline can
+    be enforced, but a thread cannot be cancelled: an attempt that misses it
+    (or loses a hedge) keeps its worker until the client's own timeout, and
+    its result is dropped. The pool never queues, so those attempts cannot
+    pile up behind each other: when every worker is busy a call fails at
+    once with AttemptRejectedError (not counted against the breaker) and a
+    hedge is skipped. Async calls cancel the losing task instead.
+    """
+
+    def __init__(self, name, is_retryable, attempt_timeout=90, max_attempts=3, backoff=0.5,
+                 max_delay=8, hedge=False, hedge_min_delay=5, hedge_min_samples=20,
+                 failure_threshold=5, reset_timeout=30, workers=32):
+        self.name = name
+        self.is_retryable = is_retryable
+        self.attempt_timeout = attempt_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.workers = workers
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.latency = LatencyHistogram()
+        self._executor = None
+        self._executor_pid = None
+        self._slots = None  # One per worker, held from submit until the attempt really returns
+        self._lock = threading.Lock()
+        self._stats = {
+            'calls': 0,
+            'attempts': 0,
+            'retries': 0,
+            'hedges': 0,
+            'hedge_wins': 0,
+            'timeouts': 0,
+            'failures': 0,
+            'rejected': 0,
+        }
+
+    def _get_executor(self):
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix=f'{self.name}-call'
+                    )
+                    self._slots = threading.BoundedSemaphore(self.workers)
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _submit(self, fn, args, kwargs):
+        """Starts an attempt on a free worker; returns its future, or None if every worker is busy."""
+        executor = self._get_executor()
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            return None
+        try:
+            return executor.submit(self._timed, fn, args, kwargs, slots)
+        except BaseException:
+            slots.release()
+            raise
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging an attempt, or None when hedging is off."""
+        if not self.hedge:
+            return None
+        p95 = self.latency.percentile(95) if self.latency.samples() >= self.hedge_min_samples else None
+        return max(self.hedge_min_delay, p95 or 0)
+
+    def backoff_delay(self, attempt, previous_failures=0):
+        """Full-jitter exponential backoff before retry `attempt` (1-based), capped at max_delay."""
+        exponent = attempt - 1 + previous_failures
+        return random.uniform(0, min(self.max_delay, self.backoff * (2 ** exponent)))
+
+    def _classify(self, error):
+        """Records the outcome with the breaker; returns True if the error is worth retrying."""
+        retryable = isinstance(error, AttemptTimeoutError) or self.is_retryable(error)
+        if retryable:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()  # Upstream answered; the request itself was bad
+        return retryable
+
+    # Sync
+
+    def _timed(self, fn, args, kwargs, slots):
+        try:
+            started = time.monotonic()
+            result = fn(*args, **kwargs)
+            self.latency.observe(time.monotonic() - started)
+            return result
+        finally:
+            slots.release()
+
+    def _attempt(self, fn, args, kwargs):
+        deadline = time.monotonic() + self.attempt_timeout
+        primary = self._submit(fn, args, kwargs)
+        if primary is None:
+            self._count('rejected')
+            raise AttemptRejectedError(f"{self.name}: all {self.workers} attempt workers are busy")
+        self._count('attempts')
+        pending = {primary}
+        hedge = None
+
+        delay = self.hedge_delay()
+        if delay is not None and delay < self.attempt_timeout:
+            done, pending = wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+            hedge = self._submit(fn, args, kwargs)
+            if hedge is not None:
+                pending.add(hedge)
+                self._count('hedges')
+
+        error = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count('hedge_wins')
+                    return future.result()
+                error = error or future.exception()
+        if error is not None and not pending:
+            raise error
+        self._count('timeouts')
+        raise AttemptTimeoutError(f"{self.name} attempt exceeded {self.attempt_timeout}s")
+
+    def call(self, fn, *args, previous_failures=0, **kwargs):
+        """
+        Calls fn(*args, **kwargs) with deadlines, retries, hedging and the breaker.
+        previous_failures lengthens the backoff for work that has failed before.
+        Raises CircuitOpenError when failing fast, otherwise the last error.
+        """
+        self._count('calls')
+        for attempt in range(1, self.max_attempts + 1):
+            self.breaker.before_call()
+            try:
+                result = self._attempt(fn, args, kwargs)
+            except AttemptRejectedError:
+                self.breaker.release_probe()  # Upstream was never called
+                self._count('failures')
+                raise
+            except Exception as e:
+                if not self._classify(e) or attempt == self.max_attempts:
+                    self._count('failures')
+                    raise
+                delay = self.backoff_delay(attempt, previous_failures)
+                print(f"{self.name} attempt {attempt} failed ({e}), retrying in {delay:.2f}s...")
+                self._count('retries')
+                time.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+
+    # Async
+
+    async def _timed_async(self, fn, args, kwargs):
+        started = time.monotonic()
+        result = await fn(*args, **kwargs)
+        self.latency.observe(time.monotonic() - started)
+        return result
+
+    async def _attempt_async(self, fn, args, kwargs):
+        deadline = time.monotonic() + self.attempt_timeout
+        self._count('attempts')
+        primary = asyncio.ensure_future(self._timed_async(fn, args, kwargs))
+        pending = {primary}
+        hedge = None
+        try:
+            delay = self.hedge_delay()
+            if delay is not None and delay < self.attempt_timeout:
+                done, pending = await asyncio.wait(pending, timeout=delay)
+                if done:
+                    return primary.result()
+                hedge = asyncio.ensure_future(self._timed_async(fn, args, kwargs))
+                pending.add(hedge)
+                self._count('hedges')
+
+            error = None
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._count('hedge_wins')
+                        return task.result()
+                    error = error or task.exception()
+            if error is not None and not pending:
+                raise error
+            self._count('timeouts')
+            raise AttemptTimeoutError(f"{self.name} attempt exceeded {self.attempt_timeout}s")
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call_async(self, fn, *args, previous_failures=0, **kwargs):
+        """Async counterpart of call() for coroutine functions."""
+        self._count('calls')
+        for attempt in range(1, self.max_attempts + 1):
+            self.breaker.before_call()
+            try:
+                result = await self._attempt_async(fn, args, kwargs)
+            except Exception as e:
+                if not self._classify(e) or attempt == self.max_attempts:
+                    self._count('failures')
+                    raise
+                delay = self.backoff_delay(attempt, previous_failures)
+                print(f"{self.name} attempt {attempt} failed ({e}), retrying in {delay:.2f}s...")
+                self._count('retries')
+                await asyncio.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+
+    def get_stats(self):
+        """Returns call/retry/hedge counters, breaker state and the latency histogram."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['hedge_delay_s'] = self.hedge_delay()
+        stats['breaker'] = self.breaker.get_stats()
+        stats['latency'] = self.latency.get_stats()
+        return stats
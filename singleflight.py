@@ -0,0 +1,122 @@
+import asyncio
+import threading
+
+
+class _Call:
+    """An in-flight call that later callers with the same key wait on."""
+
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into a single execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is still running block until it finishes and receive the same result (or
+    the same exception). Once the call completes the key is released, so the
+    next call runs again. Safe to share between threads of one worker.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {'calls': 0, 'executions': 0, 'coalesced': 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Runs fn(*args, **kwargs) once per concurrent group of callers for key.
+
+        Args:
+            key: Hashable identifier for the work (e.g. a cache key or content hash).
+            fn: The function to execute.
+
+        Returns:
+            A (result, shared) tuple; shared is True when this caller reused
+            another caller's in-flight execution.
+        """
+        with self._lock:
+            self._stats['calls'] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._stats['coalesced'] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats['executions'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        """Returns the number of keys currently executing."""
+        with self._lock:
+            return len(self._calls)
+
+    def get_stats(self):
+        """Returns call, execution and coalesced-caller counters."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+        return stats
+
+
+class AsyncSingleFlight:
+    """
+    asyncio counterpart of SingleFlight for callers on one event loop.
+
+    The leader's coroutine runs as a task; followers await the same task
+    (shielded, so a cancelled caller does not cancel the shared work).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._stats = {'calls': 0, 'executions': 0, 'coalesced': 0}
+
+    async def do(self, key, fn, *args, **kwargs):
+        """
+        Awaits fn(*args, **kwargs) once per concurrent group of callers for key.
+        Returns a (result, shared) tuple like SingleFlight.do().
+        """
+        self._stats['calls'] += 1
+        task = self._calls.get(key)
+        if task is not None:
+            self._stats['coalesced'] += 1
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(fn(*args, **kwargs))
+        self._calls[key] = task
+        self._stats['executions'] += 1
+        task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task), False
+
+    def get_stats(self):
+        """Returns call, execution and coalesced-caller counters."""
+        stats = dict(self._stats)
+        stats['in_flight'] = len(self._calls)
+        return stats
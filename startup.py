@@ -0,0 +1,126 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+# Startup settings (overridable via env)
+STARTUP_LAZY_INIT = os.environ.get('STARTUP_LAZY_INIT', 'true').lower() == 'true'
+STARTUP_INIT_WAIT = float(os.environ.get('STARTUP_INIT_WAIT', '30'))  # Max seconds a request waits for init
+
+_lock = threading.Lock()
+_process_started = time.time()  # Import time, or fork time in a worker
+_phases = {}  # phase name -> {'started_ms', 'duration_ms', 'pid', ...}
+_first_response_ms = None
+
+
+def _reset_after_fork():
+    """Worker timings start at fork; phases run in the master (e.g. preloaded credentials) are kept."""
+    global _lock, _process_started, _first_response_ms
+    _lock = threading.Lock()
+    _process_started = time.time()
+    _first_response_ms = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@contextmanager
+def phase(name):
+    """Times a startup phase; the result shows up in get_stats()['phases']."""
+    started = time.time()
+    record = {'started_ms': round((started - _process_started) * 1000, 1), 'pid': os.getpid()}
+    try:
+        yield record
+    finally:
+        record['duration_ms'] = round((time.time() - started) * 1000, 1)
+        with _lock:
+            _phases[name] = record
+
+
+def clients_built_in_workers():
+    """True under a pre-forking server (set by gunicorn.conf.py): clients are built in each worker, never at import."""
+    return os.environ.get('STARTUP_CLIENTS_IN_WORKERS', '').lower() == 'true'
+
+
+def mark_first_response():
+    """Records the time from process (or worker) start to its first response."""
+    global _first_response_ms
+    if _first_response_ms is None:
+        with _lock:
+            if _first_response_ms is None:
+                _first_response_ms = round((time.time() - _process_started) * 1000, 1)
+
+
+class BackgroundInit:
+    """
+    Runs an initialization function once per process on a daemon thread.
+
+    start() returns immediately, so the server can answer requests that do
+    not need the initialized resources; wait() blocks the requests that do
+    (up to a timeout). A worker forked before the function finished starts
+    it again on its first start() or wait() call; with per_process=True it
+    does so even if the parent finished (for resources such as gRPC
+    channels that must not be inherited across fork).
+    """
+
+    def __init__(self, name, fn, per_process=False):
+        self.name = name
+        self.fn = fn
+        self.per_process = per_process
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._pid = None
+        self.error = None
+
+    def start(self):
+        """Starts the initialization in the background if it has not run in this process."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None and (self.per_process or not self._done.is_set()):
+                self._done = threading.Event()  # The parent's thread (or result) does not carry over
+                self.error = None
+            self._pid = os.getpid()
+            if self._done.is_set():
+                return
+            threading.Thread(target=self._run, name=f'init-{self.name}', daemon=True).start()
+
+    def _run(self):
+        try:
+            with phase(self.name):
+                self.fn()
+        except Exception as e:
+            self.error = e
+            print(f"Background initialization '{self.name}' failed: {e}")
+        finally:
+            self._done.set()
+
+    def run(self):
+        """Runs the initialization synchronously in the calling thread."""
+        with self._lock:
+            self._pid = os.getpid()
+        self._run()
+
+    def wait(self, timeout=STARTUP_INIT_WAIT):
+        """Starts the initialization if needed and waits for it; returns True once it has finished."""
+        self.start()
+        return self._done.wait(timeout)
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+
+def get_stats():
+    """Returns per-phase startup timings and the time to first response for this process."""
+    with _lock:
+        return {
+            'pid': os.getpid(),
+            'lazy_init': STARTUP_LAZY_INIT,
+            'uptime_s': round(time.time() - _process_started, 3),
+            'first_response_ms': _first_response_ms,
+            'phases': {name: dict(record) for name, record in _phases.items()},
+        }
@@ -16,6 +16,41 @@ document.addEventListener('DOMContentLoaded', function() {
     let currentImageData = null;
     let currentFilename = null;
     let savedPrompts = []; // Store fetched prompts
+    let nextPageToken = null; // Cursor for the next page of saved prompts
+    let loadingPromptsPage = false;
+    let promptsRequestId = 0; // Ignores pages from a list that was refreshed meanwhile
+    const PROMPTS_PAGE_SIZE = 30;
+
+    // Sentinel at the bottom of the sidebar; when it scrolls into view, load the next page
+    const promptsSentinel = document.createElement('div');
+    promptsSentinel.className = 'empty-history';
+    const promptsObserver = window.IntersectionObserver
+        ? new IntersectionObserver((entries) => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadMoreSavedPrompts();
+            }
+        }, { root: promptHistory, rootMargin: '200px' })
+        : null;
+
+    // Cache images, static files and saved prompts in the browser (see static/sw.js)
+    if ('serviceWorker' in navigator) {
+        navigator.serviceWorker.register('/sw.js').catch(error => {
+            console.warn('Service Worker registration failed:', error);
+        });
+
+        // Saved prompts are answered from the cache first; re-render when a fresher copy arrives
+        navigator.serviceWorker.addEventListener('message', function(event) {
+            const message = event.data || {};
+            if (message.type !== 'prompts-updated') {
+                return;
+            }
+            // Only the first page, and only if the user has not scrolled further down the list
+            const firstPage = !new URL(message.url).searchParams.has('page_token');
+            if (firstPage && !loadingPromptsPage && savedPrompts.length <= PROMPTS_PAGE_SIZE) {
+                loadSavedPrompts(true);
+            }
+        });
+    }
 
     // Load saved prompts from Firebase database on page load
     loadSavedPrompts();
@@ -41,29 +76,48 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    // Function to fetch saved prompts from Firebase
-    async function loadSavedPrompts() {
+    // Fetch one page of saved prompts (null token = first page)
+    async function fetchSavedPromptsPage(pageToken) {
+        const params = new URLSearchParams({ limit: PROMPTS_PAGE_SIZE });
+        if (pageToken) {
+            params.set('page_token', pageToken);
+        }
+
+        // Make request to your backend endpoint
+        const response = await fetch(`/get_saved_prompts?${params}`, {
+            method: 'GET',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'application/json'
+            }
+        });
+
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        return response.json();
+    }
+
+    // Function to fetch saved prompts from Firebase (restarts from the first page).
+    // quiet keeps the current list on screen until the new one is ready.
+    async function loadSavedPrompts(quiet) {
+        const requestId = ++promptsRequestId;
+        loadingPromptsPage = true;
         try {
             // Show loading in sidebar
-            promptHistory.innerHTML = '<div class="empty-history">Loading saved prompts...</div>';
+            if (!quiet) {
+                promptHistory.innerHTML = '<div class="empty-history">Loading saved prompts...</div>';
+            }
             
-            // Make request to your backend endpoint
-            const response = await fetch('/get_saved_prompts', {
-                method: 'GET',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'Accept': 'application/json'
-                }
-            });
-
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
+            const data = await fetchSavedPromptsPage(null);
+            if (requestId !== promptsRequestId) {
+                return;
             }
-
-            const data = await response.json();
             
             if (data.success && data.prompts) {
                 savedPrompts = data.prompts;
+                nextPageToken = data.next_page_token || null;
                 displaySavedPrompts();
             } else {
                 promptHistory.innerHTML = '<div class="empty-history">No saved prompts found</div>';
@@ -72,10 +126,66 @@ document.addEventListener('DOMContentLoaded', function() {
         } catch (error) {
             console.error('Error loading saved prompts:', error);
             promptHistory.innerHTML = '<div class="empty-history">Error loading prompts</div>';
+        } finally {
+            if (requestId === promptsRequestId) {
+                loadingPromptsPage = false;
+            }
         }
     }
 
-    // Function to display saved prompts in the sidebar
+    // Append the next page of saved prompts when the user scrolls to the bottom
+    async function loadMoreSavedPrompts() {
+        if (!nextPageToken || loadingPromptsPage) {
+            return;
+        }
+        const requestId = promptsRequestId;
+        loadingPromptsPage = true;
+        promptsSentinel.textContent = 'Loading more prompts...';
+        try {
+            const data = await fetchSavedPromptsPage(nextPageToken);
+            if (requestId !== promptsRequestId) {
+                return;
+            }
+            if (data.success && data.prompts) {
+                savedPrompts = savedPrompts.concat(data.prompts);
+                nextPageToken = data.next_page_token || null;
+                data.prompts.forEach(item => {
+                    promptHistory.insertBefore(createHistoryItem(item), promptsSentinel);
+                });
+            } else {
+                nextPageToken = null;
+            }
+        } catch (error) {
+            console.error('Error loading more saved prompts:', error);
+        } finally {
+            if (requestId === promptsRequestId) {
+                loadingPromptsPage = false;
+                updatePromptsSentinel();
+            }
+        }
+    }
+
+    // Keep the sentinel at the end of the list (or remove it on the last page)
+    function updatePromptsSentinel() {
+        if (nextPageToken) {
+            promptsSentinel.textContent = promptsObserver ? '' : 'Scroll for more...';
+            promptHistory.appendChild(promptsSentinel);
+        } else if (promptsSentinel.parentNode) {
+            promptsSentinel.parentNode.removeChild(promptsSentinel);
+        }
+    }
+
+    // Without IntersectionObserver, fall back to a scroll listener
+    if (promptsObserver) {
+        promptsObserver.observe(promptsSentinel);
+    } else {
+        promptHistory.addEventListener('scroll', function() {
+            if (promptHistory.scrollTop + promptHistory.clientHeight >= promptHistory.scrollHeight - 200) {
+                loadMoreSavedPrompts();
+            }
+        });
+    }
+
     // Function to display saved prompts in the sidebar
     function displaySavedPrompts() {
         // Clear current history display
@@ -87,84 +197,90 @@ document.addEventListener('DOMContentLoaded', function() {
         }
         
         // Add each saved prompt to the sidebar
-        savedPrompts.forEach((item, index) => {
-            const historyItem = document.createElement('div');
-            historyItem.className = 'history-item';
-            
-            // Extract agent name and created date
-            const agentName = item.agent_name || 'Unknown Agent';
-            
-            // Handle different timestamp formats more robustly
-            let createdAt;
-            let formattedDate = 'Unknown Date';
-            
-            try {
-                if (item.created_at) {
-                    // Try different parsing methods
-                    if (typeof item.created_at === 'string') {
-                        // If it's an ISO string, parse it directly
-                        createdAt = new Date(item.created_at);
-                    } else if (item.created_at.seconds) {
-                        // If it's a Firestore timestamp object with seconds
-                        createdAt = new Date(item.created_at.seconds * 1000);
-                    } else if (typeof item.created_at === 'number') {
-                        // If it's already a timestamp
-                        createdAt = new Date(item.created_at);
-                    } else {
-                        // Try to parse it as-is
-                        createdAt = new Date(item.created_at);
-                    }
-                    
-                    // Check if the date is valid
-                    if (!isNaN(createdAt.getTime())) {
-                        formattedDate = `${createdAt.toLocaleDateString()} ${createdAt.toLocaleTimeString()}`;
-                    } else {
-                        console.warn('Invalid date for item:', item);
-                        formattedDate = 'Invalid Date';
-                    }
+        savedPrompts.forEach(item => {
+            promptHistory.appendChild(createHistoryItem(item));
+        });
+        updatePromptsSentinel();
+    }
+
+    // Build the sidebar entry for one saved prompt
+    function createHistoryItem(item) {
+        const historyItem = document.createElement('div');
+        historyItem.className = 'history-item';
+        
+        // Extract agent name and created date
+        const agentName = item.agent_name || 'Unknown Agent';
+        
+        // Handle different timestamp formats more robustly
+        let createdAt;
+        let formattedDate = 'Unknown Date';
+        
+        try {
+            if (item.created_at) {
+                // Try different parsing methods
+                if (typeof item.created_at === 'string') {
+                    // If it's an ISO string, parse it directly
+                    createdAt = new Date(item.created_at);
+                } else if (item.created_at.seconds) {
+                    // If it's a Firestore timestamp object with seconds
+                    createdAt = new Date(item.created_at.seconds * 1000);
+                } else if (typeof item.created_at === 'number') {
+                    // If it's already a timestamp
+                    createdAt = new Date(item.created_at);
                 } else {
-                    formattedDate = 'No Date';
+                    // Try to parse it as-is
+                    createdAt = new Date(item.created_at);
                 }
-            } catch (error) {
-                console.error('Error parsing date:', error, 'for item:', item);
-                formattedDate = 'Date Error';
+                
+                // Check if the date is valid
+                if (!isNaN(createdAt.getTime())) {
+                    formattedDate = `${createdAt.toLocaleDateString()} ${createdAt.toLocaleTimeString()}`;
+                } else {
+                    console.warn('Invalid date for item:', item);
+                    formattedDate = 'Invalid Date';
+                }
+            } else {
+                formattedDate = 'No Date';
             }
+        } catch (error) {
+            console.error('Error parsing date:', error, 'for item:', item);
+            formattedDate = 'Date Error';
+        }
+        
+        // Create preview of response content (first 80 characters)
+        const contentPreview = item.response_content 
+            ? (item.response_content.length > 80 
+               ? item.response_content.substring(0, 80) + '...' 
+               : item.response_content)
+            : 'No content available';
+        
+        historyItem.innerHTML = `
+            <div style="font-weight: bold; color: #3498db; margin-bottom: 2px;">${agentName}</div>
+            <div style="font-size: 0.85em; margin-bottom: 4px;">${contentPreview}</div>
+            <span class="timestamp">${formattedDate}</span>
+        `;
+        
+        // Add click event to load this prompt into the input field
+        historyItem.addEventListener('click', function() {
+            promptInput.value = item.response_content || '';
             
-            // Create preview of response content (first 80 characters)
-            const contentPreview = item.response_content 
-                ? (item.response_content.length > 80 
-                   ? item.response_content.substring(0, 80) + '...' 
-                   : item.response_content)
-                : 'No content available';
-            
-            historyItem.innerHTML = `
-                <div style="font-weight: bold; color: #3498db; margin-bottom: 2px;">${agentName}</div>
-                <div style="font-size: 0.85em; margin-bottom: 4px;">${contentPreview}</div>
-                <span class="timestamp">${formattedDate}</span>
-            `;
+            // Optionally auto-generate a filename from the agent name and timestamp
+            if (!filenameInput.value && createdAt && !isNaN(createdAt.getTime())) {
+                const timestamp = createdAt.toISOString().slice(0, 10); // YYYY-MM-DD format
+                filenameInput.value = `${agentName.replace(/\s+/g, '_').toLowerCase()}_${timestamp}`;
+            }
             
-            // Add click event to load this prompt into the input field
-            historyItem.addEventListener('click', function() {
-                promptInput.value = item.response_content || '';
-                
-                // Optionally auto-generate a filename from the agent name and timestamp
-                if (!filenameInput.value && createdAt && !isNaN(createdAt.getTime())) {
-                    const timestamp = createdAt.toISOString().slice(0, 10); // YYYY-MM-DD format
-                    filenameInput.value = `${agentName.replace(/\s+/g, '_').toLowerCase()}_${timestamp}`;
-                }
-                
-                // Highlight selected item
-                document.querySelectorAll('.history-item').forEach(item => {
-                    item.style.backgroundColor = '';
-                });
-                historyItem.style.backgroundColor = 'rgba(255, 255, 255, 0.15)';
-                
-                // Show success message
-                showStatus(`Loaded prompt from ${agentName}`, 'success');
+            // Highlight selected item
+            document.querySelectorAll('.history-item').forEach(item => {
+                item.style.backgroundColor = '';
             });
+            historyItem.style.backgroundColor = 'rgba(255, 255, 255, 0.15)';
             
-            promptHistory.appendChild(historyItem);
+            // Show success message
+            showStatus(`Loaded prompt from ${agentName}`, 'success');
         });
+        
+        return historyItem;
     }
 
     // Refresh prompts button functionality (repurpose clear button)
@@ -179,39 +295,44 @@ document.addEventListener('DOMContentLoaded', function() {
     clearHistoryBtn.innerHTML = '<span>↻</span>';
     clearHistoryBtn.title = 'Refresh Saved Prompts';
 
+    // Trigger a browser download for a URL (data: or blob:)
+    function triggerDownload(url) {
+        // Create a temporary link element
+        const link = document.createElement('a');
+        link.href = url;
+        link.download = currentFilename || 'generated_image.png';
+
+        // Append to body, click, and remove
+        document.body.appendChild(link);
+        link.click();
+        document.body.removeChild(link);
+    }
+
     // Function to download image
-    function downloadImage() {
+    async function downloadImage() {
         if (!currentImageData || !currentFilename) {
             showStatus('No image available for download.', 'error');
             return;
         }
 
         try {
-            let downloadUrl;
-            
-            // Check if it's already a data URL or needs conversion
             if (currentImageData.startsWith('data:image')) {
                 // It's already a data URL, use it directly
-                downloadUrl = currentImageData;
+                triggerDownload(currentImageData);
             } else if (currentImageData.startsWith('http')) {
-                // It's a Firebase URL - we need to fetch it, but let's show error for now
-                showStatus('Cannot download from Firebase URL directly. Please use base64 data.', 'error');
-                return;
+                // It's a Firebase URL (URL-only response): fetch the bytes once, on demand
+                const response = await fetch(currentImageData);
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status}`);
+                }
+                const objectUrl = URL.createObjectURL(await response.blob());
+                triggerDownload(objectUrl);
+                setTimeout(() => URL.revokeObjectURL(objectUrl), 1000);
             } else {
                 // It's base64 data, convert to data URL
-                downloadUrl = `data:image/png;base64,${currentImageData}`;
+                triggerDownload(`data:image/png;base64,${currentImageData}`);
             }
-            
-            // Create a temporary link element
-            const link = document.createElement('a');
-            link.href = downloadUrl;
-            link.download = currentFilename || 'generated_image.png';
-            
-            // Append to body, click, and remove
-            document.body.appendChild(link);
-            link.click();
-            document.body.removeChild(link);
-            
+
             showStatus('Image downloaded successfully!', 'success');
         } catch (error) {
             console.error('Download error:', error);
@@ -222,6 +343,173 @@ document.addEventListener('DOMContentLoaded', function() {
     // Download button event listener
     downloadBtn.addEventListener('click', downloadImage);
 
+    // Show an uploaded image: the low-resolution thumbnail variant (blurred) as soon as it
+    // arrives, then the full image once it has loaded. The full image is requested by
+    // content hash (/images/<sha256>.png), so the Service Worker caches it under that key;
+    // the Storage URL is the fallback if the server cannot resolve the hash.
+    function showUploadedImage(data, onShown) {
+        const thumb = data.variants && data.variants.thumb;
+        const fullUrl = data.content_hash ? `/images/${data.content_hash}.png` : data.imageUrl;
+        const full = new Image();
+        let fullShown = false;
+
+        full.onload = function() {
+            fullShown = true;
+            generatedImage.onload = null;
+            generatedImage.src = full.src;
+            generatedImage.classList.remove('placeholder');
+            onShown();
+        };
+        full.onerror = function() {
+            if (full.src !== data.imageUrl) {
+                full.src = data.imageUrl;
+            }
+        };
+
+        if (thumb) {
+            generatedImage.classList.add('placeholder');
+            generatedImage.onload = function() {
+                if (!fullShown) {
+                    onShown();
+                }
+            };
+            generatedImage.src = thumb.url;
+        }
+        generatedImage.alt = 'Generated Image';
+        full.src = fullUrl;
+    }
+
+    // Display a finished generation result (same payload as /generate_and_upload)
+    function showGeneratedImage(data, filename) {
+        let imageLoaded = false;
+
+        // Show the image once it's loaded
+        const revealImage = function() {
+            loadingSpinner.style.display = 'none';
+            generatedImage.style.display = 'block';
+            resultTitle.style.display = 'block';
+            downloadBtn.style.display = 'inline-block';
+            imageLoaded = true;
+        };
+
+        // Handle different response formats
+        if (data.imageUrl && data.image_data) {
+            // Display image from URL (Firebase storage) but use base64 for download
+            showUploadedImage(data, revealImage);
+
+            // Store base64 data for download (more reliable than Firebase URL)
+            currentImageData = `data:image/png;base64,${data.image_data}`;
+            currentFilename = filename ? `${filename}.png` : 'generated_image.png';
+
+        } else if (data.imageUrl) {
+            // Only Firebase URL available
+            showUploadedImage(data, revealImage);
+
+            // Store Firebase URL; the bytes are fetched only if the user downloads
+            currentImageData = data.imageUrl;
+            currentFilename = filename ? `${filename}.png` : 'generated_image.png';
+
+        } else if (data.image_data) {
+            // Display image from base64 data
+            const imageDataUrl = `data:image/png;base64,${data.image_data}`;
+            generatedImage.classList.remove('placeholder');
+            generatedImage.onload = revealImage;
+            generatedImage.src = imageDataUrl;
+            generatedImage.alt = 'Generated Image';
+
+            // Store base64 data for download
+            currentImageData = imageDataUrl;
+            currentFilename = filename ? `${filename}.png` : 'generated_image.png';
+
+        } else {
+            loadingSpinner.style.display = 'none';
+            generatedImage.alt = 'Generated image data received, but no URL was provided.';
+        }
+
+        // Set a timeout to ensure the image is displayed even if onload doesn't fire
+        setTimeout(() => {
+            if (!imageLoaded) {
+                loadingSpinner.style.display = 'none';
+                generatedImage.style.display = 'block';
+                resultTitle.style.display = 'block';
+                if (currentImageData) {
+                    downloadBtn.style.display = 'inline-block';
+                }
+            }
+        }, 1000);
+
+        showStatus('Image generated successfully!', 'success');
+
+        // Add Gemini's text response if available
+        if (data.text_response) {
+            const textResponse = document.createElement('p');
+            textResponse.textContent = `${data.text_response}`;
+            textResponse.style.fontStyle = 'italic';
+            textResponse.style.marginTop = '10px';
+            statusMessage.appendChild(textResponse);
+        }
+
+        // Refresh the saved prompts after successful generation
+        // (in case the new prompt was saved to database)
+        setTimeout(() => {
+            loadSavedPrompts();
+        }, 1000);
+    }
+
+    // Status text shown while a job is queued or running
+    const jobStatusMessages = {
+        queued: 'Waiting in queue...',
+        running: 'Generating and uploading image...'
+    };
+
+    // Follow a job until it finishes; resolves with the final job state.
+    // Uses the Server-Sent Events stream, falling back to polling.
+    function waitForJob(submitted) {
+        return new Promise((resolve, reject) => {
+            const handleUpdate = (job) => {
+                if (job.status === 'succeeded' || job.status === 'failed') {
+                    resolve(job);
+                    return true;
+                }
+                showStatus(jobStatusMessages[job.status] || 'Working...', 'loading');
+                return false;
+            };
+
+            const poll = async () => {
+                try {
+                    const response = await fetch(submitted.status_url, {
+                        headers: { 'Accept': 'application/json' }
+                    });
+                    if (!response.ok) {
+                        throw new Error(`HTTP error! status: ${response.status}`);
+                    }
+                    if (!handleUpdate(await response.json())) {
+                        setTimeout(poll, 2000);
+                    }
+                } catch (error) {
+                    reject(error);
+                }
+            };
+
+            if (!window.EventSource) {
+                poll();
+                return;
+            }
+
+            const events = new EventSource(submitted.events_url);
+            events.addEventListener('status', (event) => {
+                if (handleUpdate(JSON.parse(event.data))) {
+                    events.close();
+                }
+            });
+            events.onerror = () => {
+                // Stream dropped (proxy timeout, network); continue by polling
+                events.close();
+                poll();
+            };
+        });
+    }
+
     generateBtn.addEventListener('click', async function() {
         const prompt = promptInput.value.trim();
         const filename = filenameInput.value.trim();
@@ -235,7 +523,7 @@ document.addEventListener('DOMContentLoaded', function() {
         // Disable button and update status
         generateBtn.disabled = true;
         generateBtn.textContent = 'Generating...';
-        showStatus('Generating and uploading image...', 'loading');
+        showStatus('Submitting image request...', 'loading');
         
         // Hide previous image and download button while generating
         generatedImage.style.display = 'none';
@@ -246,8 +534,8 @@ document.addEventListener('DOMContentLoaded', function() {
         loadingSpinner.style.display = 'block';
 
         try {
-            // Make the request with proper headers and error handling
-            const response = await fetch('/generate_and_upload', {
+            // Queue the job; the server answers immediately with its id
+            const response = await fetch('/jobs', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -255,7 +543,9 @@ document.addEventListener('DOMContentLoaded', function() {
                 },
                 body: JSON.stringify({
                     prompt: prompt,
-                    filename: filename
+                    filename: filename,
+                    // Cheapest payload: just the uploaded URL (base64 only if the upload failed)
+                    response_mode: 'url'
                 })
             });
 
@@ -265,101 +555,30 @@ document.addEventListener('DOMContentLoaded', function() {
                 throw new Error('Received non-JSON response from server: ' + contentType);
             }
 
-            const data = await response.json();
+            const submitted = await response.json();
 
-            if (response.ok) {
-                let imageLoaded = false;
-                
-                // Handle different response formats
-                if (data.imageUrl && data.image_data) {
-                    // Display image from URL (Firebase storage) but use base64 for download
-                    generatedImage.onload = function() {
-                        // Show the image once it's loaded
-                        loadingSpinner.style.display = 'none';
-                        generatedImage.style.display = 'block';
-                        resultTitle.style.display = 'block';
-                        downloadBtn.style.display = 'inline-block';
-                        imageLoaded = true;
-                    };
-                    generatedImage.src = data.imageUrl;
-                    generatedImage.alt = 'Generated Image';
-                    
-                    // Store base64 data for download (more reliable than Firebase URL)
-                    currentImageData = `data:image/png;base64,${data.image_data}`;
-                    currentFilename = filename ? `${filename}.png` : 'generated_image.png';
-                    
-                } else if (data.imageUrl) {
-                    // Only Firebase URL available
-                    generatedImage.onload = function() {
-                        // Show the image once it's loaded
-                        loadingSpinner.style.display = 'none';
-                        generatedImage.style.display = 'block';
-                        resultTitle.style.display = 'block';
-                        downloadBtn.style.display = 'inline-block';
-                        imageLoaded = true;
-                    };
-                    generatedImage.src = data.imageUrl;
-                    generatedImage.alt = 'Generated Image';
-                    
-                    // Store Firebase URL for download
-                    currentImageData = data.imageUrl;
-                    currentFilename = filename ? `${filename}.png` : 'generated_image.png';
-                    
-                } else if (data.image_data) {
-                    // Display image from base64 data
-                    const imageDataUrl = `data:image/png;base64,${data.image_data}`;
-                    generatedImage.onload = function() {
-                        // Show the image once it's loaded
-                        loadingSpinner.style.display = 'none';
-                        generatedImage.style.display = 'block';
-                        resultTitle.style.display = 'block';
-                        downloadBtn.style.display = 'inline-block';
-                        imageLoaded = true;
-                    };
-                    generatedImage.src = imageDataUrl;
-                    generatedImage.alt = 'Generated Image';
-                    
-                    // Store base64 data for download
-                    currentImageData = imageDataUrl;
-                    currentFilename = filename ? `${filename}.png` : 'generated_image.png';
-                    
-                } else {
-                    loadingSpinner.style.display = 'none';
-                    generatedImage.alt = 'Generated image data received, but no URL was provided.';
-                }
-                
-                // Set a timeout to ensure the image is displayed even if onload doesn't fire
-                setTimeout(() => {
-                    if (!imageLoaded) {
-                        loadingSpinner.style.display = 'none';
-                        generatedImage.style.display = 'block';
-                        resultTitle.style.display = 'block';
-                        if (currentImageData) {
-                            downloadBtn.style.display = 'inline-block';
-                        }
-                    }
-                }, 1000);
+            if (response.status === 429) {
+                const retryAfter = response.headers.get('Retry-After') || submitted.retry_after;
+                loadingSpinner.style.display = 'none';
+                showStatus(`Server is busy. Please try again in ${retryAfter} seconds.`, 'error');
+                return;
+            }
 
-                showStatus('Image generated successfully!', 'success');
+            if (!response.ok) {
+                loadingSpinner.style.display = 'none';
+                showStatus(`Error: ${submitted.message}`, 'error');
+                generatedImage.alt = 'Image generation failed.';
+                return;
+            }
 
-                // Add Gemini's text response if available
-                if (data.text_response) {
-                    const textResponse = document.createElement('p');
-                    textResponse.textContent = `${data.text_response}`;
-                    textResponse.style.fontStyle = 'italic';
-                    textResponse.style.marginTop = '10px';
-                    statusMessage.appendChild(textResponse);
-                }
+            const job = await waitForJob(submitted);
+            const data = job.result || {};
 
-                // Refresh the saved prompts after successful generation
-                // (in case the new prompt was saved to database)
-                setTimeout(() => {
-                    loadSavedPrompts();
-                }, 1000);
-                
+            if (job.status === 'succeeded') {
+                showGeneratedImage(data, filename);
             } else {
                 loadingSpinner.style.display = 'none';
-                showStatus(`Error: ${data.message}`, 'error');
+                showStatus(`Error: ${data.message || job.error}`, 'error');
                 generatedImage.alt = 'Image generation failed.';
             }
         } catch (error) {
@@ -372,4 +591,4 @@ document.addEventListener('DOMContentLoaded', function() {
             generateBtn.textContent = 'Generate & Upload Image';
         }
     });
-});
\ No newline at end of file
+});
@@ -0,0 +1,110 @@
+// Service Worker for the Gemini Image Generator: browser-side caching of images,
+// fingerprinted static files and the saved-prompts list (Cache Storage)
+
+const CACHE_VERSION = 'v1';
+const STATIC_CACHE = `static-${CACHE_VERSION}`;
+const IMAGE_CACHE = `images-${CACHE_VERSION}`;
+const PROMPTS_CACHE = `prompts-${CACHE_VERSION}`;
+const KNOWN_CACHES = [STATIC_CACHE, IMAGE_CACHE, PROMPTS_CACHE];
+
+// Entries kept per cache before the oldest are dropped
+const MAX_IMAGES = 200;
+const MAX_PROMPT_PAGES = 20;
+
+// Hosts serving the uploaded images (Firebase Storage public URLs)
+const IMAGE_HOSTS = ['storage.googleapis.com', 'firebasestorage.googleapis.com'];
+
+self.addEventListener('install', function() {
+    self.skipWaiting();
+});
+
+self.addEventListener('activate', function(event) {
+    // Drop the caches of earlier versions, then take over open pages
+    event.waitUntil(
+        caches.keys()
+            .then(names => Promise.all(
+                names.filter(name => !KNOWN_CACHES.includes(name)).map(name => caches.delete(name))
+            ))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', function(event) {
+    const request = event.request;
+    if (request.method !== 'GET') {
+        return;
+    }
+    const url = new URL(request.url);
+
+    if (url.origin === self.location.origin) {
+        if (url.pathname.startsWith('/images/') && request.destination === 'image') {
+            // Content-addressed: /images/<sha256>.png never changes (only <img> loads, which
+            // may cache an opaque cross-origin response, are answered from this cache)
+            event.respondWith(cacheFirst(IMAGE_CACHE, request, MAX_IMAGES));
+        } else if (url.pathname.startsWith('/static/') && url.searchParams.has('v')) {
+            // Fingerprinted static file: a new version has a new URL
+            event.respondWith(cacheFirst(STATIC_CACHE, request));
+        } else if (url.pathname === '/get_saved_prompts') {
+            event.respondWith(staleWhileRevalidate(event, PROMPTS_CACHE, MAX_PROMPT_PAGES));
+        }
+    } else if (IMAGE_HOSTS.includes(url.hostname) && request.destination === 'image') {
+        // Uploaded blob names are unique, so the bytes behind a URL never change
+        event.respondWith(cacheFirst(IMAGE_CACHE, request, MAX_IMAGES));
+    }
+});
+
+// Keep at most maxEntries in a cache, dropping the oldest insertions
+async function trimCache(cache, maxEntries) {
+    const keys = await cache.keys();
+    await Promise.all(keys.slice(0, Math.max(keys.length - maxEntries, 0)).map(key => cache.delete(key)));
+}
+
+// Cacheable: a successful response, or an opaque one (cross-origin <img> without CORS)
+function isCacheable(response) {
+    return response.ok || response.type === 'opaque';
+}
+
+async function cacheFirst(cacheName, request, maxEntries) {
+    const cache = await caches.open(cacheName);
+    const cached = await cache.match(request);
+    if (cached) {
+        return cached;
+    }
+    const response = await fetch(request);
+    if (isCacheable(response)) {
+        await cache.put(request, response.clone());
+        if (maxEntries) {
+            trimCache(cache, maxEntries);
+        }
+    }
+    return response;
+}
+
+// Answer from the cache at once and refresh it from the network in the background.
+// Pages are told when the refreshed copy differs, so they can re-render.
+async function staleWhileRevalidate(event, cacheName, maxEntries) {
+    const request = event.request;
+    const cache = await caches.open(cacheName);
+    const cached = await cache.match(request);
+    const cachedBody = cached ? cached.clone().text() : null;  // Read before the page consumes it
+
+    const refresh = fetch(request).then(async function(response) {
+        if (response.ok) {
+            const changed = !cached || (await cachedBody) !== (await response.clone().text());
+            await cache.put(request, response.clone());
+            trimCache(cache, maxEntries);
+            if (cached && changed) {
+                const pages = await self.clients.matchAll({ type: 'window' });
+                pages.forEach(page => page.postMessage({ type: 'prompts-updated', url: request.url }));
+            }
+        }
+        return response;
+    });
+
+    if (cached) {
+        // Keep the worker alive until the refresh is stored; errors only mean the copy stays stale
+        event.waitUntil(refresh.catch(error => console.warn('Saved prompts refresh failed:', error)));
+        return cached;
+    }
+    return refresh;
+}
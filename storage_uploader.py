@@ -0,0 +1,138 @@
+import io
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from google.api_core import exceptions as api_exceptions
+
+import metrics
+
+# Upload settings (overridable via env)
+STORAGE_UPLOAD_WORKERS = int(os.environ.get('STORAGE_UPLOAD_WORKERS', '4'))
+STORAGE_UPLOAD_ATTEMPTS = int(os.environ.get('STORAGE_UPLOAD_ATTEMPTS', '3'))
+STORAGE_UPLOAD_BACKOFF = float(os.environ.get('STORAGE_UPLOAD_BACKOFF', '0.5'))
+STORAGE_CACHE_CONTROL = os.environ.get('STORAGE_CACHE_CONTROL', 'public, max-age=31536000, immutable')
+STORAGE_PREDEFINED_ACL = os.environ.get('STORAGE_PREDEFINED_ACL', 'publicRead')  # Empty to skip
+
+# The public-read ACL is set by the upload request itself, so this also covers what make_public() used to cost
+UPLOAD_LATENCY = metrics.Histogram(
+    'storage_upload_duration_seconds', 'Firebase Storage upload latency, including retries and the ACL'
+)
+
+# Errors worth retrying: throttling, server-side failures and dropped connections
+RETRYABLE_ERRORS = (
+    api_exceptions.TooManyRequests,
+    api_exceptions.InternalServerError,
+    api_exceptions.BadGateway,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.GatewayTimeout,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+class StorageUploader:
+    """
+    Uploads image bytes to a Firebase Storage bucket in a single request.
+
+    The public-read ACL and Cache-Control metadata travel with the upload
+    itself, so no follow-up make_public() call is needed, and the bytes are
+    streamed from a BytesIO view of the caller's buffer rather than copied.
+    Transient failures are retried with jittered exponential backoff.
+    upload_async() runs the upload on a shared thread pool and returns the
+    blob's public URL immediately, since it does not depend on the upload.
+    """
+
+    def __init__(self, workers=STORAGE_UPLOAD_WORKERS, attempts=STORAGE_UPLOAD_ATTEMPTS,
+                 backoff=STORAGE_UPLOAD_BACKOFF, cache_control=STORAGE_CACHE_CONTROL,
+                 predefined_acl=STORAGE_PREDEFINED_ACL):
+        self.workers = workers
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.cache_control = cache_control
+        self.predefined_acl = predefined_acl or None
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._stats = {'uploads': 0, 'retries': 0, 'failures': 0, 'bytes': 0}
+
+    def _get_executor(self):
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix='storage-upload'
+                    )
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def upload(self, bucket, data, blob_name, content_type='image/png', metadata=None):
+        """
+        Uploads data to bucket/blob_name, retrying transient errors.
+
+        Args:
+            bucket: The Firebase Storage bucket.
+            data: The bytes (or bytes-like buffer) to store.
+            blob_name: Destination object name.
+            content_type: MIME type stored with the object.
+            metadata: Optional dict of custom object metadata.
+
+        Returns:
+            The blob's public URL.
+        """
+        blob = bucket.blob(blob_name)
+        blob.cache_control = self.cache_control
+        if metadata:
+            blob.metadata = metadata
+        size = len(data)
+        upload_args = {'content_type': content_type, 'size': size}
+        if self.predefined_acl:
+            upload_args['predefined_acl'] = self.predefined_acl
+
+        with metrics.stage('upload', UPLOAD_LATENCY):
+            for attempt in range(1, self.attempts + 1):
+                try:
+                    # BytesIO over immutable bytes shares the buffer instead of copying it
+                    blob.upload_from_file(io.BytesIO(data), **upload_args)
+                    break
+                except RETRYABLE_ERRORS as e:
+                    if attempt == self.attempts:
+                        self._count('failures')
+                        raise
+                    delay = self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                    print(f"Upload of '{blob_name}' failed ({e}), retrying in {delay:.2f}s...")
+                    self._count('retries')
+                    time.sleep(delay)
+                except Exception:
+                    self._count('failures')
+                    raise
+
+        self._count('uploads')
+        self._count('bytes', size)
+        return blob.public_url
+
+    def upload_async(self, bucket, data, blob_name, content_type='image/png', metadata=None):
+        """
+        Starts the upload on the background pool.
+        Returns (public_url, future); the future resolves to the same URL
+        once the object is stored, or raises the final upload error.
+        """
+        public_url = bucket.blob(blob_name).public_url
+        future = self._get_executor().submit(
+            self.upload, bucket, data, blob_name, content_type, metadata
+        )
+        return public_url, future
+
+    def get_stats(self):
+        """Returns upload, retry, failure and byte counters."""
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,145 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
+# User image listing cache settings (overridable via env)
+USER_IMAGES_CACHE_MAX_USERS = int(os.environ.get('USER_IMAGES_CACHE_MAX_USERS', '1024'))
+USER_IMAGES_CACHE_MAX_PAGES = int(os.environ.get('USER_IMAGES_CACHE_MAX_PAGES', '16'))  # Per user
+USER_IMAGES_CACHE_TTL = float(os.environ.get('USER_IMAGES_CACHE_TTL', '300'))
+# Used instead when STORAGE_EVENTS_TOKEN is unset: uploads made outside this
+# process are then never reported, so listings may only be this stale
+USER_IMAGES_CACHE_FALLBACK_TTL = float(os.environ.get('USER_IMAGES_CACHE_FALLBACK_TTL', '30'))
+
+USER_IMAGE_PATH = re.compile(r'^user_images/([^/]+)/.')
+
+
+def user_uid_from_path(object_name):
+    """Returns the user UID of an object stored under user_images/<uid>/, or None."""
+    match = USER_IMAGE_PATH.match(object_name or '')
+    return match.group(1) if match else None
+
+
+class UserImagesCache:
+    """
+    Per-user cache of image listing pages.
+
+    Listing a folder costs one or more GCS list calls, and a user's images
+    only change when a new one is uploaded under user_images/<uid>/. Pages
+    are cached per user, keyed by (page_token, page size), until the TTL runs
+    out or invalidate(uid) is called for an upload into that folder. Users are
+    evicted least recently used first.
+    """
+
+    def __init__(self, max_users=USER_IMAGES_CACHE_MAX_USERS, max_pages=USER_IMAGES_CACHE_MAX_PAGES,
+                 ttl=USER_IMAGES_CACHE_TTL):
+        self.max_users = max_users
+        self.max_pages = max_pages
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._users = OrderedDict()  # uid -> OrderedDict(page key -> (expires_at, page))
+        self._generation = 0  # Bumped by every invalidation
+        self._invalidated_at = OrderedDict()  # uid -> generation of its last invalidation
+        self._invalidated_floor = 0  # Generation of invalidations forgotten by eviction
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'invalidations': 0,
+            'expirations': 0,
+        }
+
+    def generation(self):
+        """Returns a token to pass to put(); the put is dropped if its user is invalidated in between."""
+        with self._lock:
+            return self._generation
+
+    def get(self, uid, page_key):
+        """Returns the cached page for (uid, page_key), or None."""
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            pages = self._users.get(uid)
+            cached = pages.get(page_key) if pages is not None else None
+            if cached is None:
+                self._stats['misses'] += 1
+                return None
+            expires_at, page = cached
+            if time.time() >= expires_at:
+                del pages[page_key]
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._users.move_to_end(uid)
+            self._stats['hits'] += 1
+            return page
+
+    def put(self, uid, page_key, page, generation):
+        """Stores a page listed when generation() returned `generation`."""
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if self._invalidated_at.get(uid, self._invalidated_floor) > generation:
+                return  # An upload landed while this page was being listed
+            pages = self._users.get(uid)
+            if pages is None:
+                pages = self._users[uid] = OrderedDict()
+            pages[page_key] = (time.time() + self.ttl, page)
+            pages.move_to_end(page_key)
+            while len(pages) > self.max_pages:
+                pages.popitem(last=False)
+            self._users.move_to_end(uid)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def invalidate(self, uid):
+        """Drops every cached page for uid (called when an image is uploaded to its folder)."""
+        with self._lock:
+            self._users.pop(uid, None)
+            self._generation += 1
+            self._invalidated_at.pop(uid, None)
+            self._invalidated_at[uid] = self._generation
+            while len(self._invalidated_at) > self.max_users:
+                _, forgotten = self._invalidated_at.popitem(last=False)
+                self._invalidated_floor = forgotten
+            self._stats['invalidations'] += 1
+
+    def invalidate_path(self, object_name):
+        """Invalidates the owner of object_name if it is a user image; returns the uid or None."""
+        uid = user_uid_from_path(object_name)
+        if uid is not None:
+            self.invalidate(uid)
+        return uid
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+    def get_stats(self):
+        """Returns hit/miss/invalidation counters and the number of cached users."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['users'] = len(self._users)
+        return stats
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_cache():
+    """
+    Returns this process's listing cache, shared by db_fetch.py (which serves
+    the listings) and app.py (which invalidates them when it uploads into a
+    user folder). It is built on first use, after the apps have loaded .env;
+    without STORAGE_EVENTS_TOKEN its TTL is capped at
+    USER_IMAGES_CACHE_FALLBACK_TTL.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            ttl = USER_IMAGES_CACHE_TTL
+            if not os.environ.get('STORAGE_EVENTS_TOKEN'):
+                ttl = min(ttl, USER_IMAGES_CACHE_FALLBACK_TTL)
+            _shared = UserImagesCache(ttl=ttl)
+        return _shared